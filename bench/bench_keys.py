@@ -0,0 +1,167 @@
+"""
+Phase-level benchmarks for KeyDimension.process and KeyFact.process.
+
+Builds synthetic dimensions and facts in a local SQLite database and runs every scenario in a fresh process.
+It reports the peak RSS and the InMemoryCollector time per phase as JSON; a fact's dimension joins are timed in its merge.
+
+Usage (from the repository root):
+    python -m bench.bench_keys --dim-rows 10000 100000 --batch-rows 10000 --fact-dims 8
+    python -m bench.bench_keys --dim-rows 50000000 --lookup-mode pushdown --out bench_output.json
+"""
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import tempfile
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from time import perf_counter
+
+import polars as pl
+from sqlalchemy import create_engine, text
+
+from keys import InMemoryCollector, KeyDimension, KeyFact, write_rows
+from keys.lookup_planner import LOOKUP_MODES
+
+DEFAULT_NEW_FRACTION = 0.1
+SEED_CHUNK_ROWS = 1_000_000
+
+
+@dataclass
+class BenchResult:
+    scenario: str
+    dim_rows: int
+    batch_rows: int
+    fact_dims: int
+    lookup_mode: str
+    phases: dict[str, float] = field(default_factory=dict)
+    total_seconds: float = 0.0
+    peak_rss_mb: float = 0.0
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _dim_name(i: int) -> str:
+    return f"dim_{i}"
+
+
+def seed_dimension(conn, name: str, rows: int) -> None:
+    """Create a dimension with BKs bk_<name>_0 .. bk_<name>_<rows-1> and keys 1 .. rows."""
+    conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    conn.execute(text(f"CREATE TABLE {name} (bk_{name} TEXT, key_{name} INTEGER, val_col TEXT)"))
+    for start in range(0, rows, SEED_CHUNK_ROWS):
+        n = min(SEED_CHUNK_ROWS, rows - start)
+        df = pl.DataFrame({"i": pl.int_range(start, start + n, eager=True)}).select(
+            (pl.lit(f"{name}_") + pl.col("i").cast(pl.String)).alias(f"bk_{name}"),
+            (pl.col("i") + 1).alias(f"key_{name}"),
+            pl.lit("v").alias("val_col"),
+        )
+        write_rows(conn, name, df)
+    conn.commit()
+
+
+def incoming_bks(name: str, dim_rows: int, batch_rows: int, new_fraction: float) -> pl.Series:
+    """batch_rows distinct BKs, new_fraction of which do not exist in the dimension yet."""
+    n_new = int(batch_rows * new_fraction)
+    existing = pl.int_range(0, dim_rows, eager=True).sample(min(batch_rows - n_new, dim_rows), seed=42)
+    new = pl.int_range(dim_rows, dim_rows + n_new, eager=True)
+    return (pl.lit(f"{name}_") + pl.concat([existing, new]).cast(pl.String)).alias(f"bk_{name}")
+
+
+def run_dimension(db_url: str, dim_rows: int, batch_rows: int, lookup_mode: str, new_fraction: float) -> BenchResult:
+    result = BenchResult("dimension", dim_rows, batch_rows, 0, lookup_mode)
+    name = _dim_name(0)
+    df_incoming = pl.select(incoming_bks(name, dim_rows, batch_rows, new_fraction)).with_columns(pl.lit("v").alias("val_col"))
+    collector = InMemoryCollector()
+    engine = create_engine(db_url)
+
+    with engine.connect() as conn:
+        start = perf_counter()
+        dim = KeyDimension(name, conn, df_incoming, lookup_mode=lookup_mode, observers=[collector])
+        dim.process()
+        dim.write_to_db()
+        result.total_seconds = perf_counter() - start
+        conn.rollback()
+
+    result.phases = collector.seconds_by_phase()
+    result.peak_rss_mb = _peak_rss_mb()
+    return result
+
+
+def run_fact(db_url: str, dim_rows: int, batch_rows: int, fact_dims: int, lookup_mode: str, new_fraction: float) -> BenchResult:
+    result = BenchResult("fact", dim_rows, batch_rows, fact_dims, lookup_mode)
+    df_incoming = pl.DataFrame({"bk_fact": pl.int_range(0, batch_rows, eager=True).cast(pl.String), "amount": pl.int_range(0, batch_rows, eager=True)})
+    df_incoming = df_incoming.with_columns(
+        incoming_bks(_dim_name(i), dim_rows, batch_rows, new_fraction).shuffle(seed=i) for i in range(fact_dims)
+    )
+    collector = InMemoryCollector()
+    engine = create_engine(db_url)
+
+    with engine.connect() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS fact"))
+        conn.execute(text(f"CREATE TABLE fact (bk_fact TEXT, amount INTEGER, key_fact INTEGER, {', '.join(f'key_{_dim_name(i)} INTEGER' for i in range(fact_dims))})"))
+        start = perf_counter()
+        fact = KeyFact("fact", conn, df_incoming, lookup_mode=lookup_mode, observers=[collector])
+        fact.related_dimensions(*[_dim_name(i) for i in range(fact_dims)])
+        fact.process()
+        fact.write_to_db()
+        result.total_seconds = perf_counter() - start
+        conn.rollback()
+
+    result.phases = collector.seconds_by_phase()
+    result.peak_rss_mb = _peak_rss_mb()
+    return result
+
+
+def _run_isolated(func, *args) -> BenchResult:
+    """Run one scenario in a fresh process so peak RSS is per scenario."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim-rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Existing rows per dimension")
+    parser.add_argument("--batch-rows", type=int, nargs="+", default=[10_000], help="Incoming rows per run")
+    parser.add_argument("--fact-dims", type=int, default=8, help="Dimension references per fact row")
+    parser.add_argument("--new-fraction", type=float, default=DEFAULT_NEW_FRACTION, help="Share of incoming BKs not yet in the dimension")
+    parser.add_argument("--lookup-mode", choices=LOOKUP_MODES, default="full")
+    parser.add_argument("--db", help="SQLite file to use (default: a temporary file)")
+    parser.add_argument("--out", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_url = f"sqlite:///{args.db or Path(tmp_dir) / 'bench.db'}"
+        engine = create_engine(db_url)
+        results = []
+        for dim_rows in args.dim_rows:
+            with engine.connect() as conn:
+                for i in range(max(args.fact_dims, 1)):
+                    seed_dimension(conn, _dim_name(i), dim_rows)
+            for batch_rows in args.batch_rows:
+                results.append(_run_isolated(run_dimension, db_url, dim_rows, batch_rows, args.lookup_mode, args.new_fraction))
+                if args.fact_dims > 0:
+                    results.append(_run_isolated(run_fact, db_url, dim_rows, batch_rows, args.fact_dims, args.lookup_mode, args.new_fraction))
+        engine.dispose()
+
+    report = {
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "results": [asdict(r) for r in results],
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
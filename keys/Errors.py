@@ -12,3 +12,9 @@ class MissingDimensionKeyError(KeysError):
 
 class MergeError(KeysError):
     """Raised when a merge changes the row count unexpectedly."""
+
+class HashCollisionError(BusinessKeyError):
+    """Raised when different source values share a hashed business key."""
+
+class DuplicateBusinessKeyWarning(UserWarning):
+    """Warned instead of raising BusinessKeyError when duplicate BKs are accepted with on_duplicate="warn"."""
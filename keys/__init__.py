@@ -1,11 +1,46 @@
 from .key_manager import KeyManager
 from .key_dimension import KeyDimension
 from .key_fact import KeyFact
-from .utility import add_bk_for_table
+from .fact_batch import KeyFactBatch
+from .pipeline import KeyPipeline
+from .key_cache import KeyCache, SHARED_KEY_CACHE
+from .key_snapshot import KeySnapshotStore
+from .connection_pool import KeyConnectionPool, PoolStats
+from .bk_filter import BloomFilter, BloomFilterStore
+from .lookup_planner import LookupPlan, LookupPlanner, SHARED_LOOKUP_PLANNER
+from .key_allocator import KeyAllocator, ControlTableAllocator, SequenceAllocator
+from .observers import KeyEvent, KeyObserver, InMemoryCollector, LoggingObserver
+from .writer import WriteStats, update_rows, write_rows
+from .utility import add_bk_for_table, add_hashed_bk_for_table, hash_bk_values, row_hash_expr
 
 __all__ = [
     "KeyManager",
     "KeyDimension", 
     "KeyFact",
-    "add_bk_for_table"
+    "KeyFactBatch",
+    "KeyPipeline",
+    "KeyCache",
+    "SHARED_KEY_CACHE",
+    "KeySnapshotStore",
+    "KeyConnectionPool",
+    "PoolStats",
+    "BloomFilter",
+    "BloomFilterStore",
+    "LookupPlan",
+    "LookupPlanner",
+    "SHARED_LOOKUP_PLANNER",
+    "KeyAllocator",
+    "ControlTableAllocator",
+    "SequenceAllocator",
+    "KeyEvent",
+    "KeyObserver",
+    "InMemoryCollector",
+    "LoggingObserver",
+    "WriteStats",
+    "write_rows",
+    "update_rows",
+    "add_bk_for_table",
+    "add_hashed_bk_for_table",
+    "hash_bk_values",
+    "row_hash_expr",
 ]
\ No newline at end of file
@@ -0,0 +1,144 @@
+from __future__ import annotations
+import hashlib
+import json
+import math
+import os
+import uuid
+from pathlib import Path
+from typing import Optional, Union
+import polars as pl
+
+from .key_cache import CacheKey
+from .key_manager import BK_SEP
+from .Errors import KeysError
+
+DEFAULT_FP_RATE = 0.01
+MIN_CAPACITY = 1024
+BITS_SUFFIX = ".bloom.arrow"
+META_SUFFIX = ".bloom.json"
+
+
+def bk_hash_input(frame: pl.DataFrame, bk_cols: list[str]) -> pl.Series:
+    """BK values as one string per row, so db and incoming values of different dtypes hash alike."""
+    return frame.select(
+        pl.concat_str([pl.col(c).cast(pl.String).fill_null("") for c in bk_cols], separator=BK_SEP)
+    ).to_series()
+
+
+class BloomFilter:
+    """
+    Bloom filter over BK strings, kept as a bit-packed Boolean Series and probed with vectorized
+    gathers. might_contain() is False only for values that were never added.
+    Positions come from Polars' hash, which is only stable within one Polars version, so a persisted
+    filter remembers the version it was built with.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        fp_rate: float = DEFAULT_FP_RATE,
+        bits: Optional[pl.Series] = None,
+        count: int = 0,
+        max_pk: Optional[int] = None,
+    ):
+        self.capacity = max(capacity, MIN_CAPACITY)
+        self.fp_rate = fp_rate
+        self.num_bits = math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bits if bits is not None else pl.repeat(False, self.num_bits, dtype=pl.Boolean, eager=True).alias("bits")
+        if len(self.bits) != self.num_bits:
+            raise KeysError(f"Bloom filter has {len(self.bits)} bits, expected {self.num_bits}")
+        self.count = count
+        self.max_pk = max_pk
+        self.polars_version = pl.__version__
+
+    def _positions(self, values: pl.Series) -> list[pl.Series]:
+        """Double hashing: position i is (h1 + i * h2) mod num_bits, reduced first so UInt64 never overflows."""
+        h1 = values.hash(seed=0) % self.num_bits
+        h2 = values.hash(seed=1) % self.num_bits
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, values: pl.Series) -> None:
+        if len(values) == 0:
+            return
+        self.bits = self.bits.scatter(pl.concat(self._positions(values)), True)
+        self.count += len(values)
+
+    def might_contain(self, values: pl.Series) -> pl.Series:
+        """True where the value may have been added, False where it definitely was not."""
+        if len(values) == 0:
+            return pl.Series(values.name, [], dtype=pl.Boolean)
+        found = None
+        for positions in self._positions(values):
+            hit = self.bits.gather(positions)
+            found = hit if found is None else found & hit
+        return found.alias(values.name)
+
+    @property
+    def is_full(self) -> bool:
+        return self.count > self.capacity
+
+
+class BloomFilterStore:
+    """
+    Persists one BloomFilter per (table, bk_name, pk_name, key_condition) as an Arrow IPC bit column
+    plus a JSON sidecar with its parameters, the max PK it covers and the Polars version.
+    Usage:
+        dim = KeyDimension("dim_customer", conn, df_customer, bk_filter_store=BloomFilterStore("/var/cache/keys"))
+    """
+
+    def __init__(self, directory: Union[str, Path], fp_rate: float = DEFAULT_FP_RATE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fp_rate = fp_rate
+
+    def _stem(self, key: CacheKey) -> Path:
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+        return self.directory / f"{key[0]}_{digest}"
+
+    def load(self, key: CacheKey) -> Optional[BloomFilter]:
+        """The stored filter, or None if missing or built with another Polars version."""
+        stem = self._stem(key)
+        meta_path, bits_path = stem.with_name(stem.name + META_SUFFIX), stem.with_name(stem.name + BITS_SUFFIX)
+        if not meta_path.exists() or not bits_path.exists():
+            return None
+        try:
+            meta = json.loads(meta_path.read_text())
+            if meta["polars_version"] != pl.__version__:
+                return None
+            bits = pl.read_ipc(bits_path).to_series()
+            return BloomFilter(meta["capacity"], meta["fp_rate"], bits, meta["count"], meta["max_pk"])
+        except KeysError:
+            return None
+        except Exception as e:
+            raise KeysError(f"Failed reading BK filter {bits_path}: {e}") from e
+
+    def save(self, key: CacheKey, bloom: BloomFilter) -> None:
+        """Write bits then parameters, each swapped in atomically."""
+        stem = self._stem(key)
+        meta = {
+            "capacity": bloom.capacity,
+            "fp_rate": bloom.fp_rate,
+            "count": bloom.count,
+            "max_pk": bloom.max_pk,
+            "polars_version": bloom.polars_version,
+        }
+        try:
+            for suffix, write in (
+                (BITS_SUFFIX, lambda path: bloom.bits.to_frame().write_ipc(path, compression="uncompressed")),
+                (META_SUFFIX, lambda path: path.write_text(json.dumps(meta))),
+            ):
+                path = stem.with_name(stem.name + suffix)
+                tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+                write(tmp_path)
+                os.replace(tmp_path, path)
+        except Exception as e:
+            raise KeysError(f"Failed writing BK filter {stem}: {e}") from e
+
+    def invalidate(self, table_name: Optional[str] = None) -> None:
+        """Delete all filters (parameters and bits), or only those for one table."""
+        for meta_path in self.directory.glob(f"*{META_SUFFIX}"):
+            stem = meta_path.name[:-len(META_SUFFIX)]
+            if table_name is None or stem.rsplit("_", 1)[0] == table_name:
+                meta_path.with_name(stem + BITS_SUFFIX).unlink(missing_ok=True)
+                meta_path.unlink(missing_ok=True)
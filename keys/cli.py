@@ -0,0 +1,279 @@
+"""
+Key a directory of Parquet/CSV files and write keyed Parquet files, one per input file.
+
+Without --dimension the files are rows of a dimension: every row gets its existing key or a new one.
+With --dimension the files are fact rows: they get their own keys and every dimension's BK columns are
+replaced by its keys (DEFAULT_PK_VALUE where the BK is unknown).
+Key pairs come from the database (--db) or from key snapshots on disk (--snapshot-dir, see KeySnapshotStore);
+with both, the snapshots are refreshed from the database. Snapshots are kept per database, so without --db,
+--snapshot-db names the database they were taken from (only its URL is used, nothing is connected to). The pairs of every table are loaded once, written
+as uncompressed Arrow files and memory-mapped by each worker process, so they are shared instead of copied.
+All files are validated together, and new keys are numbered in file order from one offset, so the result
+is the same as keying the files as one frame. The offset is the current max key, which nothing reserves, or
+with --key-allocator a block leased for all new rows (see KeyAllocator), so concurrent loaders cannot hand
+out the same keys. Apart from that lease nothing is written to the database. Without --db, where nothing
+can be reserved, files with rows needing new keys are rejected.
+
+Usage:
+    keys drop/2024-06-01 keyed/2024-06-01 --table fact_sales --db postgresql://dwh \\
+        --dimension dim_customer --dimension dim_date:sale_date:key_date --workers 8 --key-allocator control-table
+    keys drop/customers keyed/customers --table dim_customer --bk customer_no \\
+        --snapshot-dir /var/cache/keys --snapshot-db postgresql://dwh
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from itertools import accumulate
+from multiprocessing import get_context
+from pathlib import Path
+from time import perf_counter
+from typing import Iterator, Optional
+import polars as pl
+from sqlalchemy import create_engine
+
+from .key_manager import KeyManager, BkName, Connectable, masked_url
+from .key_allocator import ControlTableAllocator, KeyAllocator, SequenceAllocator
+from .key_dimension import KeyDimension
+from .key_fact import KeyFact
+from .key_snapshot import KeySnapshotStore
+from .Errors import KeysError
+
+DEFAULT_PATTERN = "*.parquet"
+CSV_SUFFIX = ".csv"
+
+PlanPairs = dict[Optional[str], pl.DataFrame]
+KEY_ALLOCATORS: dict[str, type[KeyAllocator]] = {"control-table": ControlTableAllocator, "sequence": SequenceAllocator}
+
+
+@dataclass
+class TableSpec:
+    """The table being keyed; a table with dimensions is keyed as a fact, otherwise as a dimension."""
+    table_name: str
+    bk_name: Optional[BkName] = None
+    pk_name: Optional[str] = None
+    dimensions: list[tuple[str, Optional[BkName], Optional[str]]] = field(default_factory=list)
+
+    def manager(self, conn: Optional[Connectable], lf: pl.LazyFrame, **kwargs) -> KeyManager:
+        if not self.dimensions:
+            return KeyDimension(self.table_name, conn, lf, self.pk_name, self.bk_name, **kwargs)
+        fact = KeyFact(self.table_name, conn, lf, self.pk_name, self.bk_name, **kwargs)
+        for dim_name, bk_name, pk_name in self.dimensions:
+            fact.related_dimension(dim_name, bk_name, pk_name)
+        return fact
+
+
+@dataclass
+class FileStats:
+    input_path: str
+    output_path: str
+    rows: int
+    new_rows: int
+    seconds: float
+
+
+@dataclass
+class RunStats:
+    table_name: str
+    files: list[FileStats]
+    rows: int
+    new_rows: int
+    load_seconds: float
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+def parse_dimension(value: str) -> tuple[str, Optional[BkName], Optional[str]]:
+    """NAME[:BK[,BK...][:PK]] -> (dim_name, bk_name, pk_name); several BK columns form a composite BK."""
+    name, _, rest = value.partition(":")
+    bk, _, pk = rest.partition(":")
+    if not name:
+        raise argparse.ArgumentTypeError(f"Invalid dimension '{value}', expected NAME[:BK[,BK...][:PK]]")
+    bk_cols = [c for c in bk.split(",") if c]
+    bk_name = None if not bk_cols else bk_cols[0] if len(bk_cols) == 1 else bk_cols
+    return name, bk_name, pk or None
+
+
+def scan_file(path: str) -> pl.LazyFrame:
+    return pl.scan_csv(path) if path.lower().endswith(CSV_SUFFIX) else pl.scan_parquet(path)
+
+
+def _snapshot_pairs(store: KeySnapshotStore, manager: KeyManager, dim_table: str, pk_name: str, bk_name: BkName, snapshot_db: str) -> pl.DataFrame:
+    key = manager._lookup_key(dim_table, pk_name, bk_name, database_url=masked_url(snapshot_db))
+    snapshot = store.load(key, pk_name)
+    if snapshot is None:
+        raise KeysError(f"No key snapshot for {dim_table} ({bk_name} -> {pk_name}) in {store.directory}")
+    return snapshot[0]
+
+
+def load_plan_pairs(manager: KeyManager, store: Optional[KeySnapshotStore], snapshot_db: Optional[str] = None) -> PlanPairs:
+    """Pairs of the table (under None) and of every dimension, from the db, or from the snapshots of snapshot_db only."""
+    if snapshot_db is None:
+        return manager._load_plan_pairs()
+    plan_pairs = {None: _snapshot_pairs(store, manager, manager.table_name, manager.pk_name, manager.bk_name, snapshot_db)}
+    for dim_name, m in getattr(manager, "dim_mappings", {}).items():
+        plan_pairs[dim_name] = _snapshot_pairs(store, manager, m["dim_table"], m["key_name"], m["bk_name"], snapshot_db)
+    for name, df_pairs in plan_pairs.items():
+        manager._check_unique_pairs(df_pairs, manager.bk_name if name is None else manager.dim_mappings[name]["bk_name"], name or manager.table_name)
+    return plan_pairs
+
+
+_worker: dict = {}
+
+
+def _init_worker(spec: TableSpec, pair_paths: dict[Optional[str], str]) -> None:
+    """Runs once per worker process: memory-map the shared key pairs."""
+    _worker["spec"] = spec
+    _worker["pairs"] = {name: pl.read_ipc(path) for name, path in pair_paths.items()}
+
+
+def _file_manager(path: str) -> KeyManager:
+    # all files were validated together before the workers started
+    return _worker["spec"].manager(None, scan_file(path), defer_validation=True)
+
+
+def _count_new_rows(path: str) -> int:
+    manager = _file_manager(path)
+    return manager._new_key_count(manager.lf_incoming, _worker["pairs"])
+
+
+def _key_file(path: str, output_path: str, key_offset: int) -> tuple[int, float]:
+    start = perf_counter()
+    manager = _file_manager(path)
+    plan = manager._key_plan(manager.lf_incoming, _worker["pairs"])
+    plan.with_columns(manager._new_key_expr(key_offset)).sink_parquet(output_path, engine="streaming")
+    rows = pl.scan_parquet(output_path).select(pl.len()).collect().item()
+    return rows, perf_counter() - start
+
+
+@contextmanager
+def _polars_threads(workers: int) -> Iterator[None]:
+    """Split the cores between worker processes instead of every worker starting a thread per core."""
+    previous = os.environ.get("POLARS_MAX_THREADS")
+    os.environ["POLARS_MAX_THREADS"] = previous or str(max(1, (os.cpu_count() or 1) // workers))
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["POLARS_MAX_THREADS"]
+
+
+def key_files(
+    spec: TableSpec,
+    input_paths: list[Path],
+    output_dir: Path,
+    db_uri: Optional[str] = None,
+    snapshot_dir: Optional[Path] = None,
+    workers: int = 1,
+    snapshot_db: Optional[str] = None,
+    key_allocator: Optional[str] = None,
+) -> RunStats:
+    """
+    Key every input file into output_dir/<stem>.parquet on a pool of worker processes.
+    Without db_uri the pairs come from the snapshots in snapshot_dir taken from snapshot_db, and no new keys are assigned.
+    key_allocator names an entry of KEY_ALLOCATORS to lease the new keys from.
+    """
+    if not input_paths:
+        raise KeysError("No input files to key")
+    if db_uri is None and (snapshot_dir is None or snapshot_db is None):
+        raise KeysError("A key source is required: a database URI, or a snapshot directory and the database URI of its snapshots")
+    if key_allocator is not None and key_allocator not in KEY_ALLOCATORS:
+        raise KeysError(f"key_allocator must be one of {tuple(KEY_ALLOCATORS)}, got '{key_allocator}'")
+    if key_allocator is not None and db_uri is None:
+        raise KeysError("A key allocator requires a database URI")
+    start = perf_counter()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_paths = [str(output_dir / f"{path.stem}.parquet") for path in input_paths]
+    if len(set(output_paths)) != len(output_paths):
+        raise KeysError("Input files must have distinct names; their outputs would overwrite each other")
+
+    store = KeySnapshotStore(snapshot_dir) if snapshot_dir is not None else None
+    engine = create_engine(db_uri) if db_uri is not None else None
+    lf_all = pl.concat([scan_file(str(path)) for path in input_paths], how="vertical_relaxed")
+    try:
+        allocator = KEY_ALLOCATORS[key_allocator](engine) if key_allocator is not None else None
+        manager = spec.manager(engine, lf_all, snapshot_store=store, key_allocator=allocator)
+        plan_pairs = load_plan_pairs(manager, store, snapshot_db=None if engine is not None else snapshot_db)
+        load_seconds = perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as pairs_dir, _polars_threads(workers):
+            pair_paths = {}
+            for i, (name, df_pairs) in enumerate(plan_pairs.items()):
+                pair_paths[name] = str(Path(pairs_dir) / f"pairs_{i}.arrow")
+                df_pairs.write_ipc(pair_paths[name], compression="uncompressed")
+
+            with ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=_init_worker, initargs=(spec, pair_paths)) as pool:
+                new_counts = list(pool.map(_count_new_rows, map(str, input_paths)))
+                if engine is None and sum(new_counts) > 0:
+                    raise KeysError(f"{sum(new_counts)} rows need new keys, which cannot be reserved from snapshots; key them with a database URI")
+                key_offset = manager._reserve_keys(sum(new_counts)) if engine is not None else 0
+                offsets = [key_offset + done for done in accumulate(new_counts, initial=0)]
+                results = list(pool.map(_key_file, map(str, input_paths), output_paths, offsets))
+    finally:
+        if engine is not None:
+            engine.dispose()
+
+    files = [
+        FileStats(str(path), output_path, rows, new_rows, seconds)
+        for path, output_path, new_rows, (rows, seconds) in zip(input_paths, output_paths, new_counts, results)
+    ]
+    return RunStats(
+        table_name=spec.table_name,
+        files=files,
+        rows=sum(f.rows for f in files),
+        new_rows=sum(new_counts),
+        load_seconds=load_seconds,
+        seconds=perf_counter() - start,
+    )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="keys", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir", type=Path, help="Directory with the input files")
+    parser.add_argument("output_dir", type=Path, help="Directory for the keyed Parquet files")
+    parser.add_argument("--table", required=True, help="Table the files belong to")
+    parser.add_argument("--bk", nargs="+", help="BK column(s) of the table (default: bk_<table>)")
+    parser.add_argument("--pk", help="PK column of the table (default: key_<table>)")
+    parser.add_argument("--dimension", action="append", type=parse_dimension, default=[], metavar="NAME[:BK[,BK...][:PK]]",
+                        help="Dimension the fact rows refer to; repeat for every dimension")
+    parser.add_argument("--db", help="Database URI to load key pairs and the max key from")
+    parser.add_argument("--snapshot-dir", type=Path, help="Key snapshot directory; used alone when --db is not given")
+    parser.add_argument("--snapshot-db", help="Database URI the snapshots were taken from, to find them without --db")
+    parser.add_argument("--key-allocator", choices=tuple(KEY_ALLOCATORS),
+                        help="Lease the block of new keys from this allocator instead of numbering from the max key")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help=f"Glob for input files (default: {DEFAULT_PATTERN}); .csv files are read as CSV")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: CPU count)")
+    parser.add_argument("--stats-out", type=Path, help="Write JSON throughput statistics to this file instead of stdout")
+    args = parser.parse_args(argv)
+    if args.db is None and (args.snapshot_dir is None or args.snapshot_db is None):
+        parser.error("--db, or --snapshot-dir with --snapshot-db, is required")
+    if args.key_allocator is not None and args.db is None:
+        parser.error("--key-allocator requires --db")
+
+    bk_name = None if not args.bk else args.bk[0] if len(args.bk) == 1 else args.bk
+    spec = TableSpec(args.table, bk_name, args.pk, args.dimension)
+    input_paths = sorted(args.input_dir.glob(args.pattern))
+    try:
+        stats = key_files(spec, input_paths, args.output_dir, args.db, args.snapshot_dir, max(1, args.workers), args.snapshot_db, args.key_allocator)
+    except KeysError as e:
+        print(f"keys: {e}", file=sys.stderr)
+        return 1
+
+    output = json.dumps({**asdict(stats), "rows_per_second": stats.rows_per_second}, indent=2)
+    if args.stats_out:
+        args.stats_out.write_text(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,170 @@
+from __future__ import annotations
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+from typing import Any, Iterator, Optional, Union
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.elements import TextClause
+
+from .Errors import DatabaseError
+
+DEFAULT_POOL_TIMEOUT_S = 30.0
+STATEMENT_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def cached_statement(query: str, expanding: tuple[str, ...] = ()) -> TextClause:
+    """
+    One shared text() construct per query string, so repeated key pair and max key queries skip
+    bind parameter parsing and always hit SQLAlchemy's compiled cache (and the driver's prepared
+    statements where it keeps them per connection).
+    """
+    stmt = text(query)
+    if expanding:
+        stmt = stmt.bindparams(*(bindparam(name, expanding=True) for name in expanding))
+    return stmt
+
+
+@dataclass
+class PoolStats:
+    """Checkout counters of a KeyConnectionPool since it was created or reset."""
+    checkouts: int
+    wait_seconds: float
+    max_wait_seconds: float
+    busy_seconds: float
+    in_use: int
+    peak_in_use: int
+    capacity: Optional[int]
+    elapsed_seconds: float
+
+    @property
+    def mean_wait_seconds(self) -> float:
+        return self.wait_seconds / self.checkouts if self.checkouts > 0 else 0.0
+
+    @property
+    def utilization(self) -> Optional[float]:
+        """Time-weighted share of capacity that was checked out; None if the pool is unbounded."""
+        if not self.capacity or self.elapsed_seconds <= 0:
+            return None
+        return self.busy_seconds / (self.capacity * self.elapsed_seconds)
+
+
+class KeyConnectionPool:
+    """
+    Hands out a connection per query from an Engine's pool, with an optional limit on concurrent
+    checkouts and stats on checkout wait and pool utilization for sizing pools.
+    KeyManager, KeyDimension and KeyFact accept a KeyConnectionPool (or an Engine, which uses the shared
+    pool for that engine) instead of a Connection; managers sharing a pool share its connections and stats.
+    Given a URL, the engine is created with engine_kwargs, e.g. pool_size, max_overflow and pool_timeout.
+    Usage:
+        pool = KeyConnectionPool("postgresql+psycopg://dwh", pool_size=8, max_overflow=0)
+        dim = KeyDimension("dim_customer", pool, df_customer)
+        fact = KeyFact("fact_sales", pool, df_sales).related_dimensions("dim_customer")
+        print(pool.stats())
+    """
+
+    def __init__(
+        self,
+        engine: Union[Engine, str],
+        max_connections: Optional[int] = None,
+        timeout: float = DEFAULT_POOL_TIMEOUT_S,
+        **engine_kwargs: Any,
+    ):
+        self.engine = create_engine(engine, **engine_kwargs) if isinstance(engine, str) else engine
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._slots = BoundedSemaphore(max_connections) if max_connections else None
+        self._lock = Lock()
+        self.reset_stats()
+
+    @property
+    def capacity(self) -> Optional[int]:
+        """Concurrent checkouts possible: max_connections, else the engine pool's size plus overflow."""
+        if self.max_connections:
+            return self.max_connections
+        pool = self.engine.pool
+        if isinstance(pool, QueuePool) and pool._max_overflow >= 0:
+            return pool.size() + pool._max_overflow
+        return None
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._started = monotonic()
+            self._checkouts = 0
+            self._wait = 0.0
+            self._max_wait = 0.0
+            self._busy = 0.0
+            self._busy_since = self._started
+            self._in_use = 0
+            self._peak_in_use = 0
+
+    def _track_in_use(self, delta: int) -> None:
+        """Accumulate connection-seconds before the number of checked out connections changes."""
+        now = monotonic()
+        self._busy += self._in_use * (now - self._busy_since)
+        self._busy_since = now
+        self._in_use += delta
+
+    @contextmanager
+    def connect(self) -> Iterator[Connection]:
+        """Check out a connection for one query (or one transaction) and return it to the pool afterwards."""
+        start = monotonic()
+        if self._slots is not None and not self._slots.acquire(timeout=self.timeout):
+            raise DatabaseError(f"No connection available within {self.timeout}s (max_connections={self.max_connections})")
+        try:
+            try:
+                conn = self.engine.connect()
+            except PoolTimeoutError as e:
+                raise DatabaseError(f"Connection pool exhausted: {e}") from e
+            waited = monotonic() - start
+            with self._lock:
+                self._checkouts += 1
+                self._wait += waited
+                self._max_wait = max(self._max_wait, waited)
+                self._track_in_use(1)
+                self._peak_in_use = max(self._peak_in_use, self._in_use)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                with self._lock:
+                    self._track_in_use(-1)
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def stats(self) -> PoolStats:
+        with self._lock:
+            self._track_in_use(0)
+            return PoolStats(
+                checkouts=self._checkouts,
+                wait_seconds=self._wait,
+                max_wait_seconds=self._max_wait,
+                busy_seconds=self._busy,
+                in_use=self._in_use,
+                peak_in_use=self._peak_in_use,
+                capacity=self.capacity,
+                elapsed_seconds=monotonic() - self._started,
+            )
+
+
+_ENGINE_POOLS: weakref.WeakKeyDictionary[Engine, KeyConnectionPool] = weakref.WeakKeyDictionary()
+_ENGINE_POOLS_LOCK = Lock()
+
+
+def pool_for(engine: Engine) -> KeyConnectionPool:
+    """
+    The KeyConnectionPool shared by all managers given the same Engine; dropped with the engine.
+    The pool only holds a weak proxy to the engine, so whoever passed the engine must keep it.
+    """
+    with _ENGINE_POOLS_LOCK:
+        pool = _ENGINE_POOLS.get(engine)
+        if pool is None:
+            pool = _ENGINE_POOLS[engine] = KeyConnectionPool(weakref.proxy(engine))
+        return pool
@@ -0,0 +1,165 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import polars as pl
+from sqlalchemy.engine import Connection, Engine
+
+from .key_fact import KeyFact, ConnectionFactory
+from .key_manager import Connectable, bk_columns
+from .connection_pool import KeyConnectionPool, pool_for
+from .Errors import KeysError
+
+LookupKey = tuple[str, str, str, Optional[str], tuple]
+
+
+def _lookup_settings(fact: KeyFact) -> tuple:
+    """The fact settings that decide how a lookup is loaded; only facts agreeing on all of them share a lookup."""
+    return (
+        fact.lookup_mode, id(fact.lookup_planner), id(fact.key_cache), id(fact.snapshot_store),
+        fact.read_uri, fact.read_engine, fact.read_partitions,
+    )
+
+
+class KeyFactBatch:
+    """
+    Keys many facts that share dimensions, loading each distinct dimension lookup only once.
+    A lookup is identified by (dim_table, bk columns, pk_name, key_condition) and the loading settings of
+    the facts using it (lookup_mode, lookup_planner, key_cache, snapshot_store and the read_* options), so
+    facts configured differently load their own pairs. The pairs are handed to every fact using the lookup
+    through KeyFact.provide_dimension_keys. In pushdown mode the lookup sends the union of the BKs of all those facts.
+    Usage:
+        batch = KeyFactBatch(conn)
+        batch.add("fact_sales", df_sales, "dim_date", "dim_customer")
+        batch.add("fact_returns", df_returns, "dim_date", "dim_customer", "dim_product")
+        results = batch.process()
+    Dimension members to infer (related_dimension with infer_missing) are inserted once per lookup for the
+    union of the facts' missing BKs, before any fact is keyed; the first inferring fact's inferred_values apply.
+    Pass connection_factory (an Engine or a callable returning a new Connection) with max_workers > 1
+    to load the dimensions and process the facts concurrently, each on its own connection.
+    With an Engine or KeyConnectionPool as conn, those connections are checked out from its pool.
+    """
+
+    def __init__(
+        self,
+        conn: Connectable,
+        connection_factory: Optional[ConnectionFactory] = None,
+        max_workers: int = 1,
+    ):
+        if connection_factory is None and isinstance(conn, (Engine, KeyConnectionPool)):
+            connection_factory = (pool_for(conn) if isinstance(conn, Engine) else conn).connect
+        if max_workers > 1 and connection_factory is None:
+            raise KeysError("Concurrent fact processing requires a connection_factory (an Engine or a callable returning a Connection).")
+        self.conn = conn
+        self.connection_factory = connection_factory
+        self.max_workers = max_workers
+        self.facts: dict[str, KeyFact] = {}
+        self.results: dict[str, pl.DataFrame] = {}
+        self.lookups: dict[LookupKey, list[tuple[KeyFact, str]]] = {}
+        self.lookup_pairs: dict[LookupKey, pl.DataFrame] = {}
+        self.inferred_members: dict[str, pl.DataFrame] = {}
+
+    def add(self, table_name: str, df_incoming: pl.DataFrame, *related_dimensions: str, **fact_kwargs) -> KeyFact:
+        """Create a KeyFact on the batch connection, related to the given dimensions with default BK/PK names."""
+        fact = KeyFact(table_name, self.conn, df_incoming, **fact_kwargs)
+        fact.related_dimensions(*related_dimensions)
+        return self.add_fact(fact)
+
+    def add_fact(self, fact: KeyFact) -> KeyFact:
+        """Add an already configured KeyFact, e.g. one with custom related_dimension BK/PK names."""
+        if fact.table_name in self.facts:
+            raise KeysError(f"Fact '{fact.table_name}' is already part of the batch.")
+        self.facts[fact.table_name] = fact
+        return fact
+
+    def dimension_lookups(self) -> dict[LookupKey, list[tuple[KeyFact, str]]]:
+        """Distinct dimension lookups and the (fact, dim_name) mappings that use each of them."""
+        lookups: dict[LookupKey, list[tuple[KeyFact, str]]] = {}
+        for fact in self.facts.values():
+            for dim_name, m in fact.dim_mappings.items():
+                key = (m["dim_table"], ", ".join(bk_columns(m["bk_name"])), m["key_name"], fact.key_condition, _lookup_settings(fact))
+                lookups.setdefault(key, []).append((fact, dim_name))
+        return lookups
+
+    def _connect(self):
+        return self.connection_factory.connect() if isinstance(self.connection_factory, Engine) else self.connection_factory()
+
+    def _load_lookup(self, users: list[tuple[KeyFact, str]], conn: Optional[Connection] = None) -> pl.DataFrame:
+        loader, dim_name = users[0]
+        m = loader.dim_mappings[dim_name]
+        bk_values = None
+        if loader._uses_pushdown(m["dim_table"], m["key_name"], m["bk_name"]):
+            bk_values = pl.concat(
+                [fact._incoming_bk_values(fact.dim_mappings[name]["bk_name"]) for fact, name in users],
+                how="vertical_relaxed",
+            ).unique()
+        return loader._load_existing_keys(
+            dim_table=m["dim_table"], pk_name=m["key_name"], bk_name=m["bk_name"], bk_values=bk_values, conn=conn,
+        )
+
+    def _load_lookup_on_new_connection(self, users: list[tuple[KeyFact, str]]) -> pl.DataFrame:
+        with self._connect() as conn:
+            return self._load_lookup(users, conn)
+
+    def _infer_lookup_members(self, key: LookupKey, users: list[tuple[KeyFact, str]], conn: Optional[Connection] = None) -> None:
+        """Insert the BKs missing from a loaded lookup for all its inferring facts at once and add them to its pairs."""
+        inferring = [(fact, dim_name) for fact, dim_name in users if fact.dim_mappings[dim_name]["infer_missing"]]
+        if not inferring:
+            return
+        loader, dim_name = inferring[0]
+        m = loader.dim_mappings[dim_name]
+        bk_cols = bk_columns(m["bk_name"])
+        df_bks = pl.concat(
+            [fact._incoming_bk_values(fact.dim_mappings[name]["bk_name"]) for fact, name in inferring],
+            how="vertical_relaxed",
+        ).drop_nulls().unique(maintain_order=True)
+        df_pairs = loader._align_pair_dtypes(self.lookup_pairs[key], m["bk_name"], df_bks.schema)
+        df_missing = df_bks.join(df_pairs, on=bk_cols, how="anti", maintain_order="left")
+        if len(df_missing) == 0:
+            return
+        df_found, df_inferred = loader._insert_inferred_members(m, df_missing, conn)
+        self.lookup_pairs[key] = pl.concat([df_pairs, df_found, df_inferred.select(*bk_cols, m["key_name"])], how="vertical_relaxed")
+        if len(df_inferred) > 0:
+            self.inferred_members[m["dim_table"]] = df_inferred
+
+    def _infer_all_lookup_members(self) -> None:
+        """Inference runs one lookup at a time, committed on its own connection when there is a connection_factory."""
+        for key, users in self.lookups.items():
+            if self.connection_factory is None:
+                self._infer_lookup_members(key, users)
+                continue
+            with self._connect() as conn, conn.begin():
+                self._infer_lookup_members(key, users, conn)
+
+    def load_dimensions(self) -> None:
+        """Load every distinct dimension lookup once, infer missing members once, and provide the pairs to all facts using it."""
+        self.lookups = self.dimension_lookups()
+        if self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {key: pool.submit(self._load_lookup_on_new_connection, users) for key, users in self.lookups.items()}
+                self.lookup_pairs = {key: future.result() for key, future in futures.items()}
+        else:
+            self.lookup_pairs = {key: self._load_lookup(users) for key, users in self.lookups.items()}
+        self._infer_all_lookup_members()
+
+        for key, users in self.lookups.items():
+            for fact, dim_name in users:
+                fact.provide_dimension_keys(dim_name, self.lookup_pairs[key])
+
+    def _process_fact_on_new_connection(self, fact: KeyFact) -> pl.DataFrame:
+        with self._connect() as conn, conn.begin():
+            batch_conn, fact.conn = fact.conn, conn
+            try:
+                return fact.process()
+            finally:
+                fact.conn = batch_conn
+
+    def process(self) -> dict[str, pl.DataFrame]:
+        """Load shared dimensions once, then key every fact; returns the keyed frames by fact table."""
+        self.load_dimensions()
+        if self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {name: pool.submit(self._process_fact_on_new_connection, fact) for name, fact in self.facts.items()}
+                self.results = {name: future.result() for name, future in futures.items()}
+        else:
+            self.results = {name: fact.process() for name, fact in self.facts.items()}
+        return self.results
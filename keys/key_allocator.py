@@ -0,0 +1,112 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from .Errors import DatabaseError
+
+DEFAULT_CONTROL_TABLE = "key_ranges"
+MAX_SEED_ATTEMPTS = 3
+
+
+class KeyAllocator(ABC):
+    """
+    Hands out blocks of surrogate keys for a table.
+    reserve() returns the key just before the block, so the reserved keys are offset + 1 .. offset + count.
+    This matches initial_max_pk, which _assign_new_keys numbers new rows from.
+    """
+
+    @abstractmethod
+    def reserve(self, table_name: str, pk_name: str, count: int) -> int:
+        """Atomically reserve count keys for table_name.pk_name and return the offset of the block."""
+
+
+class ControlTableAllocator(KeyAllocator):
+    """
+    Leases key ranges from a control table with one row per (table_name, pk_name) holding the last leased key.
+    Each reservation runs in its own short transaction on the engine, so parallel loaders only
+    serialize on the control row, not on the whole load.
+    The first reservation for a table seeds the row from MAX(pk) of the table itself.
+    Usage:
+        allocator = ControlTableAllocator(engine)
+        dim = KeyDimension("dim_sales", conn, df_dim, key_allocator=allocator)
+    """
+
+    def __init__(self, engine: Engine, control_table: str = DEFAULT_CONTROL_TABLE):
+        self.engine = engine
+        self.control_table = control_table
+        self._control_table_created = False
+
+    def _create_control_table(self) -> None:
+        if self._control_table_created:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {self.control_table} ("
+                "table_name VARCHAR(255) NOT NULL, "
+                "pk_name VARCHAR(255) NOT NULL, "
+                "last_key BIGINT NOT NULL, "
+                "PRIMARY KEY (table_name, pk_name))"
+            ))
+        self._control_table_created = True
+
+    def reserve(self, table_name: str, pk_name: str, count: int) -> int:
+        self._create_control_table()
+        params = {"table_name": table_name, "pk_name": pk_name, "count": count}
+
+        for _ in range(MAX_SEED_ATTEMPTS):
+            try:
+                with self.engine.begin() as conn:
+                    updated = conn.execute(text(
+                        f"UPDATE {self.control_table} SET last_key = last_key + :count "
+                        "WHERE table_name = :table_name AND pk_name = :pk_name"
+                    ), params)
+                    if updated.rowcount == 0:
+                        max_key = conn.execute(text(f"SELECT COALESCE(MAX({pk_name}), 0) FROM {table_name}")).scalar_one()
+                        conn.execute(text(
+                            f"INSERT INTO {self.control_table} (table_name, pk_name, last_key) "
+                            "VALUES (:table_name, :pk_name, :last_key)"
+                        ), {**params, "last_key": int(max_key) + count})
+                    last_key = conn.execute(text(
+                        f"SELECT last_key FROM {self.control_table} "
+                        "WHERE table_name = :table_name AND pk_name = :pk_name"
+                    ), params).scalar_one()
+                return int(last_key) - count
+            except IntegrityError:
+                # Another loader seeded the control row first; retry as an update.
+                continue
+            except Exception as e:
+                raise DatabaseError(f"Failed reserving {count} keys for {table_name}.{pk_name} in {self.control_table}: {e}") from e
+
+        raise DatabaseError(f"Failed reserving {count} keys for {table_name}.{pk_name}: control row could not be seeded")
+
+
+class SequenceAllocator(KeyAllocator):
+    """
+    Leases key ranges from a native PostgreSQL sequence (created from MAX(pk) if missing).
+    A transaction-scoped advisory lock keeps each block contiguous; every loader of the table
+    must reserve through this allocator rather than calling nextval() directly.
+    """
+
+    def __init__(self, engine: Engine, sequence_name: Optional[str] = None):
+        if engine.dialect.name != "postgresql":
+            raise DatabaseError(f"SequenceAllocator requires postgresql, got dialect '{engine.dialect.name}'. Use ControlTableAllocator.")
+        self.engine = engine
+        self.sequence_name = sequence_name
+
+    def reserve(self, table_name: str, pk_name: str, count: int) -> int:
+        sequence_name = self.sequence_name or f"seq_{table_name}_{pk_name}"
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:seq))"), {"seq": sequence_name})
+                if conn.execute(text("SELECT to_regclass(:seq)"), {"seq": sequence_name}).scalar_one() is None:
+                    max_key = conn.execute(text(f"SELECT COALESCE(MAX({pk_name}), 0) FROM {table_name}")).scalar_one()
+                    conn.execute(text(f"CREATE SEQUENCE {sequence_name} START WITH {int(max_key) + 1}"))
+                first_key = conn.execute(text("SELECT nextval(:seq)"), {"seq": sequence_name}).scalar_one()
+                if count > 1:
+                    conn.execute(text("SELECT setval(:seq, :last_key)"), {"seq": sequence_name, "last_key": first_key + count - 1})
+            return int(first_key) - 1
+        except Exception as e:
+            raise DatabaseError(f"Failed reserving {count} keys for {table_name}.{pk_name} from sequence {sequence_name}: {e}") from e
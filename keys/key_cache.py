@@ -0,0 +1,79 @@
+from __future__ import annotations
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+import polars as pl
+
+DEFAULT_CACHE_MAX_ROWS = 50_000_000
+
+CacheKey = tuple[str, str, str, Optional[str], Optional[str]]
+
+
+class KeyCache:
+    """
+    Shared BK -> PK pair cache, keyed by (table, bk_name, pk_name, key_condition, database URL).
+    Entries remember their max PK, so KeyManager only has to fetch rows with a higher PK
+    to bring an entry up to date (PKs are assigned monotonically by KeyDimension).
+    Evicts least recently used entries once the total cached rows exceed max_rows.
+    Usage:
+        cache = KeyCache(max_rows=10_000_000)
+        fact = KeyFact("fact_sales", conn, df_fact, key_cache=cache)
+    """
+
+    def __init__(self, max_rows: int = DEFAULT_CACHE_MAX_ROWS):
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[CacheKey, tuple[pl.DataFrame, int]] = OrderedDict()
+        self._rows = 0
+        self._lock = Lock()
+
+    def get(self, key: CacheKey) -> Optional[tuple[pl.DataFrame, int]]:
+        """Return (pairs, max_pk) for the key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: CacheKey, df_pairs: pl.DataFrame, pk_name: str) -> None:
+        """Store pairs for the key and evict old entries if the cache is over its row limit."""
+        max_pk = df_pairs[pk_name].max() if len(df_pairs) > 0 else 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._rows -= len(old[0])
+            if len(df_pairs) > self.max_rows:
+                return
+            self._entries[key] = (df_pairs, int(max_pk))
+            self._rows += len(df_pairs)
+            while self._rows > self.max_rows:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._rows -= len(evicted)
+
+    def invalidate(self, table_name: Optional[str] = None) -> None:
+        """Drop all entries, or only those for one table."""
+        with self._lock:
+            for key in [k for k in self._entries if table_name is None or k[0] == table_name]:
+                self._rows -= len(self._entries.pop(key)[0])
+
+    def __contains__(self, key: CacheKey) -> bool:
+        """Membership test that does not count as a hit or miss."""
+        with self._lock:
+            return key in self._entries
+
+    @property
+    def rows(self) -> int:
+        return self._rows
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self), "rows": self._rows}
+
+
+SHARED_KEY_CACHE = KeyCache()
@@ -1,9 +1,31 @@
 from __future__ import annotations
-from typing import Optional
+import asyncio
+from datetime import datetime
+from typing import Optional, Sequence
 import polars as pl
 from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
 
-from .key_manager import KeyManager
+from .key_manager import KeyManager, AsyncConnectable, BkName, Connectable, IncomingData, DEFAULT_READ_PARTITIONS, DUPLICATES_FAIL, LOOKUP_FULL, READ_CONNECTORX, STORED_SUFFIX, bk_columns
+from .key_cache import KeyCache
+from .key_allocator import KeyAllocator
+from .observers import PHASE_CHANGE_DETECTION, PHASE_PREFILTER, KeyObserver, observed
+from .key_snapshot import KeySnapshotStore
+from .lookup_planner import LookupPlanner
+from .bk_filter import BloomFilter, BloomFilterStore, bk_hash_input
+from .utility import row_hash_expr
+from .writer import DEFAULT_WRITE_CHUNK_SIZE, WRITE_AUTO, WriteStats, update_rows
+from .Errors import KeysError
+
+SCD_TYPES = (1, 2)
+DEFAULT_HASH_NAME = "row_hash"
+DEFAULT_VALID_FROM = "valid_from"
+DEFAULT_VALID_TO = "valid_to"
+CHANGE_NEW = "new"
+CHANGE_CHANGED = "changed"
+CHANGE_UNCHANGED = "unchanged"
+CHANGE_STATUS = "__keys_change_status"
+FILTER_MIN_PK = -(2 ** 63)
 
 
 class KeyDimension(KeyManager):
@@ -13,27 +35,238 @@ class KeyDimension(KeyManager):
     Usage:
         dim = KeyDimension("dim_sales", conn, df_dim)
         dim.write_to_db()
+    Async usage (AsyncConnection or AsyncEngine):
+        df_keyed = await KeyDimension("dim_sales", None, df_dim).process_async(async_engine)
+    Streaming usage (LazyFrame or iterator of batches):
+        dim = KeyDimension("dim_sales", conn, pl.scan_parquet("dim_sales/*.parquet"))
+        dim.sink_parquet("dim_sales_keyed.parquet")
+    Change detection (SCD) usage:
+        dim = KeyDimension("dim_customer", conn, df_customer, scd_type=2)
+        dim.process()
+        dim.write_to_db()
+    With scd_type, a hash over hash_columns (default: all non-key columns) is compared with the hash
+    stored in hash_name, and existing rows are classified as changed or unchanged in one pass.
+    Type 1 updates changed rows in place; type 2 closes the current row (valid_to_name is set) and
+    inserts a new version with a new key. Current rows are those where valid_to_name IS NULL.
+    Unchanged rows are not written.
+    With bk_filter_store, a persisted Bloom filter over the table's BKs (refreshed with rows added
+    since it was saved) splits incoming BKs into definitely new and maybe existing; only the latter
+    are looked up, as a pushdown query. The refresh reads rows with a PK above the filter's max PK,
+    so a row committed with a lower PK (several writers, including key_allocator blocks leased by one
+    writer and committed after another's) is only caught by a row count check, which rebuilds the
+    filter. Deleted rows offset that count, so call bk_filter_store.invalidate(table) after deleting rows.
     """
 
     def __init__(
         self,
         table_name: str,
-        conn: Connection,
-        df_incoming: pl.DataFrame,
+        conn: Optional[Connectable],
+        df_incoming: IncomingData,
         pk_name: Optional[str] = None,
-        bk_name: Optional[str] = None,
+        bk_name: Optional[BkName] = None,
+        lookup_mode: str = LOOKUP_FULL,
+        key_cache: Optional[KeyCache] = None,
+        key_allocator: Optional[KeyAllocator] = None,
+        bk_source_columns: Optional[list[str]] = None,
+        observers: Optional[Sequence[KeyObserver]] = None,
+        snapshot_store: Optional[KeySnapshotStore] = None,
+        on_duplicate: str = DUPLICATES_FAIL,
+        defer_validation: bool = False,
+        read_uri: Optional[str] = None,
+        read_engine: str = READ_CONNECTORX,
+        read_partitions: int = DEFAULT_READ_PARTITIONS,
+        lookup_planner: Optional[LookupPlanner] = None,
+        scd_type: Optional[int] = None,
+        hash_columns: Optional[list[str]] = None,
+        hash_name: str = DEFAULT_HASH_NAME,
+        valid_from_name: str = DEFAULT_VALID_FROM,
+        valid_to_name: str = DEFAULT_VALID_TO,
+        effective_at: Optional[datetime] = None,
+        bk_filter_store: Optional[BloomFilterStore] = None,
     ):
-        super().__init__(table_name, conn, df_incoming, pk_name, bk_name)
+        if scd_type is not None and scd_type not in SCD_TYPES:
+            raise ValueError(f"scd_type must be one of {SCD_TYPES}, got {scd_type}")
+        super().__init__(table_name, conn, df_incoming, pk_name, bk_name, lookup_mode=lookup_mode, key_cache=key_cache, key_allocator=key_allocator, bk_source_columns=bk_source_columns, observers=observers, snapshot_store=snapshot_store, on_duplicate=on_duplicate, defer_validation=defer_validation, read_uri=read_uri, read_engine=read_engine, read_partitions=read_partitions, lookup_planner=lookup_planner)
+        if scd_type is not None and self.streaming:
+            raise KeysError(f"Change detection (scd_type) for '{table_name}' requires DataFrame input, not streamed input.")
+        self.scd_type = scd_type
+        self.hash_name = hash_name
+        self.valid_from_name = valid_from_name
+        self.valid_to_name = valid_to_name
+        self.effective_at = effective_at or datetime.now()
+        excluded = {*bk_columns(self.bk_name), self.pk_name, hash_name, valid_from_name, valid_to_name}
+        self.hash_columns = hash_columns or ([] if self.streaming else [c for c in self.df_incoming.columns if c not in excluded])
+        if scd_type is not None and not self.hash_columns:
+            raise KeysError(f"Change detection for '{table_name}' needs at least one attribute column to hash.")
+        if scd_type == 2:
+            self.key_condition = f"{valid_to_name} IS NULL"
+        self.df_changed_rows: Optional[pl.DataFrame] = None
+        self.change_counts: dict[str, int] = {}
+        self.last_update_stats: Optional[WriteStats] = None
+        self.bk_filter_store = bk_filter_store
+        self.prefilter_counts: dict[str, int] = {}
+
+    def _refresh_bk_filter(self, conn: Optional[Connection] = None) -> BloomFilter:
+        """
+        Load the stored filter and add rows with a higher PK. It is built from all BKs if missing or full,
+        or if the table has more rows than the filter has seen (a row was committed below its max PK).
+        """
+        key = self._lookup_key(self.table_name, self.pk_name, self.bk_name)
+        bk_cols = bk_columns(self.bk_name)
+        bloom = self.bk_filter_store.load(key)
+        min_pk = FILTER_MIN_PK if bloom is None or bloom.max_pk is None else bloom.max_pk
+        df_pairs = self._load_keys_since(self.table_name, self.pk_name, self.bk_name, min_pk, conn)
+
+        if bloom is not None:
+            seen = bloom.count + len(df_pairs)
+            if seen > bloom.capacity or self._count_rows(self.table_name, conn) > seen:
+                if min_pk != FILTER_MIN_PK:
+                    df_pairs = self._load_keys_since(self.table_name, self.pk_name, self.bk_name, FILTER_MIN_PK, conn)
+                bloom = None
+            elif len(df_pairs) == 0:
+                return bloom
+        if bloom is None:
+            bloom = BloomFilter(2 * len(df_pairs), self.bk_filter_store.fp_rate)
+        bloom.add(bk_hash_input(df_pairs, bk_cols))
+        if len(df_pairs) > 0:
+            bloom.max_pk = max(int(df_pairs[self.pk_name].max()), bloom.max_pk or FILTER_MIN_PK)
+        self.bk_filter_store.save(key, bloom)
+        return bloom
+
+    def _load_maybe_existing_keys(self, conn: Optional[Connection] = None) -> pl.DataFrame:
+        """Key pairs for the incoming BKs the filter cannot rule out; definitely new BKs skip the lookup."""
+        with self._observe(PHASE_PREFILTER) as observation:
+            bloom = self._refresh_bk_filter(conn)
+            bk_cols = bk_columns(self.bk_name)
+            df_bks = self.df_incoming_modified.select(bk_cols).drop_nulls()
+            df_maybe = df_bks.filter(bloom.might_contain(bk_hash_input(df_bks, bk_cols)))
+            self.prefilter_counts = {"maybe_existing": len(df_maybe), "definitely_new": len(df_bks) - len(df_maybe)}
+            observation.record(rows=len(df_bks), **self.prefilter_counts)
+        return self._load_existing_keys(bk_values=df_maybe, conn=conn)
+
+    def _bk_select(self, dim_table: str, bk_name: BkName) -> str:
+        bk_select = super()._bk_select(dim_table, bk_name)
+        if self.scd_type is not None and dim_table == self.table_name and bk_name == self.bk_name:
+            bk_select += f", {self.hash_name}"
+        return bk_select
+
+    def _merge_keys(self, df_existing_pk_bk_pair: pl.DataFrame, bk_name: Optional[BkName] = None, pk_name: Optional[str] = None) -> "KeyDimension":
+        """Merge existing keys; with scd_type the stored hashes come along and the rows are classified."""
+        if self.scd_type is None:
+            return super()._merge_keys(df_existing_pk_bk_pair, bk_name, pk_name)
+
+        stored_hash = f"{self.hash_name}{STORED_SUFFIX}"
+        if self.hash_name in df_existing_pk_bk_pair.columns:
+            df_existing_pk_bk_pair = df_existing_pk_bk_pair.rename({self.hash_name: stored_hash})
+        else:
+            df_existing_pk_bk_pair = df_existing_pk_bk_pair.with_columns(pl.lit(None, dtype=pl.Int64).alias(stored_hash))
+        super()._merge_keys(df_existing_pk_bk_pair)
+        self._classify_changes()
+        return self
+
+    @observed(PHASE_CHANGE_DETECTION, measure=lambda self, _: self.df_changed_rows)
+    def _classify_changes(self) -> None:
+        """
+        Hash the attribute columns and compare with the stored hash in one pass: rows without a key are
+        new, rows whose hash differs are changed. For type 2, changed rows lose their key so they get a new one.
+        """
+        stored_hash = f"{self.hash_name}{STORED_SUFFIX}"
+        df = self.df_incoming_modified.with_columns(row_hash_expr(*self.hash_columns, hash_name=self.hash_name))
+        df = df.with_columns(
+            pl.when(pl.col(self.pk_name).is_null()).then(pl.lit(CHANGE_NEW))
+            .when(pl.col(self.hash_name).ne_missing(pl.col(stored_hash))).then(pl.lit(CHANGE_CHANGED))
+            .otherwise(pl.lit(CHANGE_UNCHANGED))
+            .alias(CHANGE_STATUS)
+        ).drop(stored_hash)
+
+        changed = pl.col(CHANGE_STATUS) == CHANGE_CHANGED
+        self.change_counts = {status: 0 for status in (CHANGE_NEW, CHANGE_CHANGED, CHANGE_UNCHANGED)}
+        self.change_counts.update(dict(df[CHANGE_STATUS].value_counts().iter_rows()))
+        self.df_changed_rows = df.filter(changed).drop(CHANGE_STATUS)
+        if self.scd_type == 2:
+            df = df.with_columns(pl.when(changed).then(None).otherwise(pl.col(self.pk_name)).alias(self.pk_name))
+        self.df_incoming_modified = df.drop(CHANGE_STATUS)
+
+    def _assign_new_keys(self) -> None:
+        super()._assign_new_keys()
+        if self.scd_type == 2:
+            self.df_new_rows = self.df_new_rows.with_columns(
+                pl.lit(self.effective_at).alias(self.valid_from_name),
+                pl.lit(None, dtype=pl.Datetime("us")).alias(self.valid_to_name),
+            )
+
+    def _apply_changes(self, chunk_size: int) -> WriteStats:
+        """Type 1: update changed attributes in place. Type 2: close the current version of changed rows."""
+        if self.scd_type == 1:
+            df_updates = self.df_changed_rows.select(self.pk_name, *self.hash_columns, self.hash_name)
+        else:
+            df_updates = self.df_changed_rows.select(self.pk_name, pl.lit(self.effective_at).alias(self.valid_to_name))
+        return update_rows(self.conn, self.table_name, df_updates, [self.pk_name], chunk_size)
+
+    def write_to_db(self, chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE, method: str = WRITE_AUTO) -> WriteStats:
+        """
+        Bulk insert new rows (and, for type 2, new versions of changed rows); with scd_type, changed rows
+        are applied first, in the same transaction. Returns the insert WriteStats; see last_update_stats for the updates.
+        """
+        if self.scd_type is None or self.df_new_rows is None:
+            return super().write_to_db(chunk_size, method)
+
+        with self._pinned_connection():
+            self.last_update_stats = self._apply_changes(chunk_size)
+            stats = super().write_to_db(chunk_size, method)
+        if len(self.df_changed_rows) > 0:
+            # cached pairs hold replaced hashes (type 1) or closed versions (type 2)
+            if self.key_cache is not None:
+                self.key_cache.invalidate(self.table_name)
+            if self.snapshot_store is not None:
+                self.snapshot_store.invalidate(self.table_name)
+        return stats
 
     def process(self) -> pl.DataFrame:
         """Process dimension data: load existing, merge, assign new keys."""
+        self._check_not_streaming()
         if self._processed:
             return self.df_incoming_modified
+        self._validate()
 
-        self.df_existing_pk_bk_pair = self._load_existing_keys()
+        if self.bk_filter_store is None:
+            self.df_existing_pk_bk_pair = self._load_existing_keys()
+        else:
+            self.df_existing_pk_bk_pair = self._load_maybe_existing_keys()
         self._merge_keys(self.df_existing_pk_bk_pair)
-        self.initial_max_pk = self._get_max_existing_key()
+        self.initial_max_pk = self._reserve_keys()
         self._assign_new_keys()
 
         self._processed = True
         return self.df_incoming_modified
+
+    async def process_async(self, async_conn: AsyncConnectable) -> pl.DataFrame:
+        """
+        process() on an AsyncConnection or AsyncEngine: queries await the async driver and the Polars
+        steps run in a worker thread, so one event loop can key many tables concurrently.
+        With an AsyncEngine the key pairs and the max key are fetched concurrently. With bk_filter_store the
+        filter refresh and the lookup of maybe existing BKs run on one connection, as in process().
+        """
+        self._check_not_streaming()
+        if self._processed:
+            return self.df_incoming_modified
+        await asyncio.to_thread(self._validate)
+
+        if self.bk_filter_store is not None:
+            self.df_existing_pk_bk_pair = await self._run_async(async_conn, self._load_maybe_existing_keys)
+            await asyncio.to_thread(self._merge_keys, self.df_existing_pk_bk_pair)
+            self.initial_max_pk = await self._reserve_keys_async(async_conn)
+        elif isinstance(async_conn, AsyncEngine) and self.key_allocator is None:
+            self.df_existing_pk_bk_pair, self.initial_max_pk = await asyncio.gather(
+                self._load_existing_keys_async(async_conn),
+                self._get_max_existing_key_async(async_conn),
+            )
+            await asyncio.to_thread(self._merge_keys, self.df_existing_pk_bk_pair)
+        else:
+            self.df_existing_pk_bk_pair = await self._load_existing_keys_async(async_conn)
+            await asyncio.to_thread(self._merge_keys, self.df_existing_pk_bk_pair)
+            self.initial_max_pk = await self._reserve_keys_async(async_conn)
+        await asyncio.to_thread(self._assign_new_keys)
+
+        self._processed = True
+        return self.df_incoming_modified
@@ -1,14 +1,39 @@
 from __future__ import annotations
-from typing import Optional, Self
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Self, Sequence, Union
 import polars as pl
-from sqlalchemy.engine import Connection
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
 
 from .key_manager import KeyManager
 from .key_manager import (
     DEFAULT_PK_VALUE,
+    DEFAULT_READ_PARTITIONS,
+    NEW_ROW,
+    DUPLICATES_FAIL,
+    LOOKUP_FULL,
+    READ_CONNECTORX,
+    LookupPlan,
+    AsyncConnectable,
+    BkName,
+    IncomingData,
+    Connectable,
+    bk_columns,
 )
+from .key_cache import KeyCache
+from .writer import write_rows
+from .key_snapshot import KeySnapshotStore
+from .lookup_planner import LookupPlanner
+from .key_allocator import KeyAllocator
+from .observers import PHASE_DIMENSION_MAPPING, PHASE_KEY_ASSIGNMENT, PHASE_MERGE, KeyObserver, observed
 from .Errors import KeysError, BusinessKeyError, MissingDimensionKeyError
 
+DEFAULT_MAX_WORKERS = 4
+INFERRED_SUFFIX = "_inferred"
+
+ConnectionFactory = Union[Engine, Callable[[], Connection]]
+
 
 class KeyFact(KeyManager):
     """
@@ -22,27 +47,67 @@ class KeyFact(KeyManager):
         )
         fact.import_dimension_keys()
         fact.write_to_db()
+    With partition_column, the fact's own pairs are only loaded for rows with partition_column between
+    the min and max of the incoming data (bound parameters, combined with key_condition), so the db can
+    prune partitions. The BK must then determine the partition value, e.g. a sale date part of the BK.
+    These bounded loads are not snapshotted, and process_batches loads them again for every batch.
+    Pass connection_factory (an Engine or a callable returning a new Connection) to load all
+    dimension mappings concurrently, each on its own connection, on up to max_workers threads.
+    With an Engine or KeyConnectionPool as conn they are loaded concurrently too, each query on a pooled connection.
+    process_async(async_engine) does the same on an event loop, one connection per query.
         """
 
     def __init__(
         self,
         table_name: str,
-        conn: Connection,
-        df_incoming: pl.DataFrame,
+        conn: Optional[Connectable],
+        df_incoming: IncomingData,
         pk_name: Optional[str] = None,
-        bk_name: Optional[str] = None,
+        bk_name: Optional[BkName] = None,
         key_condition: Optional[str] = None,
+        lookup_mode: str = LOOKUP_FULL,
+        key_cache: Optional[KeyCache] = None,
+        key_allocator: Optional[KeyAllocator] = None,
+        bk_source_columns: Optional[list[str]] = None,
+        observers: Optional[Sequence[KeyObserver]] = None,
+        snapshot_store: Optional[KeySnapshotStore] = None,
+        on_duplicate: str = DUPLICATES_FAIL,
+        defer_validation: bool = False,
+        read_uri: Optional[str] = None,
+        read_engine: str = READ_CONNECTORX,
+        read_partitions: int = DEFAULT_READ_PARTITIONS,
+        lookup_planner: Optional[LookupPlanner] = None,
+        connection_factory: Optional[ConnectionFactory] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        partition_column: Optional[str] = None,
     ):
-        super().__init__(table_name, conn, df_incoming, pk_name, bk_name, key_condition)
-        self.dim_mappings: dict[str, dict[str, str]] = {}
+        super().__init__(table_name, conn, df_incoming, pk_name, bk_name, key_condition, lookup_mode, key_cache, key_allocator, bk_source_columns, observers, snapshot_store, on_duplicate, defer_validation, read_uri, read_engine, read_partitions, lookup_planner)
+        self.dim_mappings: dict[str, dict[str, Any]] = {}
+        self.connection_factory = connection_factory
+        self.max_workers = max_workers
+        self.provided_dim_pairs: dict[str, pl.DataFrame] = {}
+        self.inferred_members: dict[str, pl.DataFrame] = {}
+        self.partition_column = partition_column
+        if partition_column is not None and self._incoming_batches is None:
+            columns = self.lf_incoming.collect_schema().names() if self.lf_incoming is not None else self.df_incoming.columns
+            if partition_column not in columns:
+                raise KeysError(f"Partition column '{partition_column}' not found in incoming data for '{table_name}'.")
 
     def related_dimension(
         self,
         dim_name: str,
-        bk_name: Optional[str] = None,
+        bk_name: Optional[BkName] = None,
         pk_name: Optional[str] = None,
+        infer_missing: bool = False,
+        inferred_values: Optional[dict[str, Any]] = None,
     ) -> "KeyFact":
-
+        """
+        Register a dimension whose BK column(s) are replaced by its PK.
+        With infer_missing, BKs missing from the dimension get placeholder (inferred) rows: new keys are
+        allocated for them (through key_allocator if set), the rows are bulk inserted into the dimension
+        with the constant inferred_values columns (e.g. {"is_inferred": True}), and the keys are used
+        right away. Without a key_allocator, concurrent loaders of the same dimension may race for keys.
+        """
         bk_name = bk_name or f"bk_{dim_name}"
         pk_name = pk_name or f"key_{dim_name}"
 
@@ -50,6 +115,8 @@ class KeyFact(KeyManager):
             "dim_table": dim_name,
             "bk_name": bk_name,
             "key_name": pk_name,
+            "infer_missing": infer_missing,
+            "inferred_values": dict(inferred_values or {}),
         }
         return self
 
@@ -58,55 +125,296 @@ class KeyFact(KeyManager):
             self.related_dimension(dim_name=dim_name)
         return self
 
-    def _import_dimension_keys(self, fail_on_missing: bool = False):
+    def provide_dimension_keys(self, dim_name: str, df_pairs: pl.DataFrame) -> "KeyFact":
+        """
+        Use already loaded BK/PK pairs for a registered dimension instead of reading them from the db.
+        The pairs must contain every BK of this fact that exists in the dimension.
+        """
+        if dim_name not in self.dim_mappings:
+            raise KeysError(f"Dimension '{dim_name}' is not related to fact '{self.table_name}'.")
+        self.provided_dim_pairs[dim_name] = df_pairs
+        return self
+
+    def _partition_bounds(self) -> Optional[tuple[Any, Any]]:
+        """Min and max of partition_column in the current batch or the incoming data; None if all null."""
+        frame = self._df_batch if self._df_batch is not None else (self.lf_incoming if self.lf_incoming is not None else self.df_incoming_modified)
+        df_bounds = frame.lazy().select(
+            pl.col(self.partition_column).min().alias("lo"), pl.col(self.partition_column).max().alias("hi"),
+        ).collect(engine="streaming")
+        lo, hi = df_bounds.row(0)
+        return None if lo is None else (lo, hi)
+
+    def _pair_predicates(self, dim_table: str) -> tuple[list[str], dict[str, Any]]:
+        """Bound min/max predicates on partition_column for the fact's own pairs, so the db can prune partitions."""
+        if self.partition_column is None or dim_table != self.table_name:
+            return [], {}
+        bounds = self._partition_bounds()
+        if bounds is None:
+            return [], {}
+        return (
+            [f"{self.partition_column} >= :partition_min", f"{self.partition_column} <= :partition_max"],
+            {"partition_min": bounds[0], "partition_max": bounds[1]},
+        )
+
+    def _batch_plan_pairs(self) -> bool:
+        return (
+            self.partition_column is not None
+            or super()._batch_plan_pairs()
+            or any(self._uses_pushdown(m["dim_table"], m["key_name"], m["bk_name"]) for m in self.dim_mappings.values())
+        )
+
+    def explain(self) -> list[LookupPlan]:
+        """Lookup plans for the fact's own pairs and every dimension mapping."""
+        return super().explain() + [
+            self._plan_lookup(m["dim_table"], m["key_name"], m["bk_name"], estimate=True)
+            for m in self.dim_mappings.values()
+        ]
+
+    def _load_dimension_pairs(self, m: dict[str, Any], conn: Optional[Connection] = None) -> pl.DataFrame:
+        return self._load_existing_keys(
+            dim_table=m["dim_table"],
+            pk_name=m["key_name"],
+            bk_name=m["bk_name"],
+            conn=conn,
+        )
+
+    def _load_dimension_pairs_on_new_connection(self, m: dict[str, Any]) -> pl.DataFrame:
+        connect = self.connection_factory.connect if isinstance(self.connection_factory, Engine) else self.connection_factory
+        with connect() as conn:
+            return self._load_dimension_pairs(m, conn)
+
+    def _check_dimension_bk_columns(self, columns: list[str]) -> None:
+        for m in self.dim_mappings.values():
+            if missing := [c for c in bk_columns(m["bk_name"]) if c not in columns]:
+                raise BusinessKeyError(f"Fact BK column '{', '.join(missing)}' missing in incoming dataframe.")
+
+    def _dimension_bk_columns(self) -> list[str]:
+        """All BK columns used by dimension mappings; they are replaced by the dimension keys."""
+        return list(dict.fromkeys(c for m in self.dim_mappings.values() for c in bk_columns(m["bk_name"])))
+
+    def _load_all_dimension_pairs(self) -> dict[str, pl.DataFrame]:
+        """
+        Key pairs for every dimension mapping: provided pairs are used as-is, the rest are loaded,
+        concurrently if a connection_factory or a pool is set.
+        """
+        to_load = {dim_name: m for dim_name, m in self.dim_mappings.items() if dim_name not in self.provided_dim_pairs}
+        if self.connection_factory is None and (self.pool is None or self.conn is not None):
+            loaded = {dim_name: self._load_dimension_pairs(m) for dim_name, m in to_load.items()}
+        else:
+            # without a factory each query checks out its own pooled connection
+            load = self._load_dimension_pairs if self.connection_factory is None else self._load_dimension_pairs_on_new_connection
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {
+                    dim_name: pool.submit(load, m)
+                    for dim_name, m in to_load.items()
+                }
+                loaded = {dim_name: future.result() for dim_name, future in futures.items()}
+
+        return {
+            dim_name: self.provided_dim_pairs[dim_name] if dim_name in self.provided_dim_pairs else loaded[dim_name]
+            for dim_name in self.dim_mappings
+        }
+
+    def _insert_inferred_members(self, m: dict[str, Any], df_missing: pl.DataFrame, conn: Optional[Connection] = None) -> tuple[pl.DataFrame, pl.DataFrame]:
+        """
+        Insert placeholder rows for the missing BKs of one mapping in one transaction. The BKs are selected again
+        first and only those still absent get a key and are inserted, so members committed since the pairs were
+        loaded are used instead of inserted twice. Returns the BK/PK pairs found and the inserted rows.
+        """
+        bk_cols = bk_columns(m["bk_name"])
+        with self._connection(conn) as conn, conn.begin_nested() if conn.in_transaction() else conn.begin():
+            df_found = self._load_existing_keys(
+                dim_table=m["dim_table"], pk_name=m["key_name"], bk_name=m["bk_name"], bk_values=df_missing, conn=conn,
+            )
+            df_found = self._align_pair_dtypes(df_found.select(*bk_cols, m["key_name"]), m["bk_name"], df_missing.schema)
+            df_absent = df_missing.join(df_found, on=bk_cols, how="anti", maintain_order="left")
+            if len(df_absent) == 0:
+                key_offset = 0
+            elif self.key_allocator is not None:
+                key_offset = self.key_allocator.reserve(m["dim_table"], m["key_name"], len(df_absent))
+            else:
+                key_offset = self._get_max_existing_key(m["dim_table"], m["key_name"], conn=conn)
+            df_inferred = df_absent.with_columns(
+                (pl.int_range(1, len(df_absent) + 1, dtype=pl.Int64) + key_offset).alias(m["key_name"]),
+                *[pl.lit(value).alias(name) for name, value in m["inferred_values"].items()],
+            )
+            if len(df_inferred) > 0:
+                write_rows(conn, m["dim_table"], df_inferred)
+                self.lookup_planner.invalidate(m["dim_table"])
+        return df_found, df_inferred
+
+    def _infer_dimension_members(self, m: dict[str, Any], missing_mask: pl.Series, conn: Optional[Connection] = None) -> int:
+        """
+        Insert placeholder rows for the distinct missing BKs of one mapping and fill their keys in.
+        Returns the number of inferred members.
+        """
+        bk_cols = bk_columns(m["bk_name"])
+        df_missing = self.df_incoming_modified.filter(missing_mask).select(bk_cols).drop_nulls().unique(maintain_order=True)
+        if len(df_missing) == 0:
+            return 0
+        df_found, df_inferred = self._insert_inferred_members(m, df_missing, conn)
+
+        inferred_key = f"{m['key_name']}{INFERRED_SUFFIX}"
+        df_pairs = pl.concat([df_found, df_inferred.select(*bk_cols, m["key_name"])], how="vertical_relaxed")
+        self.df_incoming_modified = (
+            self.df_incoming_modified
+            .join(df_pairs.rename({m["key_name"]: inferred_key}), on=bk_cols, how="left", maintain_order="left")
+            .with_columns(pl.coalesce(m["key_name"], inferred_key).alias(m["key_name"]))
+            .drop(inferred_key)
+        )
+        if len(df_inferred) > 0:
+            self.inferred_members[m["dim_table"]] = df_inferred
+        return len(df_inferred)
+
+    def _import_dimension_keys(self, fail_on_missing: bool = False, conn: Optional[Connection] = None):
         #TODO: This function should be split in multiple
         if self._processed == True:
             return self
         if not self.dim_mappings:
             raise KeysError("Reference to dimension is missing. Either register_dimension or register_all_dimension must be called.")
 
+        self._check_dimension_bk_columns(self.df_incoming_modified.columns)
+
+        dim_pairs = self._load_all_dimension_pairs()
         for dim_name, m in self.dim_mappings.items():
-            if m["bk_name"] not in self.df_incoming_modified.columns:
-                raise BusinessKeyError(f"Fact BK column '{m['bk_name']}' missing in incoming dataframe.")
+            with self._observe(PHASE_DIMENSION_MAPPING, target_table=m["dim_table"]) as observation:
+                self._merge_keys(dim_pairs[dim_name], m["bk_name"], m["key_name"])
 
-            df_pairs = self._load_existing_keys(
-                dim_table=m["dim_table"],
-                pk_name=m["key_name"],
-                bk_name=m["bk_name"]
-            )
-            self._merge_keys(df_pairs, m["bk_name"], m["key_name"])
-
-            missing_mask = self.df_incoming_modified[m["key_name"]].is_null()
-            missing_count = missing_mask.sum()
-            if fail_on_missing and missing_count > 0:
-                sample_bks = self.df_incoming_modified.filter(missing_mask)[m["bk_name"]].head(10)
-                raise MissingDimensionKeyError(
-                    f"Missing dimension keys for {missing_count} rows when mapping "
-                    f"{m['bk_name']} -> {m['key_name']} from {m['dim_table']}. "
-                    f"Sample missing BKs:\n{sample_bks.to_list()}"
-                )
-            else:
-                self.df_incoming_modified = self.df_incoming_modified.with_columns(
-                    pl.when(pl.col(m["key_name"]).is_null())
-                    .then(DEFAULT_PK_VALUE)
-                    .otherwise(pl.col(m["key_name"]))
-                    .alias(m["key_name"])
-                )
+                missing_mask = self.df_incoming_modified[m["key_name"]].is_null()
+                missing_count = missing_mask.sum()
+                if m["infer_missing"] and missing_count > 0:
+                    observation.record(inferred_rows=self._infer_dimension_members(m, missing_mask, conn))
+                    missing_mask = self.df_incoming_modified[m["key_name"]].is_null()
+                    missing_count = missing_mask.sum()
+                observation.record(rows=len(self.df_incoming_modified), pair_rows=len(dim_pairs[dim_name]), missing_rows=missing_count)
+                if fail_on_missing and missing_count > 0:
+                    sample_bks = self.df_incoming_modified.filter(missing_mask).select(bk_columns(m["bk_name"])).head(10)
+                    raise MissingDimensionKeyError(
+                        f"Missing dimension keys for {missing_count} rows when mapping "
+                        f"{m['bk_name']} -> {m['key_name']} from {m['dim_table']}. "
+                        f"Sample missing BKs:\n{sample_bks.to_series().to_list() if sample_bks.width == 1 else sample_bks.rows()}"
+                    )
+                else:
+                    self.df_incoming_modified = self.df_incoming_modified.with_columns(
+                        pl.when(pl.col(m["key_name"]).is_null())
+                        .then(DEFAULT_PK_VALUE)
+                        .otherwise(pl.col(m["key_name"]))
+                        .alias(m["key_name"])
+                    )
 
         # remove bk cols
-        bk_cols_to_pop = {m["bk_name"] for m in self.dim_mappings.values()}
-        self.df_incoming_modified = self.df_incoming_modified.drop(list(bk_cols_to_pop))
+        self.df_incoming_modified = self.df_incoming_modified.drop(self._dimension_bk_columns())
         self._processed = True
         return self
 
-    def process(self) -> pl.DataFrame:
-        if self._processed:
-            return self.df_incoming_modified
+    def _load_plan_pairs(self) -> dict[Optional[str], pl.DataFrame]:
+        if not self.dim_mappings:
+            raise KeysError("Reference to dimension is missing. Either register_dimension or register_all_dimension must be called.")
+
+        if inferring := [dim_name for dim_name, m in self.dim_mappings.items() if m["infer_missing"]]:
+            raise KeysError(f"Inferred members are not supported for streamed input (dimensions: {', '.join(inferring)}); use process().")
+        plan_pairs = super()._load_plan_pairs()
+        for dim_name, df_pairs in self._load_all_dimension_pairs().items():
+            self._check_unique_pairs(df_pairs, self.dim_mappings[dim_name]["bk_name"], dim_name)
+            plan_pairs[dim_name] = df_pairs
+        return plan_pairs
 
+    def _join_plan(self, lf: pl.LazyFrame, plan_pairs: dict[Optional[str], pl.DataFrame]) -> pl.LazyFrame:
+        """Join the table's own pairs and every dimension mapping; missing keys are still null."""
+        schema = lf.collect_schema()
+        self._check_dimension_bk_columns(schema.names())
+        lf = super()._key_plan(lf, plan_pairs)
+        for dim_name, m in self.dim_mappings.items():
+            df_pairs = self._align_pair_dtypes(plan_pairs[dim_name], m["bk_name"], schema)
+            lf = lf.join(df_pairs.lazy(), on=bk_columns(m["bk_name"]), how="left", maintain_order="left")
+        return lf
+
+    def _key_plan(self, lf: pl.LazyFrame, plan_pairs: dict[Optional[str], pl.DataFrame]) -> pl.LazyFrame:
+        """Join the table's own pairs and every dimension mapping, defaulting missing dimension keys."""
+        return self._join_plan(lf, plan_pairs).with_columns(
+            pl.col(m["key_name"]).fill_null(DEFAULT_PK_VALUE) for m in self.dim_mappings.values()
+        ).drop(self._dimension_bk_columns())
+
+    def _process_eager(self) -> pl.DataFrame:
+        """Step by step keying, for inferred members and verified BK source columns, which need the intermediate frames."""
         self.df_existing_pk_bk_pair = self._load_existing_keys()
         self._merge_keys(self.df_existing_pk_bk_pair)
 
         self._import_dimension_keys()
-        self.initial_max_pk = self._get_max_existing_key()
+        self.initial_max_pk = self._reserve_keys()
         self._assign_new_keys()
         return self.df_incoming_modified
+
+    @observed(PHASE_KEY_ASSIGNMENT, measure=lambda self, _: self.df_new_rows)
+    def _split_new_rows(self, df_keyed: pl.DataFrame) -> None:
+        self.df_new_rows = df_keyed.filter(pl.col(NEW_ROW)).drop(NEW_ROW)
+        self.df_incoming_modified = df_keyed.drop(NEW_ROW)
+
+    def process(self) -> pl.DataFrame:
+        """
+        Key the fact as one lazy plan: own and dimension joins, default keys, BK drops and new key numbering
+        are collected once, together with the missing key counts per dimension.
+        """
+        self._check_not_streaming()
+        if self._processed:
+            return self.df_incoming_modified
+        self._validate()
+        if self.bk_source_columns or any(m["infer_missing"] for m in self.dim_mappings.values()):
+            return self._process_eager()
+
+        plan_pairs = self._load_plan_pairs()
+        self.df_existing_pk_bk_pair = plan_pairs[None]
+        lf = self.df_incoming_modified.lazy()
+        count = self._new_key_count(lf, plan_pairs) if self.key_allocator is not None else None
+        self.initial_max_pk = self._reserve_keys(count)
+
+        lf_joined = self._join_plan(lf, plan_pairs)
+        lf_keyed = lf_joined.with_columns(
+            pl.col(self.pk_name).is_null().alias(NEW_ROW),
+            *(pl.col(m["key_name"]).fill_null(DEFAULT_PK_VALUE) for m in self.dim_mappings.values()),
+        ).drop(self._dimension_bk_columns()).with_columns(self._new_key_expr(self.initial_max_pk))
+        lf_missing = lf_joined.select(pl.col(m["key_name"]).is_null().sum().alias(dim_name) for dim_name, m in self.dim_mappings.items())
+        with self._observe(PHASE_MERGE) as observation:
+            df_keyed, df_missing = pl.collect_all([lf_keyed, lf_missing])
+            observation.record(df_keyed)
+
+        for dim_name, m in self.dim_mappings.items():
+            with self._observe(PHASE_DIMENSION_MAPPING, target_table=m["dim_table"]) as observation:
+                observation.record(rows=len(df_keyed), pair_rows=len(plan_pairs[dim_name]), missing_rows=df_missing[dim_name].item())
+        self._split_new_rows(df_keyed)
+        self._processed = True
+        return self.df_incoming_modified
+
+    async def process_async(self, async_conn: AsyncConnectable) -> pl.DataFrame:
+        """
+        process() on an AsyncConnection or AsyncEngine. With an AsyncEngine the fact's own pairs and every
+        dimension are queried concurrently, each on its own connection; the Polars steps run in a worker thread.
+        """
+        self._check_not_streaming()
+        if self._processed:
+            return self.df_incoming_modified
+        if not self.dim_mappings:
+            raise KeysError("Reference to dimension is missing. Either register_dimension or register_all_dimension must be called.")
+        await asyncio.to_thread(self._validate)
+
+        to_load = {dim_name: m for dim_name, m in self.dim_mappings.items() if dim_name not in self.provided_dim_pairs}
+        loads = [self._load_existing_keys_async(async_conn)] + [
+            self._load_existing_keys_async(async_conn, dim_table=m["dim_table"], pk_name=m["key_name"], bk_name=m["bk_name"])
+            for m in to_load.values()
+        ]
+        if isinstance(async_conn, AsyncEngine):
+            df_own_pairs, *dim_pairs = await asyncio.gather(*loads)
+        else:
+            df_own_pairs, *dim_pairs = [await load for load in loads]
+        for dim_name, df_pairs in zip(to_load, dim_pairs):
+            self.provide_dimension_keys(dim_name, df_pairs)
+
+        self.df_existing_pk_bk_pair = df_own_pairs
+        await asyncio.to_thread(self._merge_keys, self.df_existing_pk_bk_pair)
+        if any(m["infer_missing"] for m in self.dim_mappings.values()):
+            await self._run_async(async_conn, self._import_dimension_keys)
+        else:
+            await asyncio.to_thread(self._import_dimension_keys)
+        self.initial_max_pk = await self._reserve_keys_async(async_conn)
+        await asyncio.to_thread(self._assign_new_keys)
+        return self.df_incoming_modified
@@ -1,8 +1,34 @@
 from __future__ import annotations
-from typing import Optional
+import asyncio
+import warnings
+from contextlib import contextmanager
+from functools import partial
+from importlib.util import find_spec
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence, TypeVar, Union
 import polars as pl
-from sqlalchemy.engine import Connection
-from .Errors import BusinessKeyError, DatabaseError, MergeError
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.util import await_only
+from .Errors import BusinessKeyError, DatabaseError, DuplicateBusinessKeyWarning, HashCollisionError, KeysError, MergeError
+from .key_cache import CacheKey, KeyCache
+from .connection_pool import KeyConnectionPool, cached_statement, pool_for
+from .key_snapshot import KeySnapshotStore
+from .lookup_planner import LOOKUP_AUTO, LOOKUP_FULL, LOOKUP_MODES, LOOKUP_PUSHDOWN, SHARED_LOOKUP_PLANNER, LookupPlan, LookupPlanner
+from .key_allocator import KeyAllocator
+from .writer import DEFAULT_WRITE_CHUNK_SIZE, WRITE_AUTO, WriteStats, write_rows
+from .observers import (
+    NULL_OBSERVATION,
+    PHASE_KEY_ASSIGNMENT,
+    PHASE_KEY_LOAD,
+    PHASE_MAX_KEY,
+    PHASE_MERGE,
+    PHASE_VALIDATION,
+    PHASE_WRITE,
+    KeyObserver,
+    NullObservation,
+    Observation,
+    observed,
+)
 
 BK_SEP = "||"
 DEFAULT_PK_VALUE = -1
@@ -10,6 +36,45 @@ DEFAULT_PK_PREFIX = "key" #TODO
 DEFAULT_BK_PREFIX = "bk" #TODO
 MAX_SAMPLE_CONFLICTS = 5 #TODO
 MAX_SAMPLE_ROWS = 5 #TODO
+PUSHDOWN_CHUNK_SIZE = 1000
+STORED_SUFFIX = "_stored"
+DEFAULT_BATCH_SIZE = 1_000_000
+DUPLICATES_FAIL = "fail"
+DUPLICATES_WARN = "warn"
+DUPLICATES_KEEP_LAST = "keep_last"
+DUPLICATE_MODES = (DUPLICATES_FAIL, DUPLICATES_WARN, DUPLICATES_KEEP_LAST)
+READ_CONNECTORX = "connectorx"
+READ_ADBC = "adbc"
+READ_ENGINE_MODULES = {READ_CONNECTORX: "connectorx", READ_ADBC: "adbc_driver_manager"}
+ADBC_DRIVER_ALIASES = {"postgres": "postgresql"}
+DEFAULT_READ_PARTITIONS = 4
+ROW_INDEX = "__keys_row"
+NEW_ROW = "__keys_new"
+BK_COUNT = "__keys_bk_count"
+
+IncomingData = Union[pl.DataFrame, pl.LazyFrame, Iterable[pl.DataFrame]]
+AsyncConnectable = Union[AsyncConnection, AsyncEngine]
+Connectable = Union[Connection, Engine, KeyConnectionPool]
+BkName = Union[str, list[str]]
+T = TypeVar("T")
+
+
+def bk_columns(bk_name: BkName) -> list[str]:
+    """Columns making up a business key: a single column name or a list of natively typed columns."""
+    return [bk_name] if isinstance(bk_name, str) else list(bk_name)
+
+
+def masked_url(url: str) -> str:
+    """A database URL with its password masked, as str() of an Engine's URL gives it."""
+    return make_url(url).render_as_string(hide_password=True)
+
+
+def read_engine_modules(read_engine: str, read_uri: str) -> list[str]:
+    """Modules the fast reader needs; ADBC also needs the driver for the URI's database, e.g. adbc_driver_postgresql."""
+    if read_engine != READ_ADBC:
+        return [READ_ENGINE_MODULES[read_engine]]
+    dialect = read_uri.split(":", 1)[0].split("+", 1)[0].lower()
+    return [READ_ENGINE_MODULES[read_engine], f"adbc_driver_{ADBC_DRIVER_ALIASES.get(dialect, dialect)}"]
 
 #TODO: pk er reelt surrogate nøgle
 
@@ -20,113 +85,676 @@ class KeyManager:
       - Business key construction
       - Conflict checking (BK -> PK uniqueness)
     Subclasses decide whether they may generate new PKs (dimension) or only look up (fact).
+    bk_name may be a list of columns for composite business keys; they are selected, checked and
+    joined as their native types, without building a concatenated string.
+    df_incoming may also be a LazyFrame or an iterable of DataFrame batches. Such input is keyed in
+    streaming fashion with process_batches() or sink_parquet() instead of process(), so peak memory
+    is bounded by the batch size and the loaded key pairs rather than by the input.
+    on_duplicate decides what happens to duplicate incoming BKs: "fail" raises, "warn" warns and keeps
+    all rows, "keep_last" keeps the last row per BK. With defer_validation the checks run when the
+    data is processed instead of in __init__.
+    lookup_mode="auto" lets lookup_planner choose between a full scan and pushdown per table from
+    the table's row count and the distinct incoming BKs; explain() shows the plans without loading keys.
+    With read_uri, full key pair loads and max key queries are read straight into Arrow by
+    connectorx (partitioned on the PK into read_partitions parallel queries) or ADBC (read_engine="adbc").
+    If the engine (or the ADBC driver for the URI's database) is not installed, or the connection has an open
+    transaction whose uncommitted rows the fast reader could not see, the SQLAlchemy connection is used.
+    conn may also be an Engine or a KeyConnectionPool: every query then checks out its own pooled
+    connection instead of running in order on one connection, and writes run in their own transaction.
     """
 
     def __init__(
         self,
         table_name: str,
-        conn: Connection,
-        df_incoming: pl.DataFrame,
+        conn: Optional[Connectable],
+        df_incoming: IncomingData,
         pk_name: Optional[str] = None,
-        bk_name: Optional[str] = None,
+        bk_name: Optional[BkName] = None,
         key_condition: Optional[str] = None,
+        lookup_mode: str = LOOKUP_FULL,
+        key_cache: Optional[KeyCache] = None,
+        key_allocator: Optional[KeyAllocator] = None,
+        bk_source_columns: Optional[list[str]] = None,
+        observers: Optional[Sequence[KeyObserver]] = None,
+        snapshot_store: Optional[KeySnapshotStore] = None,
+        on_duplicate: str = DUPLICATES_FAIL,
+        defer_validation: bool = False,
+        read_uri: Optional[str] = None,
+        read_engine: str = READ_CONNECTORX,
+        read_partitions: int = DEFAULT_READ_PARTITIONS,
+        lookup_planner: Optional[LookupPlanner] = None,
     ):
+        if lookup_mode not in LOOKUP_MODES:
+            raise ValueError(f"lookup_mode must be one of {LOOKUP_MODES}, got '{lookup_mode}'")
+        if on_duplicate not in DUPLICATE_MODES:
+            raise ValueError(f"on_duplicate must be one of {DUPLICATE_MODES}, got '{on_duplicate}'")
+        if read_engine not in READ_ENGINE_MODULES:
+            raise ValueError(f"read_engine must be one of {tuple(READ_ENGINE_MODULES)}, got '{read_engine}'")
         self.table_name = table_name
-        self.conn = conn
-        self.df_incoming = df_incoming.clone()
-        self.df_incoming_modified = df_incoming.clone()
+        self._engine = conn if isinstance(conn, Engine) else None  # the shared pool only holds it weakly
+        if isinstance(conn, Engine):
+            conn = pool_for(conn)
+        self.pool = conn if isinstance(conn, KeyConnectionPool) else None
+        self.conn = None if self.pool is not None else conn
+        self.observers = list(observers or [])
+        self.streaming = not isinstance(df_incoming, pl.DataFrame)
+        self.lf_incoming: Optional[pl.LazyFrame] = df_incoming if isinstance(df_incoming, pl.LazyFrame) else None
+        self._incoming_batches: Optional[Iterator[pl.DataFrame]] = iter(df_incoming) if self.streaming and self.lf_incoming is None else None
+        self._df_batch: Optional[pl.DataFrame] = None
+        self.df_incoming = None if self.streaming else df_incoming.clone()
+        self.df_incoming_modified = None if self.streaming else df_incoming.clone()
         self.pk_name = pk_name or f"key_{table_name}"
         self.bk_name = bk_name or f"bk_{table_name}"
         self.key_condition = key_condition
-        self._initial_length_incoming_df = len(df_incoming)
+        self.lookup_mode = lookup_mode
+        self.key_cache = key_cache
+        self.snapshot_store = snapshot_store
+        self.key_allocator = key_allocator
+        self.bk_source_columns = list(bk_source_columns or [])
+        self.on_duplicate = on_duplicate
+        self.lookup_planner = lookup_planner or SHARED_LOOKUP_PLANNER
+        self.read_uri = read_uri
+        self.read_engine = read_engine
+        self.read_partitions = read_partitions
+        self._fast_read = read_uri is not None and all(find_spec(m) is not None for m in read_engine_modules(read_engine, read_uri))
+        self._initial_length_incoming_df = None if self.streaming else len(df_incoming)
+        self._validated = False
+        if not defer_validation:
+            self._validate()
+        self._processed = False
+        self.df_new_rows: Optional[pl.DataFrame] = None
+        self.last_write_stats: Optional[WriteStats] = None
+
+    def _check_bk_in_incoming_df(self, df_batch: Optional[pl.DataFrame] = None) -> None:
+        if df_batch is not None:
+            columns = df_batch.columns
+        elif self.lf_incoming is not None:
+            columns = self.lf_incoming.collect_schema().names()
+        else:
+            columns = self.df_incoming.columns
+        if missing := [c for c in bk_columns(self.bk_name) if c not in columns]:
+            raise BusinessKeyError(f"Business key column '{', '.join(missing)}' not found in incoming dataframe")
+
+    def _raise_duplicate_bks(self, duplicates: pl.DataFrame, duplicate_rows: pl.DataFrame) -> None:
+        raise BusinessKeyError(
+            f"Duplicate business keys found in incoming data for table '{self.table_name}'. "
+            f"Business key column: '{self.bk_name}'. "
+            f"Duplicate values: {duplicates.to_series() if duplicates.width == 1 else duplicates}."
+            f"Sample duplicate rows:\n{duplicate_rows}"
+        )
+
+    def _observe(self, phase: str, **detail) -> Union[Observation, NullObservation]:
+        """Context manager timing a block as a KeyEvent; a no-op when no observers are attached."""
+        if not self.observers:
+            return NULL_OBSERVATION
+        return Observation(self.observers, self.table_name, phase, detail)
+
+    def _validate(self) -> None:
+        """Run the BK checks once; iterator input is checked batch by batch while it is processed."""
+        if self._validated or self._incoming_batches is not None:
+            return
         self._check_bk_in_incoming_df()
         self._check_bk_value()
-        self._processed = False
+        self._validated = True
+
+    def _bk_summary(self, frame: Union[pl.DataFrame, pl.LazyFrame]) -> pl.LazyFrame:
+        """One group-by pass over the BK columns: rows per BK, with null BKs in their own groups."""
+        bk_cols = bk_columns(self.bk_name)
+        return frame.lazy().group_by(bk_cols).agg(pl.len().alias(BK_COUNT))
 
-    def _check_bk_in_incoming_df(self) -> None:
-        if self.bk_name not in self.df_incoming.columns:
-            raise BusinessKeyError(f"Business key column '{self.bk_name}' not found in incoming dataframe")
+    def _keep_last_expr(self) -> pl.Expr:
+        """True for the last row of every BK; rows with a null BK are never deduplicated."""
+        bk_cols = bk_columns(self.bk_name)
+        return (pl.col(ROW_INDEX) == pl.col(ROW_INDEX).max().over(bk_cols)) | pl.any_horizontal(pl.col(bk_cols).is_null())
+
+    def _handle_duplicates(self, duplicates: pl.DataFrame, sample_rows: Callable[[], pl.DataFrame]) -> bool:
+        """Apply on_duplicate to found duplicates; returns True when the rows must be deduplicated."""
+        if self.on_duplicate == DUPLICATES_FAIL:
+            self._raise_duplicate_bks(duplicates, sample_rows())
+        if self.on_duplicate == DUPLICATES_WARN:
+            warnings.warn(
+                f"{len(duplicates)} duplicate business keys in incoming data for table '{self.table_name}', "
+                f"e.g. {duplicates.head(MAX_SAMPLE_ROWS).rows()}",
+                DuplicateBusinessKeyWarning,
+                stacklevel=4,
+            )
+            return False
+        return True
 
+    @observed(PHASE_VALIDATION, measure=lambda self, _: self.df_incoming_modified)
     def _check_bk_value(self) -> None:
         """
         Checks BK values for:
             1. Not all BK's are None
-            2. No duplicated BK's
+            2. No duplicated BK's (handled according to on_duplicate)
+        Both come from a single group-by over the BK columns; LazyFrame input is aggregated with the streaming engine.
         """
-        bk_values = self.df_incoming_modified[self.bk_name].drop_nulls()
+        bk_cols = bk_columns(self.bk_name)
+        frame = self.df_incoming_modified if self.lf_incoming is None else self.lf_incoming
+        df_summary = self._bk_summary(frame).drop_nulls(bk_cols).collect(engine="streaming")
 
-        if len(bk_values) == 0:
+        if len(df_summary) == 0:
             raise BusinessKeyError(f"No valid business key values found in column '{self.bk_name}'")
 
-        duplicate_mask = bk_values.is_duplicated()
+        duplicates = df_summary.filter(pl.col(BK_COUNT) > 1).select(bk_cols)
+        if len(duplicates) == 0:
+            return
 
-        if duplicate_mask.any():
-            duplicates = bk_values.filter(duplicate_mask).unique()
-            example_dub = duplicates[0]
-            duplicate_rows = self.df_incoming_modified.filter(pl.col(self.bk_name) == example_dub)
+        def sample_rows() -> pl.DataFrame:
+            return frame.lazy().join(duplicates.head(1).lazy(), on=bk_cols, how="semi").head(MAX_SAMPLE_ROWS).collect()
 
-            raise BusinessKeyError(
-                f"Duplicate business keys found in incoming data for table '{self.table_name}'. "
-                f"Business key column: '{self.bk_name}'. "
-                f"Duplicate values: {duplicates}."
-                f"Sample duplicate rows:\n{duplicate_rows}"
+        if not self._handle_duplicates(duplicates, sample_rows):
+            return
+        if self.lf_incoming is not None:
+            self.lf_incoming = self.lf_incoming.with_row_index(ROW_INDEX).filter(self._keep_last_expr()).drop(ROW_INDEX)
+        else:
+            self.df_incoming_modified = (
+                self.df_incoming_modified.with_row_index(ROW_INDEX).filter(self._keep_last_expr()).drop(ROW_INDEX)
             )
+            # the merge guard compares against the deduplicated rows, not the incoming ones
+            self._initial_length_incoming_df = len(self.df_incoming_modified)
 
-    def _load_existing_keys(self, dim_table: Optional[str] = None, pk_name: Optional[str] = None, bk_name: Optional[str] = None) -> pl.DataFrame:
-        """Load existing key pairs from db."""
+    def _check_bk_value_batch(self, df_batch: pl.DataFrame, seen_bks: Optional[pl.DataFrame]) -> tuple[pl.DataFrame, pl.DataFrame]:
+        """
+        Check one batch of iterator input against itself and all earlier batches.
+        Returns the (possibly deduplicated) batch and the updated seen BKs. Earlier batches are already
+        emitted, so with keep_last a BK seen before keeps its first key and the later rows are dropped.
+        """
+        self._check_bk_in_incoming_df(df_batch)
+        bk_cols = bk_columns(self.bk_name)
+        bk_values = self._bk_summary(df_batch).drop_nulls(bk_cols).collect()
+        duplicates = bk_values.filter(pl.col(BK_COUNT) > 1).select(bk_cols)
+        bk_values = bk_values.select(bk_cols)
+        if seen_bks is not None:
+            duplicates = pl.concat([duplicates, bk_values.join(seen_bks, on=bk_cols, how="semi")])
+        if len(duplicates) > 0:
+            duplicates = duplicates.unique()
+            sample_rows = lambda: df_batch.join(duplicates.head(1), on=bk_cols, how="semi")
+            if self._handle_duplicates(duplicates, sample_rows):
+                df_batch = df_batch.with_row_index(ROW_INDEX).filter(self._keep_last_expr()).drop(ROW_INDEX)
+                if seen_bks is not None:
+                    df_batch = df_batch.join(seen_bks, on=bk_cols, how="anti")
+                    bk_values = bk_values.join(seen_bks, on=bk_cols, how="anti")
+        return df_batch, bk_values if seen_bks is None else pl.concat([seen_bks, bk_values])
+
+    @observed(PHASE_KEY_LOAD, measure=lambda self, df_pairs: df_pairs)
+    def _load_existing_keys(
+        self,
+        dim_table: Optional[str] = None,
+        pk_name: Optional[str] = None,
+        bk_name: Optional[BkName] = None,
+        bk_values: Optional[Union[pl.Series, pl.DataFrame]] = None,
+        conn: Optional[Connection] = None,
+    ) -> pl.DataFrame:
+        """
+        Load existing key pairs from db (on conn if given, otherwise self.conn or a pooled connection per query).
+        In pushdown mode only pairs for the distinct incoming BKs (or the given bk_values) are fetched.
+        With a key_cache, cached pairs are used and refreshed with rows added since they were cached.
+        With a snapshot_store, a cache miss opens the memory-mapped snapshot and refreshes it the same way;
+        a full load writes a new snapshot. Loads bounded by _pair_predicates are not snapshotted.
+        """
         bk_name = bk_name or self.bk_name
         pk_name = pk_name or self.pk_name
         dim_table = dim_table or self.table_name
 
-        query = f"SELECT {bk_name}, {pk_name} FROM {dim_table}"
-        if self.key_condition:
-            query += " WHERE " + self.key_condition
+        bk_select = self._bk_select(dim_table, bk_name)
+        cache_key = self._lookup_key(dim_table, pk_name, bk_name)
+        # a snapshot of one bounded range would be written per range and never reused
+        snapshot_store = None if self._pair_predicates(dim_table)[0] else self.snapshot_store
+        if self.key_cache is not None and bk_values is None:
+            cached = self.key_cache.get(cache_key)
+            if cached is not None:
+                df_cached, cached_max_pk = cached
+                df_new = self._load_keys_since(dim_table, pk_name, bk_name, cached_max_pk, conn)
+                if len(df_new) == 0:
+                    return df_cached
+                df_existing_pk_bk_pair = pl.concat([df_cached, df_new], how="vertical_relaxed")
+                self.key_cache.put(cache_key, df_existing_pk_bk_pair, pk_name)
+                if snapshot_store is not None:
+                    snapshot_store.save(cache_key, df_existing_pk_bk_pair)
+                return df_existing_pk_bk_pair
+
+        if snapshot_store is not None and bk_values is None:
+            snapshot = snapshot_store.load(cache_key, pk_name)
+            if snapshot is not None:
+                df_snapshot, snapshot_max_pk = snapshot
+                df_new = self._load_keys_since(dim_table, pk_name, bk_name, snapshot_max_pk, conn)
+                if len(df_new) == 0:
+                    df_existing_pk_bk_pair = df_snapshot
+                else:
+                    df_existing_pk_bk_pair = pl.concat([df_snapshot, df_new], how="vertical_relaxed")
+                    snapshot_store.save(cache_key, df_existing_pk_bk_pair)
+                if self.key_cache is not None:
+                    self.key_cache.put(cache_key, df_existing_pk_bk_pair, pk_name)
+                return df_existing_pk_bk_pair
+
+        if bk_values is not None or self._uses_pushdown(dim_table, pk_name, bk_name):
+            if bk_values is None:
+                bk_values = self._incoming_bk_values(bk_name)
+            return self._load_existing_keys_pushdown(dim_table, pk_name, bk_name, bk_values, conn)
+
+        query = f"SELECT {bk_select}, {pk_name} FROM {dim_table}"
+        conditions, params = self._pair_conditions(dim_table)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
 
         try:
-            df_existing_pk_bk_pair = pl.read_database(query, self.conn)
+            df_existing_pk_bk_pair = self._read_database(query, conn, partition_on=pk_name, params=params)
         except Exception as e:
             raise DatabaseError(f"Failed loading existing key pairs from {dim_table} with bk:{bk_name}, pk:{pk_name}: {e}") from e
 
+        if self.key_cache is not None:
+            self.key_cache.put(cache_key, df_existing_pk_bk_pair, pk_name)
+        if snapshot_store is not None:
+            snapshot_store.save(cache_key, df_existing_pk_bk_pair)
         return df_existing_pk_bk_pair
 
-    def _get_max_existing_key(self, table_name: Optional[str] = None, pk_name: Optional[str] = None) -> int:
-        """Get maximum existing key value from database."""
+    def _lookup_key(self, dim_table: str, pk_name: str, bk_name: BkName, database_url: Optional[str] = None) -> CacheKey:
+        """
+        Identifies a key pair lookup in the key cache, snapshot and BK filter stores and planner; bound predicate
+        values and the database (database_url, default the manager's) are part of it, so a cache directory shared
+        between databases never serves one database's pairs to another.
+        """
+        conditions, params = self._pair_conditions(dim_table)
+        condition = self.key_condition
+        if params:
+            condition = " AND ".join(conditions) + " " + repr(sorted(params.items()))
+        return (dim_table, self._bk_select(dim_table, bk_name), pk_name, condition, database_url or self._database_url())
+
+    def _pair_predicates(self, dim_table: str) -> tuple[list[str], dict[str, Any]]:
+        """Extra predicates with bound parameters for key pair loads of dim_table; none by default."""
+        return [], {}
+
+    def _pair_conditions(self, dim_table: str) -> tuple[list[str], dict[str, Any]]:
+        """key_condition combined with the bound predicates (parenthesized when there are several)."""
+        predicates, params = self._pair_predicates(dim_table)
+        if not predicates:
+            return ([self.key_condition] if self.key_condition else []), {}
+        return ([f"({self.key_condition})"] if self.key_condition else []) + predicates, params
+
+    def _plan_lookup(self, dim_table: Optional[str] = None, pk_name: Optional[str] = None, bk_name: Optional[BkName] = None, estimate: bool = False) -> LookupPlan:
+        return self.lookup_planner.plan(
+            self, dim_table or self.table_name, pk_name or self.pk_name, bk_name or self.bk_name, estimate=estimate,
+        )
+
+    def _batch_plan_pairs(self) -> bool:
+        """Whether the plan pairs depend on the current batch and must be loaded again for every batch."""
+        return self._uses_pushdown(self.table_name, self.pk_name, self.bk_name)
+
+    def _uses_pushdown(self, dim_table: str, pk_name: str, bk_name: BkName) -> bool:
+        if self.lookup_mode != LOOKUP_AUTO:
+            return self.lookup_mode == LOOKUP_PUSHDOWN
+        return self._plan_lookup(dim_table, pk_name, bk_name).strategy == LOOKUP_PUSHDOWN
+
+    def explain(self) -> list[LookupPlan]:
+        """Lookup plans with row and byte estimates; only row counts are queried, no key pairs are loaded."""
+        if self._incoming_batches is not None:
+            raise KeysError("explain() requires DataFrame or LazyFrame input; batch iterators are planned per batch")
+        return [self._plan_lookup(estimate=True)]
+
+    @contextmanager
+    def _connection(self, conn: Optional[Connection] = None) -> Iterator[Connection]:
+        """conn if given, else self.conn, else a connection checked out from the pool for the duration."""
+        if conn is not None or self.conn is not None:
+            yield conn if conn is not None else self.conn
+            return
+        if self.pool is None:
+            raise KeysError(f"No connection for table '{self.table_name}': pass a Connection, Engine or KeyConnectionPool")
+        with self.pool.connect() as pooled_conn:
+            yield pooled_conn
+
+    @contextmanager
+    def _pinned_connection(self) -> Iterator[Connection]:
+        """Pin self.conn to one pooled connection, in a transaction, so several statements share it."""
+        if self.conn is not None:
+            with self.conn.begin_nested() if self.conn.in_transaction() else self.conn.begin():
+                yield self.conn
+            return
+        with self._connection() as conn, conn.begin():
+            self.conn = conn
+            try:
+                yield conn
+            finally:
+                self.conn = None
+
+    def _reads_fast(self, conn: Optional[Connection]) -> bool:
+        """
+        The fast reader opens its own connection and cannot see uncommitted rows, so it is only used when the
+        query would run without an open transaction: on self.conn or a pooled connection, or on the connection
+        of an async load (see _run_async). A conn passed for the query otherwise keeps it on that connection.
+        """
+        if not self._fast_read:
+            return False
+        if conn is None:
+            return self.conn is None or not self.conn.in_transaction()
+        return conn.dialect.is_async and not conn.in_transaction()
+
+    def _read_database(self, query: str, conn: Optional[Connection] = None, partition_on: Optional[str] = None, params: Optional[dict[str, Any]] = None) -> pl.DataFrame:
+        """
+        Run a query with the fast reader if it may be used (see _reads_fast), otherwise on conn (see _connection).
+        Queries with bound params always run on conn, as a cached statement. connectorx splits the query into
+        read_partitions range queries on partition_on. In an async load the fast read runs in a worker thread,
+        so it does not block the event loop.
+        """
+        if params:
+            with self._connection(conn) as conn:
+                return pl.read_database(cached_statement(query), conn, execute_options={"parameters": params})
+        if not self._reads_fast(conn):
+            with self._connection(conn) as conn:
+                return pl.read_database(cached_statement(query), conn)
+        partitions = {}
+        if self.read_engine == READ_CONNECTORX and partition_on and self.read_partitions > 1:
+            partitions = {"partition_on": partition_on, "partition_num": self.read_partitions}
+        read = partial(pl.read_database_uri, query, self.read_uri, engine=self.read_engine, **partitions)
+        if conn is not None:
+            return await_only(asyncio.to_thread(read))
+        return read()
+
+    def _bk_select(self, dim_table: str, bk_name: BkName) -> str:
+        """BK side of the key pair SELECT; includes the stored BK source columns when they are verified."""
+        bk_cols = bk_columns(bk_name)
+        if self.bk_source_columns and dim_table == self.table_name and bk_name == self.bk_name:
+            bk_cols += self.bk_source_columns
+        return ", ".join(bk_cols)
+
+    def _incoming_bk_values(self, bk_name: BkName) -> pl.DataFrame:
+        """Incoming values of BK columns: from the current batch, the LazyFrame (distinct only) or the DataFrame."""
+        self._validate()
+        bk_cols = bk_columns(bk_name)
+        if self._df_batch is not None:
+            return self._df_batch.select(bk_cols)
+        if self.lf_incoming is not None:
+            return self.lf_incoming.select(bk_cols).drop_nulls().unique().collect(engine="streaming")
+        return self.df_incoming_modified.select(bk_cols)
+
+    def _load_keys_since(self, dim_table: str, pk_name: str, bk_name: BkName, min_pk: int, conn: Optional[Connection] = None) -> pl.DataFrame:
+        """Load key pairs with a PK above min_pk, i.e. rows added after min_pk was assigned."""
+        query = f"SELECT {self._bk_select(dim_table, bk_name)}, {pk_name} FROM {dim_table} WHERE {pk_name} > :min_pk"
+        conditions, params = self._pair_conditions(dim_table)
+        for condition in conditions:
+            query += " AND (" + condition + ")"
+
+        try:
+            return self._read_database(query, conn, params={**params, "min_pk": min_pk})
+        except Exception as e:
+            raise DatabaseError(f"Failed loading new key pairs from {dim_table} with {pk_name} > {min_pk}: {e}") from e
+
+    def _load_existing_keys_pushdown(
+        self,
+        dim_table: str,
+        pk_name: str,
+        bk_name: BkName,
+        bk_values: Union[pl.Series, pl.DataFrame],
+        conn: Optional[Connection] = None,
+    ) -> pl.DataFrame:
+        """
+        Load key pairs for the given BKs only, sending them to the db in chunked IN lists.
+        Composite BKs are sent as row values: (col_a, col_b) IN ((...), (...)).
+        """
+        if isinstance(bk_values, pl.Series):
+            bk_values = bk_values.to_frame()
+        bk_values = bk_values.drop_nulls().unique()
+        bk_cols = bk_columns(bk_name)
+
+        bk_expr = bk_cols[0] if len(bk_cols) == 1 else f"({', '.join(bk_cols)})"
+        query = f"SELECT {self._bk_select(dim_table, bk_name)}, {pk_name} FROM {dim_table} WHERE {bk_expr} IN :bk_values"
+        conditions, params = self._pair_conditions(dim_table)
+        for condition in conditions:
+            query += " AND (" + condition + ")"
+        stmt = cached_statement(query, ("bk_values",))
+
+        chunks = []
+        try:
+            with self._connection(conn) as conn:
+                for offset in range(0, len(bk_values), PUSHDOWN_CHUNK_SIZE):
+                    df_chunk_bks = bk_values.slice(offset, PUSHDOWN_CHUNK_SIZE)
+                    chunk = df_chunk_bks.to_series().to_list() if len(bk_cols) == 1 else df_chunk_bks.rows()
+                    df_chunk = pl.read_database(stmt, conn, execute_options={"parameters": {**params, "bk_values": chunk}})
+                    if len(df_chunk) > 0:
+                        chunks.append(df_chunk)
+        except Exception as e:
+            raise DatabaseError(f"Failed loading existing key pairs from {dim_table} with bk:{bk_name}, pk:{pk_name}: {e}") from e
+
+        if not chunks:
+            return pl.DataFrame(schema={**bk_values.schema, pk_name: pl.Int64})
+        return pl.concat(chunks, how="vertical_relaxed")
+
+    def _database_url(self) -> Optional[str]:
+        """URL of the database the manager queries (password masked); identifies it in state shared between managers."""
+        if self.pool is not None:
+            return str(self.pool.engine.url)
+        if self.conn is not None:
+            return str(self.conn.engine.url)
+        return masked_url(self.read_uri) if self.read_uri is not None else None
+
+    def _count_rows(self, table_name: str, conn: Optional[Connection] = None) -> int:
+        """Rows of table_name under key_condition and the bound pair predicates, i.e. the rows a full pair load returns."""
+        query = f"SELECT COUNT(*) AS row_count FROM {table_name}"
+        conditions, params = self._pair_conditions(table_name)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return int(self._read_database(query, conn, params=params)["row_count"][0])
+
+    @observed(PHASE_MAX_KEY)
+    def _get_max_existing_key(self, table_name: Optional[str] = None, pk_name: Optional[str] = None, conn: Optional[Connection] = None) -> int:
+        """Get maximum existing key value from database (on conn if given, see _connection)."""
         pk_name = pk_name or self.pk_name
         table_name = table_name or self.table_name
 
         query = f"SELECT COALESCE(MAX({pk_name}), 0) as max_key FROM {table_name}"
 
         try:
-            result = pl.read_database(query, self.conn)
+            result = self._read_database(query, conn)
             return int(result['max_key'][0])
         except Exception as e:
             raise DatabaseError(f"Failed getting max key from {table_name}.{pk_name}: {e}") from e
 
+    async def _run_async(self, async_conn: AsyncConnectable, load: Callable[..., T], **kwargs) -> T:
+        """
+        Run a blocking load with conn=<sync facade of async_conn>, so the query awaits the async driver
+        instead of blocking the event loop. An AsyncEngine gives every call its own connection.
+        """
+        if isinstance(async_conn, AsyncEngine):
+            async with async_conn.connect() as conn:
+                return await conn.run_sync(lambda sync_conn: load(conn=sync_conn, **kwargs))
+        return await async_conn.run_sync(lambda sync_conn: load(conn=sync_conn, **kwargs))
+
+    async def _load_existing_keys_async(self, async_conn: AsyncConnectable, **kwargs) -> pl.DataFrame:
+        """Async _load_existing_keys on an AsyncConnection or AsyncEngine; takes the same keyword arguments."""
+        return await self._run_async(async_conn, self._load_existing_keys, **kwargs)
+
+    async def _get_max_existing_key_async(self, async_conn: AsyncConnectable, table_name: Optional[str] = None, pk_name: Optional[str] = None) -> int:
+        return await self._run_async(async_conn, self._get_max_existing_key, table_name=table_name, pk_name=pk_name)
+
+    async def _reserve_keys_async(self, async_conn: AsyncConnectable, count: Optional[int] = None) -> int:
+        """Async _reserve_keys; a key_allocator works on its own sync engine, so it runs in a worker thread."""
+        if self.key_allocator is None:
+            return await self._get_max_existing_key_async(async_conn)
+        return await asyncio.to_thread(self._reserve_keys, count)
+
+    def _check_not_streaming(self) -> None:
+        if self.streaming:
+            raise KeysError(f"Incoming data for '{self.table_name}' is streamed; use process_batches() or sink_parquet() instead of process()")
+
+    def _reserve_keys(self, count: Optional[int] = None) -> int:
+        """
+        Return the offset new keys are numbered from.
+        Without a key_allocator this is the current max key; with one, a block for count rows
+        (default: all rows missing a key) is leased.
+        """
+        if self.key_allocator is None:
+            return self._get_max_existing_key()
+
+        if count is None:
+            count = self.df_incoming_modified[self.pk_name].null_count()
+        if count == 0:
+            return 0
+        return self.key_allocator.reserve(self.table_name, self.pk_name, count)
+
+    @observed(PHASE_KEY_ASSIGNMENT, measure=lambda self, _: self.df_new_rows)
     def _assign_new_keys(self) -> None:
         "Assign new pk's for rows missing PK"
         mask_new = self.df_incoming_modified[self.pk_name].is_null()
         if not mask_new.any():
+            self.df_new_rows = self.df_incoming_modified.clear()
             return
 
-        self.df_incoming_modified = self.df_incoming_modified.with_columns(
+        self.df_incoming_modified = self.df_incoming_modified.with_columns(self._new_key_expr(self.initial_max_pk))
+        self.df_new_rows = self.df_incoming_modified.filter(mask_new)
+
+    def _new_key_expr(self, key_offset: int) -> pl.Expr:
+        """Number rows missing a PK from key_offset + 1, in row order."""
+        return (
             pl.when(pl.col(self.pk_name).is_null())
-            .then(self.initial_max_pk + pl.col(self.pk_name).is_null().cast(pl.Int64).cum_sum())
+            .then(key_offset + pl.col(self.pk_name).is_null().cast(pl.Int64).cum_sum())
             .otherwise(pl.col(self.pk_name).cast(pl.Int64))
             .alias(self.pk_name)
         )
 
-    def _merge_keys(self, df_existing_pk_bk_pair: pl.DataFrame, bk_name: Optional[str] = None, pk_name: Optional[str] = None) -> "KeyManager":
+    @observed(PHASE_WRITE, measure=lambda self, _: self.df_new_rows)
+    def write_to_db(self, chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE, method: str = WRITE_AUTO) -> WriteStats:
+        """
+        Bulk insert the rows that got new keys in process(); rows with existing BKs are not re-inserted.
+        Returns WriteStats with rows written and rows per second.
+        """
+        if self.df_new_rows is None:
+            raise KeysError(f"process() must be called before write_to_db() for table '{self.table_name}'")
+
+        with self._connection() as conn:
+            self.last_write_stats = write_rows(conn, self.table_name, self.df_new_rows, chunk_size, method)
+        self.lookup_planner.invalidate(self.table_name)
+        return self.last_write_stats
+
+    def _align_pair_dtypes(self, df_pairs: pl.DataFrame, bk_name: BkName, schema: pl.Schema) -> pl.DataFrame:
+        """Cast BK columns of loaded pairs to the incoming dtypes, so native typed columns join as-is."""
+        casts = []
+        for c in bk_columns(bk_name):
+            if c not in df_pairs.columns or df_pairs.schema[c] == schema[c]:
+                continue
+            if df_pairs.schema[c] == pl.String and schema[c] == pl.Date:
+                casts.append(pl.col(c).str.to_date())
+            elif df_pairs.schema[c] == pl.String and isinstance(schema[c], pl.Datetime):
+                casts.append(pl.col(c).str.to_datetime(time_unit=schema[c].time_unit, time_zone=schema[c].time_zone))
+            else:
+                casts.append(pl.col(c).cast(schema[c]))
+        return df_pairs.with_columns(casts) if casts else df_pairs
+
+    @observed(PHASE_MERGE, measure=lambda self, _: self.df_incoming_modified)
+    def _merge_keys(self, df_existing_pk_bk_pair: pl.DataFrame, bk_name: Optional[BkName] = None, pk_name: Optional[str] = None) -> "KeyManager":
         """Merge dimension keys into incoming dataframe."""
         bk_name = bk_name or self.bk_name
         pk_name = pk_name or self.pk_name
+        df_existing_pk_bk_pair = self._align_pair_dtypes(df_existing_pk_bk_pair, bk_name, self.df_incoming_modified.schema)
+        stored_columns = {
+            c: f"{c}{STORED_SUFFIX}" for c in self.bk_source_columns
+            if bk_name == self.bk_name and c in df_existing_pk_bk_pair.columns
+        }
 
         self.df_incoming_modified = self.df_incoming_modified.join(
-            df_existing_pk_bk_pair,
-            on=bk_name,
+            df_existing_pk_bk_pair.rename(stored_columns),
+            on=bk_columns(bk_name),
             how="left",
         )
 
         if len(self.df_incoming_modified) > self._initial_length_incoming_df:
             raise MergeError(f"Row count changed after merge - possible duplicate keys in {self.table_name}")
 
+        if stored_columns:
+            self._check_hash_collisions(stored_columns, pk_name)
+            self.df_incoming_modified = self.df_incoming_modified.drop(list(stored_columns.values()))
+
         return self
+
+    def _check_hash_collisions(self, stored_columns: dict[str, str], pk_name: str) -> None:
+        """Matched rows must have the same BK source values as the stored row, compared as BK strings."""
+        def as_bk_str(c: str) -> pl.Expr:
+            return pl.col(c).cast(pl.String).fill_null("")
+
+        collision_mask = pl.col(pk_name).is_not_null() & pl.any_horizontal(
+            [as_bk_str(c) != as_bk_str(stored) for c, stored in stored_columns.items()]
+        )
+        collisions = self.df_incoming_modified.filter(collision_mask)
+        if len(collisions) > 0:
+            raise HashCollisionError(
+                f"Hashed business key collision in table '{self.table_name}' for {len(collisions)} rows. "
+                f"Business key column: '{self.bk_name}'. "
+                f"Sample colliding rows (incoming vs {STORED_SUFFIX}):\n{collisions.head(MAX_SAMPLE_ROWS)}"
+            )
+
+    def _check_unique_pairs(self, df_pairs: pl.DataFrame, bk_name: BkName, table_name: str) -> None:
+        """Streamed joins cannot compare row counts afterwards, so duplicate pairs are rejected up front."""
+        if df_pairs.select(bk_columns(bk_name)).is_duplicated().any():
+            raise MergeError(f"Duplicate business keys in existing key pairs of {table_name}")
+
+    def _load_plan_pairs(self) -> dict[Optional[str], pl.DataFrame]:
+        """Key pairs the key plan joins against; the table's own pairs are stored under None."""
+        df_pairs = self._load_existing_keys()
+        self._check_unique_pairs(df_pairs, self.bk_name, self.table_name)
+        return {None: df_pairs}
+
+    def _key_plan(self, lf: pl.LazyFrame, plan_pairs: dict[Optional[str], pl.DataFrame]) -> pl.LazyFrame:
+        """Lazy join of incoming rows against existing key pairs; new keys are numbered afterwards."""
+        bk_cols = bk_columns(self.bk_name)
+        df_pairs = self._align_pair_dtypes(plan_pairs[None].select([*bk_cols, self.pk_name]), bk_cols, lf.collect_schema())
+        return lf.join(df_pairs.lazy(), on=bk_cols, how="left", maintain_order="left")
+
+    def _new_key_count(self, lf: pl.LazyFrame, plan_pairs: dict[Optional[str], pl.DataFrame]) -> int:
+        """Rows of lf without an existing key; only the BK columns are joined."""
+        lf_bks = lf.select(bk_columns(self.bk_name))
+        return KeyManager._key_plan(self, lf_bks, plan_pairs).select(
+            pl.col(self.pk_name).is_null().sum()
+        ).collect(engine="streaming").item()
+
+    def _streaming_plan(self) -> pl.LazyFrame:
+        self._validate()
+        plan_pairs = self._load_plan_pairs()
+        count = None
+        if self.key_allocator is not None:
+            count = self._new_key_count(self.lf_incoming, plan_pairs)
+        self.initial_max_pk = self._reserve_keys(count)
+        return self._key_plan(self.lf_incoming, plan_pairs).with_columns(self._new_key_expr(self.initial_max_pk))
+
+    def process_batches(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[pl.DataFrame]:
+        """
+        Key LazyFrame or batch iterator input and yield the keyed output batch by batch.
+        For iterator input, duplicate BKs are checked against all earlier batches before a batch is yielded.
+        """
+        if not self.streaming:
+            raise KeysError("process_batches() requires LazyFrame or batch iterator input; use process() for a DataFrame")
+
+        if self.lf_incoming is not None:
+            yield from self._streaming_plan().collect_batches(chunk_size=batch_size, engine="streaming")
+            return
+
+        seen_bks = None
+        plan_pairs = None
+        batch_pairs = False
+        key_offset = None
+        for df_batch in self._incoming_batches:
+            df_batch, seen_bks = self._check_bk_value_batch(df_batch, seen_bks)
+            self._df_batch = df_batch
+            # full pairs are loaded once; pairs selected for one batch are not reused for the next
+            reload = self._batch_plan_pairs()
+            if plan_pairs is None or reload or batch_pairs:
+                plan_pairs = self._load_plan_pairs()
+                batch_pairs = reload
+            df_keyed = self._key_plan(df_batch.lazy(), plan_pairs).collect()
+            self._df_batch = None
+
+            new_count = df_keyed[self.pk_name].null_count()
+            if self.key_allocator is not None:
+                key_offset = self._reserve_keys(new_count)
+            elif key_offset is None:
+                key_offset = self._get_max_existing_key()
+            yield df_keyed.with_columns(self._new_key_expr(key_offset))
+            if self.key_allocator is None:
+                key_offset += new_count
+
+        if seen_bks is None or len(seen_bks) == 0:
+            raise BusinessKeyError(f"No valid business key values found in column '{self.bk_name}'")
+
+    def sink_parquet(self, path: str) -> None:
+        """Key LazyFrame input and stream the result to a Parquet file."""
+        if self.lf_incoming is None:
+            raise KeysError("sink_parquet() requires LazyFrame input; use process_batches() for batch iterators")
+        self._streaming_plan().sink_parquet(path, engine="streaming")
@@ -0,0 +1,67 @@
+from __future__ import annotations
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Optional, Union
+import polars as pl
+
+from .key_cache import CacheKey
+from .Errors import KeysError
+
+SNAPSHOT_SUFFIX = ".arrow"
+
+
+class KeySnapshotStore:
+    """
+    On-disk BK -> PK pair snapshots, one uncompressed Arrow IPC file per (table, bk_name, pk_name, key_condition).
+    Snapshots are opened memory-mapped, so a cold start in a new process costs a file open instead of
+    a table scan; KeyManager then only fetches rows with a PK above the snapshot's max PK and writes
+    the refreshed snapshot back.
+    Files are replaced atomically, so concurrent jobs see either the old or the new snapshot.
+    Usage:
+        store = KeySnapshotStore("/var/cache/keys")
+        fact = KeyFact("fact_sales", conn, df_fact, snapshot_store=store)
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: CacheKey) -> Path:
+        """Snapshot file for a key: the table name plus a digest of the full key."""
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+        return self.directory / f"{key[0]}_{digest}{SNAPSHOT_SUFFIX}"
+
+    def exists(self, key: CacheKey) -> bool:
+        return self.path(key).exists()
+
+    def load(self, key: CacheKey, pk_name: str) -> Optional[tuple[pl.DataFrame, int]]:
+        """Return (pairs, max_pk) from the snapshot, or None if there is none (local uncompressed IPC is memory-mapped)."""
+        path = self.path(key)
+        if not path.exists():
+            return None
+        try:
+            df_pairs = pl.read_ipc(path)
+        except Exception as e:
+            raise KeysError(f"Failed reading key snapshot {path}: {e}") from e
+        max_pk = df_pairs[pk_name].max() if len(df_pairs) > 0 else 0
+        return df_pairs, int(max_pk)
+
+    def save(self, key: CacheKey, df_pairs: pl.DataFrame) -> Path:
+        """Write the pairs uncompressed (required for memory mapping) and swap them in atomically."""
+        path = self.path(key)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            df_pairs.write_ipc(tmp_path, compression="uncompressed")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            tmp_path.unlink(missing_ok=True)
+            raise KeysError(f"Failed writing key snapshot {path}: {e}") from e
+        return path
+
+    def invalidate(self, table_name: Optional[str] = None) -> None:
+        """Delete all snapshots, or only those for one table."""
+        for path in self.directory.glob(f"*{SNAPSHOT_SUFFIX}"):
+            if table_name is None or path.stem.rsplit("_", 1)[0] == table_name:
+                path.unlink(missing_ok=True)
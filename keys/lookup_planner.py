@@ -0,0 +1,116 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from .key_manager import KeyManager, BkName
+
+LOOKUP_FULL = "full"
+LOOKUP_PUSHDOWN = "pushdown"
+LOOKUP_AUTO = "auto"
+LOOKUP_MODES = (LOOKUP_FULL, LOOKUP_PUSHDOWN, LOOKUP_AUTO)
+STRATEGY_CACHE = "cache"
+STRATEGY_SNAPSHOT = "snapshot"
+DEFAULT_PUSHDOWN_RATIO = 0.1
+DEFAULT_COUNT_TTL_S = 300.0
+PK_BYTES = 8
+
+
+@dataclass(frozen=True)
+class LookupPlan:
+    """How the key pairs of one table are loaded, with the estimates the choice was based on."""
+    table_name: str
+    bk_name: "BkName"
+    strategy: str
+    reason: str
+    dimension_rows: Optional[int] = None
+    incoming_bks: Optional[int] = None
+    estimated_rows: Optional[int] = None
+    estimated_bytes: Optional[int] = None
+
+    def __str__(self) -> str:
+        return (
+            f"{self.table_name} [{self.bk_name}]: {self.strategy} ({self.reason}); "
+            f"dimension rows={self.dimension_rows}, incoming BKs={self.incoming_bks}, "
+            f"est. rows={self.estimated_rows}, est. bytes={self.estimated_bytes}"
+        )
+
+
+class LookupPlanner:
+    """
+    Picks the key pair lookup per table: a cached or snapshotted entry is always refreshed rather than
+    reloaded; otherwise pushdown is chosen when the distinct incoming BKs are fewer than pushdown_ratio
+    times the table's rows, else a full scan. Table row counts come from a COUNT(*) query under the
+    manager's key_condition and pair predicates; it is cached per database for count_ttl_s seconds
+    and invalidated when a manager writes to the table.
+    Usage:
+        dim = KeyDimension("dim_sales", conn, df_dim, lookup_mode="auto")
+        for plan in dim.explain():
+            print(plan)
+    """
+
+    def __init__(self, pushdown_ratio: float = DEFAULT_PUSHDOWN_RATIO, count_ttl_s: float = DEFAULT_COUNT_TTL_S):
+        self.pushdown_ratio = pushdown_ratio
+        self.count_ttl_s = count_ttl_s
+        self._counts: dict[tuple[Optional[str], str, tuple[str, ...], str], tuple[int, float]] = {}
+        self._lock = Lock()
+
+    def table_rows(self, manager: "KeyManager", table_name: str) -> int:
+        """Cached row count of the table in the manager's database, under its key_condition and pair predicates."""
+        conditions, params = manager._pair_conditions(table_name)
+        count_key = (manager._database_url(), table_name, tuple(conditions), repr(sorted(params.items())))
+        with self._lock:
+            cached = self._counts.get(count_key)
+        if cached is not None and monotonic() - cached[1] < self.count_ttl_s:
+            return cached[0]
+
+        rows = manager._count_rows(table_name)
+        with self._lock:
+            self._counts[count_key] = (rows, monotonic())
+        return rows
+
+    def invalidate(self, table_name: Optional[str] = None) -> None:
+        with self._lock:
+            for count_key in [k for k in self._counts if table_name is None or k[1] == table_name]:
+                del self._counts[count_key]
+
+    def plan(self, manager: "KeyManager", table_name: str, pk_name: str, bk_name: "BkName", estimate: bool = False) -> LookupPlan:
+        """
+        Plan the lookup the manager will do for table_name. Fixed lookup modes only query the row
+        count when estimate is set (as explain() does); auto mode always needs it.
+        """
+        lookup_key = manager._lookup_key(table_name, pk_name, bk_name)
+        if manager.key_cache is not None and lookup_key in manager.key_cache:
+            strategy, reason = STRATEGY_CACHE, "cached pairs, refreshed with rows above the cached max key"
+        elif manager.snapshot_store is not None and manager.snapshot_store.exists(lookup_key):
+            strategy, reason = STRATEGY_SNAPSHOT, "snapshot on disk, refreshed with rows above its max key"
+        elif manager.lookup_mode != LOOKUP_AUTO:
+            strategy, reason = manager.lookup_mode, f"lookup_mode='{manager.lookup_mode}'"
+        else:
+            strategy, reason = None, ""
+        if strategy is not None and not estimate:
+            return LookupPlan(table_name, bk_name, strategy, reason)
+
+        df_bks = manager._incoming_bk_values(bk_name)
+        incoming_bks = df_bks.n_unique() if len(df_bks) > 0 else 0
+        dimension_rows = self.table_rows(manager, table_name)
+        if strategy is None:
+            if incoming_bks < self.pushdown_ratio * dimension_rows:
+                strategy, reason = LOOKUP_PUSHDOWN, f"{incoming_bks} incoming BKs < {self.pushdown_ratio:g} x {dimension_rows} rows"
+            else:
+                strategy, reason = LOOKUP_FULL, f"{incoming_bks} incoming BKs >= {self.pushdown_ratio:g} x {dimension_rows} rows"
+
+        estimated_rows = min(incoming_bks, dimension_rows) if strategy == LOOKUP_PUSHDOWN else dimension_rows
+        bk_bytes_per_row = df_bks.estimated_size() / len(df_bks) if len(df_bks) > 0 else 0
+        return LookupPlan(
+            table_name, bk_name, strategy, reason,
+            dimension_rows=dimension_rows,
+            incoming_bks=incoming_bks,
+            estimated_rows=estimated_rows,
+            estimated_bytes=round(estimated_rows * (bk_bytes_per_row + PK_BYTES)),
+        )
+
+
+SHARED_LOOKUP_PLANNER = LookupPlanner()
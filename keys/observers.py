@@ -0,0 +1,143 @@
+from __future__ import annotations
+import logging
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Optional, Sequence
+import polars as pl
+
+PHASE_VALIDATION = "validation"
+PHASE_KEY_LOAD = "key_load"
+PHASE_MERGE = "merge"
+PHASE_MAX_KEY = "max_key"
+PHASE_KEY_ASSIGNMENT = "key_assignment"
+PHASE_WRITE = "write"
+PHASE_DIMENSION_MAPPING = "dimension_mapping"
+PHASE_CHANGE_DETECTION = "change_detection"
+PHASE_PREFILTER = "prefilter"
+
+
+@dataclass(frozen=True)
+class KeyEvent:
+    """One timed step of a KeyManager pipeline."""
+    table_name: str
+    phase: str
+    duration_s: float
+    rows: Optional[int] = None
+    bytes: Optional[int] = None
+    detail: dict[str, Any] = field(default_factory=dict)
+
+
+class KeyObserver(ABC):
+    """Receives KeyEvents from KeyManager instances it is attached to (possibly from several threads)."""
+
+    @abstractmethod
+    def on_event(self, event: KeyEvent) -> None:
+        ...
+
+
+class InMemoryCollector(KeyObserver):
+    """Keeps all events in memory, e.g. for tests, benchmarks or a metrics push at the end of a job."""
+
+    def __init__(self):
+        self.events: list[KeyEvent] = []
+        self._lock = Lock()
+
+    def on_event(self, event: KeyEvent) -> None:
+        with self._lock:
+            self.events.append(event)
+
+    def seconds_by_phase(self) -> dict[str, float]:
+        totals: dict[str, float] = defaultdict(float)
+        for event in self.events:
+            totals[event.phase] += event.duration_s
+        return dict(totals)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.events.clear()
+
+
+class LoggingObserver(KeyObserver):
+    """Logs every event; the event fields are also attached to the record as extra={"key_event": {...}}."""
+
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("keys")
+        self.level = level
+
+    def on_event(self, event: KeyEvent) -> None:
+        self.logger.log(
+            self.level,
+            "%s %s took %.3fs (rows=%s, bytes=%s) %s",
+            event.table_name, event.phase, event.duration_s, event.rows, event.bytes, event.detail or "",
+            extra={"key_event": asdict(event)},
+        )
+
+
+class Observation:
+    """Times a block and emits a KeyEvent to all observers when it exits."""
+
+    def __init__(self, observers: Sequence[KeyObserver], table_name: str, phase: str, detail: dict[str, Any]):
+        self.observers = observers
+        self.table_name = table_name
+        self.phase = phase
+        self.detail = dict(detail)
+        self.rows: Optional[int] = None
+        self.bytes: Optional[int] = None
+
+    def record(self, df: Optional[pl.DataFrame] = None, rows: Optional[int] = None, **detail: Any) -> None:
+        self.detail.update(detail)
+        if df is not None:
+            self.rows = len(df)
+            self.bytes = df.estimated_size()
+        if rows is not None:
+            self.rows = rows
+
+    def __enter__(self) -> "Observation":
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        detail = self.detail if exc_type is None else {**self.detail, "error": exc_type.__name__}
+        event = KeyEvent(self.table_name, self.phase, perf_counter() - self._start, self.rows, self.bytes, detail)
+        for observer in self.observers:
+            observer.on_event(event)
+
+
+class NullObservation:
+    """Stand-in used when no observers are attached, so instrumentation costs one attribute check."""
+
+    def record(self, df: Optional[pl.DataFrame] = None, rows: Optional[int] = None, **detail: Any) -> None:
+        pass
+
+    def __enter__(self) -> "NullObservation":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NULL_OBSERVATION = NullObservation()
+
+
+def observed(phase: str, measure: Optional[Callable[[Any, Any], Optional[pl.DataFrame]]] = None):
+    """
+    Decorator for KeyManager methods: emits a KeyEvent for phase on every call when observers are attached.
+    measure(self, result) returns the frame whose rows and bytes are recorded.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.observers:
+                return method(self, *args, **kwargs)
+            detail = {"target_table": kwargs["dim_table"]} if kwargs.get("dim_table") else {}
+            with Observation(self.observers, self.table_name, phase, detail) as observation:
+                result = method(self, *args, **kwargs)
+                if measure is not None:
+                    observation.record(measure(self, result))
+            return result
+        return wrapper
+    return decorator
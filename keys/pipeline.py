@@ -0,0 +1,143 @@
+from __future__ import annotations
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional, Union
+import polars as pl
+from sqlalchemy.engine import Connection, Engine
+
+from .key_dimension import KeyDimension
+from .key_fact import KeyFact, ConnectionFactory
+from .key_manager import Connectable, bk_columns
+from .connection_pool import KeyConnectionPool, pool_for
+from .writer import WriteStats
+from .Errors import KeysError
+
+KeyNode = Union[KeyDimension, KeyFact]
+
+
+class KeyPipeline:
+    """
+    Runs dimensions and facts in dependency order: a fact depends on every registered dimension
+    it is related to (related_dimension / related_dimensions). Independent dimensions run in parallel,
+    and each fact starts as soon as its dimensions are done.
+    Key pairs of a finished dimension are handed to its facts through KeyFact.provide_dimension_keys,
+    so they are not read back from the db. This needs a full key pair load on the dimension (no pushdown
+    and no bk_filter_store) and no key_condition on the fact; otherwise the fact loads the pairs itself.
+    Usage:
+        pipeline = KeyPipeline(conn, connection_factory=engine, max_workers=4)
+        pipeline.add_dimension("dim_customer", df_customer)
+        pipeline.add_dimension("dim_product", df_product)
+        pipeline.add_fact("fact_sales", df_sales, "dim_customer", "dim_product")
+        results = pipeline.run()
+    With write=True (default) every dimension and fact is written with write_to_db() when processed.
+    With max_workers > 1 each node runs on its own connection from connection_factory, in its own transaction.
+    With an Engine or KeyConnectionPool as conn, those connections are checked out from its pool.
+    """
+
+    def __init__(
+        self,
+        conn: Connectable,
+        connection_factory: Optional[ConnectionFactory] = None,
+        max_workers: int = 1,
+        write: bool = True,
+    ):
+        if connection_factory is None and isinstance(conn, (Engine, KeyConnectionPool)):
+            connection_factory = (pool_for(conn) if isinstance(conn, Engine) else conn).connect
+        if max_workers > 1 and connection_factory is None:
+            raise KeysError("Parallel pipelines require a connection_factory (an Engine or a callable returning a Connection).")
+        self.conn = conn
+        self.connection_factory = connection_factory
+        self.max_workers = max_workers
+        self.write = write
+        self.nodes: dict[str, KeyNode] = {}
+        self.results: dict[str, pl.DataFrame] = {}
+        self.write_stats: dict[str, WriteStats] = {}
+
+    def add_dimension(self, table_name: str, df_incoming: pl.DataFrame, **dimension_kwargs) -> KeyDimension:
+        return self.add(KeyDimension(table_name, self.conn, df_incoming, **dimension_kwargs))
+
+    def add_fact(self, table_name: str, df_incoming: pl.DataFrame, *related_dimensions: str, **fact_kwargs) -> KeyFact:
+        """Create a KeyFact related to the given dimensions with default BK/PK names."""
+        fact = KeyFact(table_name, self.conn, df_incoming, **fact_kwargs)
+        fact.related_dimensions(*related_dimensions)
+        return self.add(fact)
+
+    def add(self, node: KeyNode) -> KeyNode:
+        """Add an already configured KeyDimension or KeyFact."""
+        if node.table_name in self.nodes:
+            raise KeysError(f"Table '{node.table_name}' is already part of the pipeline.")
+        self.nodes[node.table_name] = node
+        return node
+
+    def dependencies(self) -> dict[str, set[str]]:
+        """Registered dimensions each node waits for; dimensions that are not registered are read from the db."""
+        dimensions = {name for name, node in self.nodes.items() if isinstance(node, KeyDimension)}
+        return {
+            name: {m["dim_table"] for m in node.dim_mappings.values()} & dimensions if isinstance(node, KeyFact) else set()
+            for name, node in self.nodes.items()
+        }
+
+    def _connect(self) -> Connection:
+        return self.connection_factory.connect() if isinstance(self.connection_factory, Engine) else self.connection_factory()
+
+    def _process(self, node: KeyNode) -> pl.DataFrame:
+        df_keyed = node.process()
+        if self.write:
+            self.write_stats[node.table_name] = node.write_to_db()
+        return df_keyed
+
+    def _process_on_new_connection(self, node: KeyNode) -> pl.DataFrame:
+        with self._connect() as conn, conn.begin():
+            pipeline_conn, node.conn = node.conn, conn
+            try:
+                return self._process(node)
+            finally:
+                node.conn = pipeline_conn
+
+    def _dimension_pairs(self, dim: KeyDimension) -> Optional[pl.DataFrame]:
+        """All current BK -> PK pairs after processing: existing pairs with the incoming rows' keys on top."""
+        if dim.bk_filter_store is not None or dim._uses_pushdown(dim.table_name, dim.pk_name, dim.bk_name):
+            return None
+        pair_cols = [*bk_columns(dim.bk_name), dim.pk_name]
+        df_incoming_pairs = dim.df_incoming_modified.select(pair_cols)
+        df_existing_pairs = dim._align_pair_dtypes(dim.df_existing_pk_bk_pair.select(pair_cols), dim.bk_name, df_incoming_pairs.schema)
+        return pl.concat([
+            df_existing_pairs.join(df_incoming_pairs, on=bk_columns(dim.bk_name), how="anti"),
+            df_incoming_pairs,
+        ], how="vertical_relaxed")
+
+    def _hand_off(self, dim: KeyDimension) -> None:
+        df_pairs = self._dimension_pairs(dim)
+        if df_pairs is None:
+            return
+        dim_bk_cols = bk_columns(dim.bk_name)
+        for node in self.nodes.values():
+            if not isinstance(node, KeyFact) or node.key_condition:
+                continue
+            for dim_name, m in node.dim_mappings.items():
+                fact_bk_cols = bk_columns(m["bk_name"])
+                if m["dim_table"] != dim.table_name or len(fact_bk_cols) != len(dim_bk_cols):
+                    continue
+                node.provide_dimension_keys(dim_name, df_pairs.rename({
+                    **dict(zip(dim_bk_cols, fact_bk_cols)), dim.pk_name: m["key_name"],
+                }))
+
+    def run(self) -> dict[str, pl.DataFrame]:
+        """Process (and write) every node in dependency order; returns the keyed frames by table."""
+        pending = self.dependencies()
+        done: set[str] = set()
+        run_node = self._process if self.connection_factory is None else self._process_on_new_connection
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while pending or running:
+                for name in [name for name, needs in pending.items() if needs <= done]:
+                    del pending[name]
+                    running[pool.submit(run_node, self.nodes[name])] = name
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    self.results[name] = future.result()
+                    if isinstance(self.nodes[name], KeyDimension):
+                        self._hand_off(self.nodes[name])
+                    done.add(name)
+        return self.results
@@ -1,18 +1,83 @@
+from hashlib import blake2b
 import polars as pl
 
 from .key_manager import BK_SEP
 
+HASH_BITS = (64, 128)
+ROW_HASH_NULL = "\x00"
+
+
+def _bk_source_expr(df: pl.DataFrame, columns: tuple[str, ...]) -> pl.Expr:
+    if not columns:
+        raise ValueError("Must provide at least one column for business key.")
+    if columns_missing := [c for c in columns if c not in df.columns]:
+        raise ValueError(f"Business key source columns missing in incoming df: {columns_missing} \n columns available: {df.columns}")
+    return pl.concat_str(
+        [pl.col(c).cast(pl.String).fill_null("") for c in columns],
+        separator=BK_SEP,
+    )
+
+
 def add_bk_for_table(for_table: str, df: pl.DataFrame, *columns: str, bk_prefix="bk") -> pl.Expr:
     """
     Adds a business key related to a given table. The table can either be the table itself or a related table.
     Returns a Polars expression; use with df.with_columns(add_bk_for_table(...)).
     """
     bk_name = f"{bk_prefix}_{for_table}"
+    return _bk_source_expr(df, columns).alias(bk_name)
+
+
+def _blake2b_values(values: pl.Series, bits: int) -> pl.Series:
+    digests = [blake2b(v, digest_size=bits // 8).digest() for v in values.cast(pl.Binary).to_list()]
+    if bits == 64:
+        return pl.Series(values.name, [int.from_bytes(d, "big", signed=True) for d in digests], dtype=pl.Int64)
+    return pl.Series(values.name, digests, dtype=pl.Binary)
+
+
+def hash_bk_values(bk_values: pl.Series, bits: int = 64) -> pl.Series:
+    """
+    Stable BLAKE2b hash of string BK values; the same across processes and library versions, so it can be stored.
+    64 bits gives a signed Int64 (fits BIGINT columns), 128 bits gives 16-byte Binary values.
+    Only distinct values are hashed, so repeated BKs (e.g. dimension BKs in fact rows) are cheap. Nulls stay null.
+    """
+    if bits not in HASH_BITS:
+        raise ValueError(f"bits must be one of {HASH_BITS}, got {bits}")
+    uniques = bk_values.drop_nulls().unique()
+    if len(uniques) == len(bk_values):
+        return _blake2b_values(bk_values, bits)
+    df_hashes = pl.DataFrame({"value": uniques, "hash": _blake2b_values(uniques, bits)})
+    return (
+        bk_values.to_frame("value")
+        .join(df_hashes, on="value", how="left", maintain_order="left")
+        .to_series(1)
+        .alias(bk_values.name)
+    )
+
+
+def add_hashed_bk_for_table(for_table: str, df: pl.DataFrame, *columns: str, bits: int = 64, bk_prefix="bk") -> pl.Expr:
+    """
+    Like add_bk_for_table, but the BK is a fixed-width hash of the concatenated BK string.
+    The hash is stable across processes and library versions, so it can be stored in the table.
+    Pass the source columns as bk_source_columns to KeyDimension/KeyFact to detect collisions
+    against the source values stored alongside the hashed BK.
+    """
+    if bits not in HASH_BITS:
+        raise ValueError(f"bits must be one of {HASH_BITS}, got {bits}")
+    bk_name = f"{bk_prefix}_{for_table}"
+    return _bk_source_expr(df, columns).map_batches(
+        lambda s: hash_bk_values(s, bits),
+        return_dtype=pl.Int64 if bits == 64 else pl.Binary,
+    ).alias(bk_name)
+
+
+def row_hash_expr(*columns: str, hash_name: str = "row_hash") -> pl.Expr:
+    """
+    Stable 64-bit BLAKE2b hash over attribute columns (see hash_bk_values), for change detection against a
+    stored hash. Nulls hash differently from empty strings.
+    """
     if not columns:
-        raise ValueError("Must provide at least one column for business key.")
-    if columns_missing := [c for c in columns if c not in df.columns]:
-        raise ValueError(f"Business key source columns missing in incoming df: {columns_missing} \n columns available: {df.columns}")
+        raise ValueError("Must provide at least one column for the row hash.")
     return pl.concat_str(
-        [pl.col(c).cast(pl.String).fill_null("") for c in columns],
+        [pl.col(c).cast(pl.String).fill_null(ROW_HASH_NULL) for c in columns],
         separator=BK_SEP,
-    ).alias(bk_name)
+    ).map_batches(lambda s: hash_bk_values(s, 64), return_dtype=pl.Int64).alias(hash_name)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from io import StringIO
+from time import perf_counter
+import polars as pl
+from sqlalchemy import bindparam, column, insert, table, update
+from sqlalchemy.engine import Connection
+
+from .Errors import DatabaseError
+
+DEFAULT_WRITE_CHUNK_SIZE = 10_000
+WRITE_AUTO = "auto"
+WRITE_COPY = "copy"
+WRITE_EXECUTEMANY = "executemany"
+WRITE_VALUES = "values"
+WRITE_METHODS = (WRITE_AUTO, WRITE_COPY, WRITE_EXECUTEMANY, WRITE_VALUES)
+COPY_NULL = "\\N"
+
+
+@dataclass
+class WriteStats:
+    """Outcome of a bulk write."""
+    table_name: str
+    rows: int
+    seconds: float
+    method: str
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+def _resolve_method(conn: Connection, method: str) -> str:
+    if method not in WRITE_METHODS:
+        raise ValueError(f"method must be one of {WRITE_METHODS}, got '{method}'")
+    if method != WRITE_AUTO:
+        return method
+    if conn.dialect.name == "postgresql":
+        return WRITE_COPY
+    return WRITE_EXECUTEMANY
+
+
+def _table_clause(table_name: str, columns: list[str]):
+    schema, _, name = table_name.rpartition(".")
+    return table(name, *[column(c) for c in columns], schema=schema or None)
+
+
+def _copy_chunk(conn: Connection, table_name: str, df_chunk: pl.DataFrame) -> None:
+    """PostgreSQL COPY FROM STDIN, for psycopg2 (copy_expert) and psycopg 3 (cursor.copy)."""
+    copy_sql = (
+        f"COPY {table_name} ({', '.join(df_chunk.columns)}) FROM STDIN "
+        f"WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    )
+    data = df_chunk.write_csv(include_header=False, null_value=COPY_NULL)
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            cursor.copy_expert(copy_sql, StringIO(data))
+        else:
+            with cursor.copy(copy_sql) as copy:
+                copy.write(data)
+    finally:
+        cursor.close()
+
+
+def _transaction(conn: Connection):
+    """A transaction, or a savepoint in the caller's open transaction, so a failed write is undone either way."""
+    return conn.begin_nested() if conn.in_transaction() else conn.begin()
+
+
+def write_rows(
+    conn: Connection,
+    table_name: str,
+    df: pl.DataFrame,
+    chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE,
+    method: str = WRITE_AUTO,
+) -> WriteStats:
+    """
+    Bulk insert df into table_name in chunks of chunk_size rows.
+    Methods:
+        copy:        PostgreSQL COPY (default for postgresql)
+        executemany: one parameterised INSERT executed for all rows of a chunk (default otherwise)
+        values:      one multi-row INSERT ... VALUES statement per chunk
+    All chunks are written in one transaction; if conn already has an open transaction they are written
+    in a savepoint of it, which is rolled back on failure and otherwise left to the caller to commit.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    method = _resolve_method(conn, method)
+    start = perf_counter()
+    if len(df) == 0:
+        return WriteStats(table_name, 0, 0.0, method)
+
+    stmt = insert(_table_clause(table_name, df.columns))
+    transaction = _transaction(conn)
+    try:
+        with transaction:
+            for df_chunk in df.iter_slices(chunk_size):
+                if method == WRITE_COPY:
+                    _copy_chunk(conn, table_name, df_chunk)
+                elif method == WRITE_VALUES:
+                    conn.execute(stmt.values(df_chunk.to_dicts()))
+                else:
+                    conn.execute(stmt, df_chunk.to_dicts())
+    except Exception as e:
+        raise DatabaseError(f"Failed writing {len(df)} rows to {table_name} using {method}: {e}") from e
+
+    return WriteStats(table_name, len(df), perf_counter() - start, method)
+
+
+def update_rows(
+    conn: Connection,
+    table_name: str,
+    df: pl.DataFrame,
+    key_columns: list[str],
+    chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE,
+) -> WriteStats:
+    """
+    Bulk update table_name from df: each row sets the non-key columns of the row matching its key columns.
+    One parameterised UPDATE is executed for all rows of a chunk, in one transaction (a savepoint if
+    conn already has an open transaction, as in write_rows).
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    start = perf_counter()
+    if len(df) == 0:
+        return WriteStats(table_name, 0, 0.0, WRITE_EXECUTEMANY)
+
+    # bind names must differ from column names in an UPDATE
+    df = df.rename({c: f"u_{c}" for c in df.columns})
+    tbl = _table_clause(table_name, [c[2:] for c in df.columns])
+    value_columns = [c[2:] for c in df.columns if c[2:] not in key_columns]
+    stmt = update(tbl).values({c: bindparam(f"u_{c}") for c in value_columns})
+    for c in key_columns:
+        stmt = stmt.where(tbl.c[c] == bindparam(f"u_{c}"))
+
+    transaction = _transaction(conn)
+    try:
+        with transaction:
+            for df_chunk in df.iter_slices(chunk_size):
+                conn.execute(stmt, df_chunk.to_dicts())
+    except Exception as e:
+        raise DatabaseError(f"Failed updating {len(df)} rows in {table_name}: {e}") from e
+
+    return WriteStats(table_name, len(df), perf_counter() - start, WRITE_EXECUTEMANY)
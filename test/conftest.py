@@ -6,7 +6,9 @@ from sqlalchemy.engine import Connection
 
 @pytest.fixture
 def mock_conn():
-    return Mock(spec=Connection)
+    conn = Mock(spec=Connection)
+    conn.engine = Mock(url="sqlite://")  # instance attribute, not part of the spec
+    return conn
 
 
 @pytest.fixture
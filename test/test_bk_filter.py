@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import pytest
+import polars as pl
+from sqlalchemy import create_engine, text
+
+from keys.bk_filter import BloomFilter, BloomFilterStore
+from keys.key_dimension import KeyDimension
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dim.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE dim_customer (bk_dim_customer TEXT, key_dim_customer INTEGER)"))
+        conn.execute(text("INSERT INTO dim_customer VALUES ('a', 1), ('b', 2), ('c', 3)"))
+    return engine
+
+
+class TestBloomFilter:
+
+    def test_no_false_negatives_and_low_fp_rate(self):
+        bloom = BloomFilter(10_000, fp_rate=0.01)
+        added = pl.Series([f"bk{i}" for i in range(10_000)])
+        bloom.add(added)
+
+        assert bloom.might_contain(added).all()
+        others = pl.Series([f"other{i}" for i in range(10_000)])
+        assert bloom.might_contain(others).mean() < 0.03
+
+    def test_store_roundtrip_and_version_mismatch(self, tmp_path):
+        store = BloomFilterStore(tmp_path)
+        key = ("dim_customer", "bk_dim_customer", "key_dim_customer", None)
+        bloom = BloomFilter(100, max_pk=7)
+        bloom.add(pl.Series(["a", "b"]))
+        store.save(key, bloom)
+
+        loaded = store.load(key)
+        assert (loaded.count, loaded.max_pk) == (2, 7)
+        assert loaded.might_contain(pl.Series(["a", "b"])).all()
+
+        meta_path = next(tmp_path.glob("*.bloom.json"))
+        meta_path.write_text(json.dumps({**json.loads(meta_path.read_text()), "polars_version": "0.0.1"}))
+        assert store.load(key) is None
+
+    def test_store_invalidate_deletes_bits_and_parameters(self, tmp_path):
+        store = BloomFilterStore(tmp_path)
+        store.save(("dim_customer", "bk_dim_customer", "key_dim_customer", None), BloomFilter(100))
+        store.save(("dim_date", "bk_dim_date", "key_dim_date", None), BloomFilter(100))
+
+        store.invalidate("dim_customer")
+
+        remaining = [p.name for p in tmp_path.iterdir()]
+        assert len(remaining) == 2
+        assert all(name.startswith("dim_date_") for name in remaining)
+
+
+class TestKeyDimensionPrefilter:
+
+    def test_only_maybe_existing_bks_are_looked_up(self, tmp_path, engine):
+        store = BloomFilterStore(tmp_path / "filters")
+        with engine.begin() as conn:
+            dim = KeyDimension("dim_customer", conn, pl.DataFrame({"bk_dim_customer": ["a", "x", "y"]}), bk_filter_store=store)
+            df_result = dim.process()
+            dim.write_to_db()
+
+        assert df_result["key_dim_customer"].to_list() == [1, 4, 5]
+        assert dim.prefilter_counts == {"maybe_existing": 1, "definitely_new": 2}
+
+        with engine.begin() as conn:
+            dim = KeyDimension("dim_customer", conn, pl.DataFrame({"bk_dim_customer": ["y", "z"]}), bk_filter_store=store)
+            df_result = dim.process()
+
+        # the filter picked up the rows written by the first run from the delta since its max key
+        assert df_result["key_dim_customer"].to_list() == [5, 6]
+        assert dim.prefilter_counts == {"maybe_existing": 1, "definitely_new": 1}
+
+    def test_rows_committed_below_max_pk_rebuild_filter(self, tmp_path, engine):
+        store = BloomFilterStore(tmp_path / "filters")
+        with engine.begin() as conn:
+            KeyDimension("dim_customer", conn, pl.DataFrame({"bk_dim_customer": ["a"]}), bk_filter_store=store).process()
+            conn.execute(text("INSERT INTO dim_customer VALUES ('late', 0)"))
+
+        with engine.begin() as conn:
+            dim = KeyDimension("dim_customer", conn, pl.DataFrame({"bk_dim_customer": ["late", "new"]}), bk_filter_store=store)
+            df_result = dim.process()
+
+        assert df_result["key_dim_customer"].to_list() == [0, 4]
+        assert dim.prefilter_counts == {"maybe_existing": 1, "definitely_new": 1}
+
+    def test_process_async_uses_filter(self, tmp_path):
+        pytest.importorskip("aiosqlite")
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        async def run() -> KeyDimension:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'dim.db'}")
+            try:
+                async with engine.begin() as conn:
+                    await conn.execute(text("CREATE TABLE dim_customer (bk_dim_customer TEXT, key_dim_customer INTEGER)"))
+                    await conn.execute(text("INSERT INTO dim_customer VALUES ('a', 1), ('b', 2)"))
+                dim = KeyDimension("dim_customer", None, pl.DataFrame({"bk_dim_customer": ["b", "x"]}), bk_filter_store=BloomFilterStore(tmp_path / "filters"))
+                await dim.process_async(engine)
+                return dim
+            finally:
+                await engine.dispose()
+
+        dim = asyncio.run(run())
+
+        assert dim.df_incoming_modified["key_dim_customer"].to_list() == [2, 3]
+        assert dim.prefilter_counts == {"maybe_existing": 1, "definitely_new": 1}
@@ -0,0 +1,107 @@
+import gc
+import threading
+
+import pytest
+import polars as pl
+from sqlalchemy import create_engine, text
+
+from keys.connection_pool import _ENGINE_POOLS, KeyConnectionPool, cached_statement, pool_for
+from keys.key_dimension import KeyDimension
+from keys.key_fact import KeyFact
+from keys.Errors import DatabaseError
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'keys.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE dim_customer (bk_dim_customer TEXT, key_dim_customer INTEGER)"))
+        conn.execute(text("INSERT INTO dim_customer VALUES ('c1', 1), ('c2', 2)"))
+        conn.execute(text("CREATE TABLE dim_date (bk_dim_date TEXT, key_dim_date INTEGER)"))
+        conn.execute(text("INSERT INTO dim_date VALUES ('d1', 1)"))
+        conn.execute(text("CREATE TABLE fact_sales (bk_fact_sales TEXT, key_fact_sales INTEGER)"))
+    return engine
+
+
+class TestKeyConnectionPool:
+
+    def test_dimension_checks_out_per_query(self, engine):
+        pool = KeyConnectionPool(engine)
+        dim = KeyDimension("dim_customer", pool, pl.DataFrame({"bk_dim_customer": ["c2", "c3"]}))
+
+        df_result = dim.process()
+        dim.write_to_db()
+
+        stats = pool.stats()
+        assert df_result["key_dim_customer"].to_list() == [2, 3]
+        assert dim.conn is None
+        assert stats.checkouts == 3  # key pairs, max key, write
+        assert stats.in_use == 0
+        assert stats.peak_in_use == 1
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM dim_customer")).scalar() == 3
+
+    def test_engine_shares_pool_across_managers(self, engine):
+        fact = KeyFact("fact_sales", engine, pl.DataFrame({"bk_fact_sales": ["s1"], "bk_dim_customer": ["c1"], "bk_dim_date": ["d9"]}))
+        fact.related_dimensions("dim_customer", "dim_date")
+        dim = KeyDimension("dim_date", engine, pl.DataFrame({"bk_dim_date": ["d1"]}))
+
+        df_result = fact.process()
+
+        assert fact.pool is dim.pool is pool_for(engine)
+        assert df_result["key_dim_customer"].to_list() == [1]
+        assert df_result["key_dim_date"].to_list() == [-1]
+        assert pool_for(engine).stats().checkouts == 4  # own pairs, two dimensions, max key
+
+    def test_engine_pool_dropped_with_engine(self, tmp_path):
+        dim = KeyDimension("dim_date", create_engine(f"sqlite:///{tmp_path / 'other.db'}"), pl.DataFrame({"bk_dim_date": ["d1"]}))
+        gc.collect()
+        assert dim.pool.engine.url.database.endswith("other.db")  # kept alive by the manager
+        pools = len(_ENGINE_POOLS)
+
+        del dim
+        gc.collect()
+
+        assert len(_ENGINE_POOLS) == pools - 1
+
+    def test_max_connections_times_out(self, engine):
+        pool = KeyConnectionPool(engine, max_connections=1, timeout=0.05)
+        with pool.connect():
+            with pytest.raises(DatabaseError, match="No connection available"):
+                with pool.connect():
+                    pass
+        with pool.connect() as conn:
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+
+    def test_stats_wait_and_utilization(self, engine):
+        pool = KeyConnectionPool(engine, max_connections=1, timeout=5)
+        held, release = threading.Event(), threading.Event()
+
+        def hold():
+            with pool.connect():
+                held.set()
+                release.wait(5)
+
+        worker = threading.Thread(target=hold)
+        worker.start()
+        held.wait(5)
+        threading.Timer(0.05, release.set).start()
+        with pool.connect():
+            pass
+        worker.join()
+
+        stats = pool.stats()
+        assert stats.checkouts == 2
+        assert stats.capacity == 1
+        assert stats.max_wait_seconds >= 0.04
+        assert 0 < stats.utilization <= 1
+
+    def test_capacity_from_engine_pool(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'sized.db'}", pool_size=3, max_overflow=2)
+        assert KeyConnectionPool(engine).capacity == 5
+        assert KeyConnectionPool(engine, max_connections=2).capacity == 2
+
+    def test_cached_statement(self):
+        query = "SELECT bk, pk FROM dim WHERE bk IN :bk_values"
+        assert cached_statement(query, ("bk_values",)) is cached_statement(query, ("bk_values",))
+        assert cached_statement(query) is not cached_statement(query, ("bk_values",))
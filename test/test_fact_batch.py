@@ -0,0 +1,118 @@
+from typing import Optional
+from unittest.mock import patch
+
+import pytest
+import polars as pl
+from sqlalchemy import create_engine, text
+
+from keys.fact_batch import KeyFactBatch
+from keys.key_fact import KeyFact
+from keys.Errors import KeysError
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'facts.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE dim_date (bk_dim_date TEXT, key_dim_date INTEGER)"))
+        conn.execute(text("INSERT INTO dim_date VALUES ('2024-01-01', 1), ('2024-01-02', 2)"))
+        conn.execute(text("CREATE TABLE dim_customer (bk_dim_customer TEXT, key_dim_customer INTEGER)"))
+        conn.execute(text("INSERT INTO dim_customer VALUES ('c1', 10), ('c2', 20), ('c3', 30)"))
+        for fact in ["fact_sales", "fact_returns"]:
+            conn.execute(text(f"CREATE TABLE {fact} (bk_{fact} TEXT, key_{fact} INTEGER)"))
+    return engine
+
+
+def _dim_queries(mock_read_database, dim_table: str) -> int:
+    return sum(f"FROM {dim_table}" in str(c.args[0]) for c in mock_read_database.call_args_list)
+
+
+def _fill_batch(batch: KeyFactBatch, sales_kwargs: Optional[dict] = None, **fact_kwargs) -> None:
+    batch.add("fact_sales", pl.DataFrame({
+        "bk_fact_sales": ["s1", "s2"], "bk_dim_date": ["2024-01-01", "2024-01-02"], "bk_dim_customer": ["c1", "c9"],
+    }), "dim_date", "dim_customer", **{**fact_kwargs, **(sales_kwargs or {})})
+    batch.add("fact_returns", pl.DataFrame({
+        "bk_fact_returns": ["r1"], "bk_dim_date": ["2024-01-02"], "bk_dim_customer": ["c3"],
+    }), "dim_date", "dim_customer", **fact_kwargs)
+
+
+class TestKeyFactBatch:
+
+    def test_dimension_lookups_deduplicated(self, engine):
+        with engine.connect() as conn:
+            batch = KeyFactBatch(conn)
+            _fill_batch(batch)
+
+            lookups = batch.dimension_lookups()
+
+        assert {key[:4] for key in lookups} == {
+            ("dim_date", "bk_dim_date", "key_dim_date", None),
+            ("dim_customer", "bk_dim_customer", "key_dim_customer", None),
+        }
+        assert all(len(users) == 2 for users in lookups.values())
+
+    def test_dimension_lookups_split_by_lookup_settings(self, engine):
+        with engine.connect() as conn:
+            batch = KeyFactBatch(conn)
+            _fill_batch(batch, sales_kwargs={"lookup_mode": "pushdown"})
+
+            lookups = batch.dimension_lookups()
+
+        assert len(lookups) == 4
+        assert all(len(users) == 1 for users in lookups.values())
+
+    @pytest.mark.parametrize("lookup_mode", ["full", "pushdown"])
+    def test_process_loads_each_dimension_once(self, engine, lookup_mode):
+        with engine.connect() as conn, patch("polars.read_database", wraps=pl.read_database) as mock_read_database:
+            batch = KeyFactBatch(conn)
+            _fill_batch(batch, lookup_mode=lookup_mode)
+            results = batch.process()
+
+            assert _dim_queries(mock_read_database, "dim_date") == 1
+            assert _dim_queries(mock_read_database, "dim_customer") == 1
+        assert results["fact_sales"]["key_dim_customer"].to_list() == [10, -1]
+        assert results["fact_returns"]["key_dim_customer"].to_list() == [30]
+        assert results["fact_returns"]["key_dim_date"].to_list() == [2]
+
+    def test_process_infers_shared_missing_member_once(self, engine):
+        with engine.begin() as conn:
+            batch = KeyFactBatch(conn)
+            for table_name, bk in [("fact_sales", "s1"), ("fact_returns", "r1")]:
+                fact = KeyFact(table_name, conn, pl.DataFrame({f"bk_{table_name}": [bk], "bk_dim_customer": ["c9"]}))
+                batch.add_fact(fact.related_dimension("dim_customer", infer_missing=True))
+            results = batch.process()
+
+        assert results["fact_sales"]["key_dim_customer"].to_list() == [31]
+        assert results["fact_returns"]["key_dim_customer"].to_list() == [31]
+        assert batch.inferred_members["dim_customer"]["bk_dim_customer"].to_list() == ["c9"]
+        assert "dim_customer" not in batch.facts["fact_returns"].inferred_members
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM dim_customer WHERE bk_dim_customer = 'c9'")).scalar() == 1
+
+    def test_process_concurrent_infers_union_of_missing_members(self, engine):
+        with engine.connect() as conn:
+            batch = KeyFactBatch(conn, connection_factory=engine, max_workers=2)
+            for table_name, bks in [("fact_sales", ["c8", "c9"]), ("fact_returns", ["c9", "c7"])]:
+                df = pl.DataFrame({f"bk_{table_name}": [f"{table_name}{i}" for i in range(2)], "bk_dim_customer": bks})
+                batch.add_fact(KeyFact(table_name, conn, df).related_dimension("dim_customer", infer_missing=True))
+            results = batch.process()
+
+        assert results["fact_sales"]["key_dim_customer"].to_list() == [31, 32]
+        assert results["fact_returns"]["key_dim_customer"].to_list() == [32, 33]
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT bk_dim_customer, key_dim_customer FROM dim_customer WHERE key_dim_customer > 30")).all()
+            assert sorted(rows) == [("c7", 33), ("c8", 31), ("c9", 32)]
+
+    def test_process_concurrent(self, engine):
+        with engine.connect() as conn:
+            batch = KeyFactBatch(conn, connection_factory=engine, max_workers=2)
+            _fill_batch(batch)
+            results = batch.process()
+
+        assert results["fact_sales"]["key_fact_sales"].to_list() == [1, 2]
+        assert results["fact_sales"]["key_dim_date"].to_list() == [1, 2]
+        assert batch.facts["fact_sales"].conn is conn
+
+    def test_concurrent_requires_connection_factory(self, engine):
+        with pytest.raises(KeysError, match="requires a connection_factory"):
+            KeyFactBatch(engine.connect(), max_workers=4)
@@ -0,0 +1,72 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+import polars as pl
+from sqlalchemy import create_engine, text
+
+from keys.key_allocator import ControlTableAllocator, SequenceAllocator
+from keys.key_dimension import KeyDimension
+from keys.Errors import DatabaseError
+
+
+def _load_partition(db_url: str, bks: list[str]) -> list[int]:
+    """Worker: key one partition of dim_par and write it, sharing the dimension with other workers."""
+    engine = create_engine(db_url, connect_args={"timeout": 30})
+    allocator = ControlTableAllocator(engine)
+    with engine.connect() as conn:
+        dim = KeyDimension("dim_par", conn, pl.DataFrame({"bk_dim_par": bks}), key_allocator=allocator)
+        df_result = dim.process()
+        dim.write_to_db()
+        conn.commit()
+    engine.dispose()
+    return df_result["key_dim_par"].to_list()
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    url = f"sqlite:///{tmp_path / 'keys.db'}"
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE dim_par (bk_dim_par TEXT, key_dim_par INTEGER)"))
+        conn.execute(text("INSERT INTO dim_par VALUES ('existing_1', 1), ('existing_2', 7)"))
+    engine.dispose()
+    return url
+
+
+class TestControlTableAllocator:
+
+    def test_reserve_seeds_from_max_key(self, db_url):
+        allocator = ControlTableAllocator(create_engine(db_url))
+
+        assert allocator.reserve("dim_par", "key_dim_par", 5) == 7
+        assert allocator.reserve("dim_par", "key_dim_par", 3) == 12
+
+    def test_process_uses_reserved_block(self, db_url):
+        allocator = ControlTableAllocator(create_engine(db_url))
+        allocator.reserve("dim_par", "key_dim_par", 10)
+
+        keys = _load_partition(db_url, ["existing_1", "new_a", "new_b"])
+
+        assert keys == [1, 18, 19]
+
+    def test_parallel_processes_get_disjoint_keys(self, db_url):
+        partitions = [[f"p{p}_{i}" for i in range(50)] for p in range(4)]
+        ctx = multiprocessing.get_context("spawn")
+
+        with ProcessPoolExecutor(max_workers=4, mp_context=ctx) as pool:
+            results = list(pool.map(_load_partition, [db_url] * len(partitions), partitions))
+
+        all_keys = [k for keys in results for k in keys]
+        assert len(set(all_keys)) == 200
+        assert min(all_keys) == 8
+        with create_engine(db_url).connect() as conn:
+            stored = conn.execute(text("SELECT COUNT(DISTINCT key_dim_par), COUNT(*) FROM dim_par")).one()
+        assert stored == (202, 202)
+
+
+class TestSequenceAllocator:
+
+    def test_requires_postgresql(self, db_url):
+        with pytest.raises(DatabaseError, match="SequenceAllocator requires postgresql"):
+            SequenceAllocator(create_engine(db_url))
@@ -0,0 +1,55 @@
+import polars as pl
+
+from keys.key_cache import KeyCache
+
+
+def _pairs(n: int, start: int = 1) -> pl.DataFrame:
+    return pl.DataFrame({"bk_dim": [str(i) for i in range(start, start + n)], "key_dim": list(range(start, start + n))})
+
+
+class TestKeyCache:
+
+    def test_get_miss_then_hit(self):
+        cache = KeyCache()
+        key = ("dim", "bk_dim", "key_dim", None)
+
+        assert cache.get(key) is None
+        cache.put(key, _pairs(3), "key_dim")
+        df_cached, max_pk = cache.get(key)
+
+        assert max_pk == 3
+        assert df_cached.equals(_pairs(3))
+        assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1, "rows": 3}
+
+    def test_key_condition_is_part_of_key(self):
+        cache = KeyCache()
+        cache.put(("dim", "bk_dim", "key_dim", None), _pairs(3), "key_dim")
+
+        assert cache.get(("dim", "bk_dim", "key_dim", "active = 1")) is None
+
+    def test_lru_eviction_by_rows(self):
+        cache = KeyCache(max_rows=5)
+        cache.put(("a", "bk", "key_dim", None), _pairs(2), "key_dim")
+        cache.put(("b", "bk", "key_dim", None), _pairs(2), "key_dim")
+        cache.get(("a", "bk", "key_dim", None))
+        cache.put(("c", "bk", "key_dim", None), _pairs(2), "key_dim")
+
+        assert cache.get(("b", "bk", "key_dim", None)) is None
+        assert cache.get(("a", "bk", "key_dim", None)) is not None
+        assert cache.rows == 4
+
+    def test_oversized_entry_not_cached(self):
+        cache = KeyCache(max_rows=2)
+        cache.put(("a", "bk", "key_dim", None), _pairs(3), "key_dim")
+
+        assert len(cache) == 0
+        assert cache.rows == 0
+
+    def test_invalidate_table(self):
+        cache = KeyCache()
+        cache.put(("a", "bk", "key_dim", None), _pairs(2), "key_dim")
+        cache.put(("b", "bk", "key_dim", None), _pairs(2), "key_dim")
+        cache.invalidate("a")
+
+        assert len(cache) == 1
+        assert cache.rows == 2
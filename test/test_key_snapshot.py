@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+import pytest
+import polars as pl
+from sqlalchemy import create_engine, text
+
+from keys.key_manager import KeyManager
+from keys.key_snapshot import KeySnapshotStore
+
+
+def _pairs(n: int, start: int = 1) -> pl.DataFrame:
+    return pl.DataFrame({"bk_dim": [str(i) for i in range(start, start + n)], "key_dim": list(range(start, start + n))})
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'keys.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE dim (bk_dim TEXT, key_dim INTEGER)"))
+        conn.execute(text("INSERT INTO dim VALUES ('a', 1), ('b', 2), ('c', 3)"))
+    return engine
+
+
+class TestKeySnapshotStore:
+
+    def test_save_and_load(self, tmp_path):
+        store = KeySnapshotStore(tmp_path / "snapshots")
+        key = ("dim", "bk_dim", "key_dim", None)
+
+        assert store.load(key, "key_dim") is None
+        store.save(key, _pairs(4))
+        df_pairs, max_pk = store.load(key, "key_dim")
+
+        assert max_pk == 4
+        assert df_pairs.equals(_pairs(4))
+        assert store.load(("dim", "bk_dim", "key_dim", "active = 1"), "key_dim") is None
+
+    def test_invalidate_table(self, tmp_path):
+        store = KeySnapshotStore(tmp_path)
+        store.save(("dim", "bk_dim", "key_dim", None), _pairs(2))
+        store.save(("dim_customer", "bk_dim", "key_dim", None), _pairs(2))
+
+        store.invalidate("dim")
+
+        assert store.load(("dim", "bk_dim", "key_dim", None), "key_dim") is None
+        assert store.load(("dim_customer", "bk_dim", "key_dim", None), "key_dim") is not None
+
+    def test_key_manager_delta_sync(self, tmp_path, engine):
+        """A new process opens the snapshot and only reads rows added after its max key."""
+        df_incoming = pl.DataFrame({"bk_dim": ["a", "d"]})
+        with engine.connect() as conn:
+            first = KeyManager("dim", conn, df_incoming, snapshot_store=KeySnapshotStore(tmp_path))
+            assert first._load_existing_keys()["key_dim"].to_list() == [1, 2, 3]
+
+            conn.execute(text("INSERT INTO dim VALUES ('d', 4)"))
+            second = KeyManager("dim", conn, df_incoming, snapshot_store=KeySnapshotStore(tmp_path))
+            with patch("polars.read_database", wraps=pl.read_database) as mock_read_database:
+                df_pairs = second._load_existing_keys()
+
+        assert df_pairs["key_dim"].to_list() == [1, 2, 3, 4]
+        assert mock_read_database.call_count == 1
+        assert "key_dim > :min_pk" in str(mock_read_database.call_args.args[0])
+        assert KeySnapshotStore(tmp_path).load(second._lookup_key("dim", "key_dim", "bk_dim"), "key_dim")[1] == 4
+
+    def test_snapshot_not_shared_between_databases(self, tmp_path, engine):
+        other = create_engine(f"sqlite:///{tmp_path / 'other.db'}")
+        with other.begin() as conn:
+            conn.execute(text("CREATE TABLE dim (bk_dim TEXT, key_dim INTEGER)"))
+            conn.execute(text("INSERT INTO dim VALUES ('a', 7)"))
+        store = KeySnapshotStore(tmp_path / "snapshots")
+        df_incoming = pl.DataFrame({"bk_dim": ["a"]})
+
+        with engine.connect() as conn, other.connect() as other_conn:
+            KeyManager("dim", conn, df_incoming, snapshot_store=store)._load_existing_keys()
+            df_pairs = KeyManager("dim", other_conn, df_incoming, snapshot_store=store)._load_existing_keys()
+
+        assert df_pairs["key_dim"].to_list() == [7]
+        assert len(list((tmp_path / "snapshots").iterdir())) == 2
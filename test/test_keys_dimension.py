@@ -1,9 +1,16 @@
+import asyncio
+import threading
 import pytest
+from datetime import date
 from unittest.mock import patch, Mock
 import polars as pl
+from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Connection
 
+from keys.connection_pool import cached_statement
 from keys.key_dimension import KeyDimension
+from keys.Errors import BusinessKeyError, HashCollisionError, KeysError
+from keys.utility import add_hashed_bk_for_table
 
 
 class TestKeyDimension:
@@ -40,7 +47,7 @@ class TestKeyDimension:
         df_result = km.process()
 
         mock_read_database.assert_called_once_with(
-            "SELECT bk_correct, key_correct FROM correct",
+            cached_statement("SELECT bk_correct, key_correct FROM correct"),
             mock_conn
         )
         assert df_result.select(sorted(df_result.columns)).equals(
@@ -60,8 +67,268 @@ class TestKeyDimension:
         result_2 = km.process()
 
         mock_read_database.assert_called_once_with(
-            "SELECT bk_correct, key_correct FROM correct",
+            cached_statement("SELECT bk_correct, key_correct FROM correct"),
             mock_conn
         )
         assert km._processed is True
         assert result_1.equals(result_2)
+
+    def test_write_to_db_only_new_rows(self):
+        """Only BKs that got new keys are inserted."""
+        engine = create_engine("sqlite://")
+        with engine.connect() as conn:
+            conn.execute(text("CREATE TABLE correct (bk_correct TEXT, key_correct INTEGER, val_col TEXT)"))
+            conn.execute(text("INSERT INTO correct VALUES ('a', 1, 'v1'), ('b', 2, 'v2')"))
+            conn.commit()
+            df_incoming = pl.DataFrame({"bk_correct": ["a", "b", "c"], "val_col": ["v1", "v2", "v3"]})
+
+            km = KeyDimension("correct", conn, df_incoming)
+            km.process()
+            stats = km.write_to_db()
+
+            assert stats.rows == 1
+            rows = conn.execute(text("SELECT bk_correct, key_correct, val_col FROM correct ORDER BY key_correct")).all()
+            assert rows == [("a", 1, "v1"), ("b", 2, "v2"), ("c", 3, "v3")]
+
+    def test_write_to_db_before_process(self, dim_df, mock_conn):
+        km = KeyDimension("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]))
+        with pytest.raises(KeysError, match="process\\(\\) must be called before write_to_db\\(\\)"):
+            km.write_to_db()
+
+    @patch.object(KeyDimension, "_get_max_existing_key")
+    @patch("polars.read_database")
+    def test_process_batches_lazyframe(self, mock_read_database, mock_get_max, dim_df, mock_conn):
+        """LazyFrame input is keyed batch by batch; new keys continue across batches."""
+        mock_read_database.return_value = dim_df[:3].select(["bk_correct", "key_correct"])
+        mock_get_max.return_value = 3
+
+        km = KeyDimension("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]).lazy())
+        batches = list(km.process_batches(batch_size=2))
+
+        df_result = pl.concat(batches)
+        assert all(len(b) <= 2 for b in batches)
+        assert df_result.select(sorted(df_result.columns)).equals(dim_df.select(sorted(dim_df.columns)))
+
+    @patch.object(KeyDimension, "_get_max_existing_key")
+    @patch("polars.read_database")
+    def test_process_batches_iterator(self, mock_read_database, mock_get_max, dim_df, mock_conn):
+        mock_read_database.return_value = dim_df[:1].select(["bk_correct", "key_correct"])
+        mock_get_max.return_value = 1
+        df_incoming = dim_df.select(["bk_correct", "val_col"])
+
+        km = KeyDimension("correct", mock_conn, df_incoming.iter_slices(2))
+        df_result = pl.concat(km.process_batches())
+
+        mock_read_database.assert_called_once()
+        assert df_result["key_correct"].to_list() == [1, 2, 3, 4, 5]
+
+    @patch.object(KeyDimension, "_get_max_existing_key")
+    @patch("polars.read_database")
+    def test_process_batches_iterator_duplicate_across_batches(self, mock_read_database, mock_get_max, mock_conn):
+        mock_read_database.return_value = pl.DataFrame({"bk_correct": ["x"], "key_correct": [1]})
+        mock_get_max.return_value = 1
+        batches = [pl.DataFrame({"bk_correct": ["a", "b"]}), pl.DataFrame({"bk_correct": ["c", "a"]})]
+
+        km = KeyDimension("correct", mock_conn, iter(batches))
+        with pytest.raises(BusinessKeyError, match="Duplicate business keys found in incoming data"):
+            list(km.process_batches())
+
+    @patch.object(KeyDimension, "_get_max_existing_key")
+    @patch("polars.read_database")
+    def test_process_batches_iterator_keep_last(self, mock_read_database, mock_get_max, mock_conn):
+        """Within a batch the last row wins; a BK already emitted in an earlier batch keeps its key."""
+        mock_read_database.return_value = pl.DataFrame({"bk_correct": ["x"], "key_correct": [1]})
+        mock_get_max.return_value = 1
+        batches = [
+            pl.DataFrame({"bk_correct": ["a", "b", "a"], "val_col": [1, 2, 3]}),
+            pl.DataFrame({"bk_correct": ["c", "a"], "val_col": [4, 5]}),
+        ]
+
+        km = KeyDimension("correct", mock_conn, iter(batches), on_duplicate="keep_last")
+        df_result = pl.concat(km.process_batches())
+
+        assert df_result["val_col"].to_list() == [2, 3, 4]
+        assert df_result["key_correct"].to_list() == [2, 3, 4]
+
+    @patch.object(KeyDimension, "_get_max_existing_key")
+    @patch("polars.read_database")
+    def test_process_deferred_validation(self, mock_read_database, mock_get_max, mock_conn):
+        mock_read_database.return_value = pl.DataFrame({"bk_correct": ["a"], "key_correct": [1]})
+        mock_get_max.return_value = 1
+        df = pl.DataFrame({"bk_correct": ["a", "b", "b"], "val_col": [1, 2, 3]})
+
+        km = KeyDimension("correct", mock_conn, df, on_duplicate="keep_last", defer_validation=True)
+        assert len(km.df_incoming_modified) == 3
+        df_result = km.process()
+
+        assert df_result["key_correct"].to_list() == [1, 2]
+        assert df_result["val_col"].to_list() == [1, 3]
+
+    def test_lazyframe_duplicates_checked_at_init(self, mock_conn):
+        lf = pl.LazyFrame({"bk_correct": ["a", "b", "a"], "val_col": ["x", "y", "z"]})
+        with pytest.raises(BusinessKeyError, match="Duplicate business keys found in incoming data"):
+            KeyDimension("correct", mock_conn, lf)
+
+    @patch.object(KeyDimension, "_get_max_existing_key")
+    @patch("polars.read_database")
+    def test_sink_parquet(self, mock_read_database, mock_get_max, dim_df, mock_conn, tmp_path):
+        mock_read_database.return_value = dim_df[:3].select(["bk_correct", "key_correct"])
+        mock_get_max.return_value = 3
+        path = tmp_path / "keyed.parquet"
+
+        km = KeyDimension("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]).lazy())
+        km.sink_parquet(str(path))
+
+        df_result = pl.read_parquet(path)
+        assert df_result.select(sorted(df_result.columns)).equals(dim_df.select(sorted(dim_df.columns)))
+
+    def test_process_streaming_input_rejected(self, dim_df, mock_conn):
+        km = KeyDimension("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]).lazy())
+        with pytest.raises(KeysError, match="use process_batches\\(\\) or sink_parquet\\(\\)"):
+            km.process()
+
+    def test_process_hashed_bk_collision(self):
+        """A stored row with the same hashed BK but different source values is reported as a collision."""
+        engine = create_engine("sqlite://")
+        df_incoming = pl.DataFrame({"customer_id": ["c1", "c2"], "val_col": ["v1", "v2"]})
+        df_incoming = df_incoming.with_columns(add_hashed_bk_for_table("correct", df_incoming, "customer_id"))
+        hashed_c1 = df_incoming["bk_correct"][0]
+        with engine.connect() as conn:
+            conn.execute(text("CREATE TABLE correct (bk_correct BIGINT, customer_id TEXT, key_correct INTEGER)"))
+            conn.execute(text("INSERT INTO correct VALUES (:bk, 'other', 1)"), {"bk": hashed_c1})
+
+            km = KeyDimension("correct", conn, df_incoming, bk_source_columns=["customer_id"])
+            with pytest.raises(HashCollisionError, match="Hashed business key collision in table 'correct' for 1 rows"):
+                km.process()
+
+    def test_process_hashed_bk_matches_stored_source(self):
+        engine = create_engine("sqlite://")
+        df_incoming = pl.DataFrame({"customer_id": ["c1", "c2"], "val_col": ["v1", "v2"]})
+        df_incoming = df_incoming.with_columns(add_hashed_bk_for_table("correct", df_incoming, "customer_id"))
+        with engine.connect() as conn:
+            conn.execute(text("CREATE TABLE correct (bk_correct BIGINT, customer_id TEXT, key_correct INTEGER, val_col TEXT)"))
+            conn.execute(text("INSERT INTO correct VALUES (:bk, 'c1', 1, 'v1')"), {"bk": df_incoming["bk_correct"][0]})
+
+            km = KeyDimension("correct", conn, df_incoming, bk_source_columns=["customer_id"])
+            df_result = km.process()
+
+        assert df_result.columns == ["customer_id", "val_col", "bk_correct", "key_correct"]
+        assert df_result["key_correct"].to_list() == [1, 2]
+
+    @pytest.mark.parametrize("lookup_mode", ["full", "pushdown"])
+    def test_process_composite_bk(self, lookup_mode):
+        """A list bk_name is selected, checked and joined on the native typed columns."""
+        engine = create_engine("sqlite://")
+        df_incoming = pl.DataFrame({
+            "store_id": [1, 1, 2],
+            "valid_date": [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 1)],
+            "val_col": ["v1", "v2", "v3"],
+        })
+        with engine.connect() as conn:
+            conn.execute(text("CREATE TABLE correct (store_id INTEGER, valid_date DATE, key_correct INTEGER)"))
+            conn.execute(text("INSERT INTO correct VALUES (1, '2024-01-02', 4), (2, '2024-01-02', 9)"))
+
+            km = KeyDimension("correct", conn, df_incoming, bk_name=["store_id", "valid_date"], lookup_mode=lookup_mode)
+            df_result = km.process()
+
+        assert df_result.schema["valid_date"] == pl.Date
+        assert df_result["key_correct"].to_list() == [10, 4, 11]
+
+    def test_init_composite_bk_duplicates(self, mock_conn):
+        df = pl.DataFrame({"store_id": [1, 1, 2], "valid_date": [date(2024, 1, 1)] * 3})
+        with pytest.raises(BusinessKeyError, match="Duplicate business keys found in incoming data"):
+            KeyDimension("correct", mock_conn, df, bk_name=["store_id", "valid_date"])
+
+    def test_process_async_connection(self, tmp_path):
+        pytest.importorskip("aiosqlite")
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        async def run() -> pl.DataFrame:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'dim.db'}")
+            try:
+                async with engine.connect() as conn:
+                    await conn.execute(text("CREATE TABLE correct (bk_correct TEXT, key_correct INTEGER)"))
+                    await conn.execute(text("INSERT INTO correct VALUES ('a', 1), ('b', 5)"))
+                    dim = KeyDimension("correct", None, pl.DataFrame({"bk_correct": ["b", "c", "a", "d"]}))
+                    return await dim.process_async(conn)
+            finally:
+                await engine.dispose()
+
+        df_result = asyncio.run(run())
+
+        assert df_result["key_correct"].to_list() == [5, 6, 1, 7]
+
+    @patch("keys.key_manager.find_spec", return_value=object())
+    def test_process_async_fast_read_in_worker_thread(self, mock_find_spec, tmp_path):
+        pytest.importorskip("aiosqlite")
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        read_threads = []
+
+        def read_database_uri(query, uri, engine, **kwargs):
+            read_threads.append(threading.current_thread())
+            return pl.DataFrame({"bk_correct": ["a"], "key_correct": [1]}) if "bk_correct" in query else pl.DataFrame({"max_key": [1]})
+
+        async def run() -> pl.DataFrame:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'dim.db'}")
+            try:
+                dim = KeyDimension("correct", None, pl.DataFrame({"bk_correct": ["a", "b"]}), read_uri="sqlite:///unused.db")
+                return await dim.process_async(engine)
+            finally:
+                await engine.dispose()
+
+        with patch("polars.read_database_uri", side_effect=read_database_uri):
+            df_result = asyncio.run(run())
+
+        assert df_result["key_correct"].to_list() == [1, 2]
+        assert len(read_threads) == 2
+        assert threading.main_thread() not in read_threads
+
+    def test_scd_type_1_updates_changed_rows(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'scd1.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE dim_customer (bk_dim_customer TEXT, key_dim_customer INTEGER, city TEXT, row_hash BIGINT)"))
+            first = KeyDimension("dim_customer", conn, pl.DataFrame({"bk_dim_customer": ["a", "b"], "city": ["Oslo", "Bergen"]}), scd_type=1)
+            first.process()
+            first.write_to_db()
+
+        with engine.begin() as conn:
+            second = KeyDimension("dim_customer", conn, pl.DataFrame({"bk_dim_customer": ["a", "b", "c"], "city": ["Oslo", "Tromsø", "Bodø"]}), scd_type=1)
+            df_result = second.process()
+            second.write_to_db()
+
+        assert second.change_counts == {"new": 1, "changed": 1, "unchanged": 1}
+        assert df_result["key_dim_customer"].to_list() == [1, 2, 3]
+        assert second.last_update_stats.rows == 1
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT bk_dim_customer, key_dim_customer, city FROM dim_customer ORDER BY key_dim_customer")).all()
+        assert rows == [("a", 1, "Oslo"), ("b", 2, "Tromsø"), ("c", 3, "Bodø")]
+
+    def test_scd_type_2_versions_changed_rows(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'scd2.db'}")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE dim_customer (bk_dim_customer TEXT, key_dim_customer INTEGER, city TEXT, "
+                "row_hash BIGINT, valid_from TIMESTAMP, valid_to TIMESTAMP)"
+            ))
+            first = KeyDimension("dim_customer", conn, pl.DataFrame({"bk_dim_customer": ["a", "b"], "city": ["Oslo", "Bergen"]}), scd_type=2)
+            first.process()
+            first.write_to_db()
+
+        with engine.begin() as conn:
+            df = pl.DataFrame({"bk_dim_customer": ["a", "b", "c"], "city": ["Oslo", "Tromsø", "Bodø"]})
+            second = KeyDimension("dim_customer", conn, df, scd_type=2)
+            df_result = second.process()
+            second.write_to_db()
+
+        assert second.change_counts == {"new": 1, "changed": 1, "unchanged": 1}
+        assert df_result["key_dim_customer"].to_list() == [1, 3, 4]
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT bk_dim_customer, key_dim_customer, city, valid_to IS NULL FROM dim_customer ORDER BY key_dim_customer"
+            )).all()
+        assert rows == [("a", 1, "Oslo", 1), ("b", 2, "Bergen", 0), ("b", 3, "Tromsø", 1), ("c", 4, "Bodø", 1)]
+
+    def test_scd_type_invalid(self, dim_df, mock_conn):
+        with pytest.raises(ValueError, match="scd_type must be one of"):
+            KeyDimension("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]), scd_type=3)
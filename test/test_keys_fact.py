@@ -1,13 +1,16 @@
 #TODO: Test _import_dimension_keys
 #TODO: Test process
 
+import asyncio
 import pytest
-from unittest.mock import Mock
+import threading
+from unittest.mock import MagicMock, Mock, patch
 import polars as pl
 from sqlalchemy.engine import Connection
 
 from keys.key_fact import KeyFact
 from keys.key_manager import DEFAULT_PK_VALUE
+from keys.Errors import KeysError
 
 
 class TestKeyFact:
@@ -66,3 +69,217 @@ class TestKeyFact:
             assert km.dim_mappings[name]["dim_table"] == name
             assert km.dim_mappings[name]["key_name"] == f"key_{name}"
             assert km.dim_mappings[name]["bk_name"] == f"bk_{name}"
+
+    def test_import_dimension_keys_parallel(self, mock_conn):
+        """With a connection_factory all mappings are loaded concurrently, each on its own connection."""
+        dims = ["users", "products", "stores"]
+        df = pl.DataFrame({"bk_correct": ["f1", "f2"], **{f"bk_{d}": ["a", "b"] for d in dims}})
+        barrier = threading.Barrier(len(dims), timeout=5)
+        used_conns = []
+
+        def fake_load(dim_table, pk_name, bk_name, conn=None):
+            used_conns.append(conn)
+            barrier.wait()
+            return pl.DataFrame({bk_name: ["a"], pk_name: [1]})
+
+        factory = Mock(side_effect=lambda: MagicMock(spec=Connection))
+        km = KeyFact("correct", mock_conn, df, connection_factory=factory, max_workers=len(dims))
+        km.related_dimensions(*dims)
+        with patch.object(km, "_load_existing_keys", side_effect=fake_load):
+            km._import_dimension_keys()
+
+        assert factory.call_count == len(dims)
+        assert len({id(c) for c in used_conns}) == len(dims)
+        for d in dims:
+            assert km.df_incoming_modified[f"key_{d}"].to_list() == [1, DEFAULT_PK_VALUE]
+
+    @patch.object(KeyFact, "_get_max_existing_key")
+    @patch("polars.read_database")
+    def test_process_batches_with_dimensions(self, mock_read_database, mock_get_max, mock_conn):
+        """Streamed fact rows get their own new keys and dimension keys (default for missing BKs)."""
+        lf = pl.LazyFrame({"bk_fact": ["f1", "f2", "f3"], "bk_users": ["u1", "u2", "u9"], "amount": [1, 2, 3]})
+        mock_read_database.side_effect = [
+            pl.DataFrame({"bk_fact": ["f1"], "key_fact": [10]}),
+            pl.DataFrame({"bk_users": ["u1", "u2"], "key_users": [7, 8]}),
+        ]
+        mock_get_max.return_value = 10
+
+        km = KeyFact("fact", mock_conn, lf).related_dimension("users")
+        df_result = pl.concat(km.process_batches(batch_size=2))
+
+        assert df_result.columns == ["bk_fact", "amount", "key_fact", "key_users"]
+        assert df_result["key_fact"].to_list() == [10, 11, 12]
+        assert df_result["key_users"].to_list() == [7, 8, DEFAULT_PK_VALUE]
+
+    @patch.object(KeyFact, "_get_max_existing_key")
+    @patch("polars.read_database")
+    def test_process_composite_dimension_bk(self, mock_read_database, mock_get_max, mock_conn):
+        df = pl.DataFrame({"bk_fact": ["f1", "f2"], "store_id": [1, 2], "day": [1, 1]})
+        mock_read_database.side_effect = [
+            pl.DataFrame(schema={"bk_fact": pl.String, "key_fact": pl.Int64}),
+            pl.DataFrame({"store_id": [1, 2], "day": [1, 2], "key_stores": [7, 8]}),
+        ]
+        mock_get_max.return_value = 0
+
+        km = KeyFact("fact", mock_conn, df).related_dimension("stores", bk_name=["store_id", "day"])
+        df_result = km.process()
+
+        assert mock_read_database.call_args_list[1].args[0].text == "SELECT store_id, day, key_stores FROM stores"
+        assert df_result.columns == ["bk_fact", "key_fact", "key_stores"]
+        assert df_result["key_stores"].to_list() == [7, DEFAULT_PK_VALUE]
+
+    def test_process_async_engine(self, tmp_path):
+        pytest.importorskip("aiosqlite")
+        from sqlalchemy import text
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        async def run() -> pl.DataFrame:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'facts.db'}")
+            async with engine.begin() as conn:
+                await conn.execute(text("CREATE TABLE fact_sales (bk_fact_sales TEXT, key_fact_sales INTEGER)"))
+                await conn.execute(text("INSERT INTO fact_sales VALUES ('s1', 7)"))
+                await conn.execute(text("CREATE TABLE dim_date (bk_dim_date TEXT, key_dim_date INTEGER)"))
+                await conn.execute(text("INSERT INTO dim_date VALUES ('2024-01-01', 1)"))
+            df = pl.DataFrame({"bk_fact_sales": ["s1", "s2"], "bk_dim_date": ["2024-01-01", "2024-01-09"]})
+            fact = KeyFact("fact_sales", None, df).related_dimensions("dim_date")
+            try:
+                return await fact.process_async(engine)
+            finally:
+                await engine.dispose()
+
+        df_result = asyncio.run(run())
+
+        assert df_result["key_fact_sales"].to_list() == [7, 8]
+        assert df_result["key_dim_date"].to_list() == [1, DEFAULT_PK_VALUE]
+
+    def test_process_infers_missing_dimension_members(self, tmp_path):
+        from sqlalchemy import create_engine, text
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'facts.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE fact_sales (bk_fact_sales TEXT, key_fact_sales INTEGER)"))
+            conn.execute(text("CREATE TABLE dim_customer (bk_dim_customer TEXT, key_dim_customer INTEGER, is_inferred BOOLEAN)"))
+            conn.execute(text("INSERT INTO dim_customer VALUES ('c1', 10, 0)"))
+        df = pl.DataFrame({"bk_fact_sales": ["s1", "s2", "s3", "s4"], "bk_dim_customer": ["c9", "c1", "c8", "c9"]})
+
+        with engine.begin() as conn:
+            fact = KeyFact("fact_sales", conn, df)
+            fact.related_dimension("dim_customer", infer_missing=True, inferred_values={"is_inferred": True})
+            df_result = fact.process()
+
+        assert df_result["key_dim_customer"].to_list() == [11, 10, 12, 11]
+        assert fact.inferred_members["dim_customer"]["bk_dim_customer"].to_list() == ["c9", "c8"]
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT bk_dim_customer, key_dim_customer, is_inferred FROM dim_customer ORDER BY key_dim_customer")).all()
+        assert rows == [("c1", 10, 0), ("c9", 11, 1), ("c8", 12, 1)]
+
+    def test_infer_uses_members_inserted_since_pairs_were_loaded(self, tmp_path):
+        from sqlalchemy import create_engine, text
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'facts.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE fact_sales (bk_fact_sales TEXT, key_fact_sales INTEGER)"))
+            conn.execute(text("CREATE TABLE dim_customer (bk_dim_customer TEXT, key_dim_customer INTEGER)"))
+            conn.execute(text("INSERT INTO dim_customer VALUES ('c1', 10), ('c9', 11)"))
+        df = pl.DataFrame({"bk_fact_sales": ["s1", "s2"], "bk_dim_customer": ["c9", "c8"]})
+
+        with engine.begin() as conn:
+            fact = KeyFact("fact_sales", conn, df).related_dimension("dim_customer", infer_missing=True)
+            fact.provide_dimension_keys("dim_customer", pl.DataFrame({"bk_dim_customer": ["c1"], "key_dim_customer": [10]}))
+            df_result = fact.process()
+
+        assert df_result["key_dim_customer"].to_list() == [11, 12]
+        assert fact.inferred_members["dim_customer"]["bk_dim_customer"].to_list() == ["c8"]
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM dim_customer")).scalar() == 3
+
+    def test_partition_column_bounds_own_pair_load(self, tmp_path):
+        from datetime import date
+        from sqlalchemy import create_engine, text
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'facts.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE fact_sales (bk_fact_sales TEXT, key_fact_sales INTEGER, sale_date DATE, active INTEGER)"))
+            conn.execute(text(
+                "INSERT INTO fact_sales VALUES ('s1', 1, '2024-01-01', 1), ('s2', 2, '2024-01-02', 1), "
+                "('s3', 3, '2024-01-03', 1), ('s4', 4, '2024-01-02', 0)"
+            ))
+            conn.execute(text("CREATE TABLE dim_date (bk_dim_date TEXT, key_dim_date INTEGER, active INTEGER)"))
+            conn.execute(text("INSERT INTO dim_date VALUES ('d1', 1, 1)"))
+        df = pl.DataFrame({"bk_fact_sales": ["s2", "s9"], "sale_date": [date(2024, 1, 2)] * 2, "bk_dim_date": ["d1"] * 2})
+
+        with engine.connect() as conn, patch("polars.read_database", wraps=pl.read_database) as mock_read_database:
+            fact = KeyFact("fact_sales", conn, df, key_condition="active = 1", partition_column="sale_date").related_dimensions("dim_date")
+            df_result = fact.process()
+
+            own_query = str(mock_read_database.call_args_list[0].args[0])
+            own_params = mock_read_database.call_args_list[0].kwargs["execute_options"]["parameters"]
+        assert own_query == (
+            "SELECT bk_fact_sales, key_fact_sales FROM fact_sales "
+            "WHERE (active = 1) AND sale_date >= :partition_min AND sale_date <= :partition_max"
+        )
+        assert own_params == {"partition_min": date(2024, 1, 2), "partition_max": date(2024, 1, 2)}
+        assert fact.df_existing_pk_bk_pair["bk_fact_sales"].to_list() == ["s2"]
+        assert df_result["key_fact_sales"].to_list() == [2, 5]
+
+    def test_partition_column_batches_and_snapshots(self, tmp_path):
+        from datetime import date
+        from sqlalchemy import create_engine, text
+        from keys.key_snapshot import KeySnapshotStore
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'facts.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE fact_sales (bk_fact_sales TEXT, key_fact_sales INTEGER, sale_date DATE)"))
+            conn.execute(text("INSERT INTO fact_sales VALUES ('s1', 1, '2024-01-01'), ('s2', 2, '2024-01-02')"))
+            conn.execute(text("CREATE TABLE dim_date (bk_dim_date TEXT, key_dim_date INTEGER)"))
+            conn.execute(text("INSERT INTO dim_date VALUES ('d1', 1)"))
+        df = pl.DataFrame({
+            "bk_fact_sales": ["s1", "s9", "s2"], "sale_date": [date(2024, 1, 1)] * 2 + [date(2024, 1, 2)], "bk_dim_date": ["d1"] * 3,
+        })
+        store = KeySnapshotStore(tmp_path / "snapshots")
+
+        with engine.connect() as conn:
+            fact = KeyFact("fact_sales", conn, df.iter_slices(2), partition_column="sale_date", snapshot_store=store)
+            df_result = pl.concat(fact.related_dimensions("dim_date").process_batches())
+
+        assert df_result["key_fact_sales"].to_list() == [1, 3, 2]
+        assert [p.name.startswith("dim_date") for p in (tmp_path / "snapshots").iterdir()] == [True]
+
+    def test_partition_column_missing(self, mock_conn):
+        with pytest.raises(KeysError, match="Partition column 'sale_date' not found"):
+            KeyFact("correct", mock_conn, pl.DataFrame({"bk_correct": ["a"]}), partition_column="sale_date")
+
+    @patch.object(KeyFact, "_get_max_existing_key")
+    @patch("polars.read_database")
+    def test_process_single_lazy_plan_matches_eager(self, mock_read_database, mock_get_max, mock_conn):
+        df = pl.DataFrame({
+            "bk_fact": ["f1", "f2", "f3", "f4"],
+            "bk_users": ["u1", "u2", "u9", "u1"],
+            "store_id": [1, 2, 2, 3],
+            "amount": [1, 2, 3, 4],
+        })
+        pairs = [
+            pl.DataFrame({"bk_fact": ["f2"], "key_fact": [5]}),
+            pl.DataFrame({"bk_users": ["u1", "u2"], "key_users": [7, 8]}),
+            pl.DataFrame({"store_id": [1, 2], "key_stores": [3, 4]}),
+        ]
+        mock_read_database.side_effect = pairs * 2
+        mock_get_max.return_value = 10
+
+        def fact() -> KeyFact:
+            return KeyFact("fact", mock_conn, df).related_dimension("users").related_dimension("stores", bk_name="store_id")
+
+        eager = fact()
+        eager._validate()
+        df_eager = eager._process_eager()
+        lazy = fact()
+        with patch("polars.collect_all", wraps=pl.collect_all) as mock_collect_all:
+            df_lazy = lazy.process()
+
+        assert mock_collect_all.call_count == 1
+        assert df_lazy.equals(df_eager)
+        assert df_lazy["key_fact"].to_list() == [11, 5, 12, 13]
+        assert df_lazy["key_users"].to_list() == [7, 8, DEFAULT_PK_VALUE, 7]
+        assert df_lazy["key_stores"].to_list() == [3, 4, 4, DEFAULT_PK_VALUE]
+        assert lazy.df_new_rows.equals(eager.df_new_rows)
+        assert lazy.df_new_rows["bk_fact"].to_list() == ["f1", "f3", "f4"]
@@ -1,10 +1,13 @@
 import pytest
 from unittest.mock import patch, Mock
 import polars as pl
+from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Connection
 
+from keys.connection_pool import cached_statement
 from keys.key_manager import KeyManager
-from keys.Errors import BusinessKeyError
+from keys.Errors import BusinessKeyError, DuplicateBusinessKeyWarning, MergeError
+from keys.key_cache import KeyCache
 
 
 class TestKeyManager:
@@ -55,7 +58,7 @@ class TestKeyManager:
         result = km._load_existing_keys()
 
         mock_read_database.assert_called_once_with(
-            "SELECT bk_correct, key_correct FROM correct",
+            cached_statement("SELECT bk_correct, key_correct FROM correct"),
             mock_conn
         )
         assert result.equals(dim_df.select(["bk_correct", "key_correct"]))
@@ -101,3 +104,142 @@ class TestKeyManager:
 
         assert km.df_incoming_modified["key_correct"].n_unique() == dim_df["key_correct"].n_unique()
         assert km.df_incoming_modified["key_correct"].dtype == pl.Int64
+
+    @patch("keys.key_manager.PUSHDOWN_CHUNK_SIZE", 2)
+    @patch("polars.read_database")
+    def test_load_existing_keys_pushdown_chunks(self, mock_read_database, dim_df, mock_conn):
+        """Pushdown mode sends only the incoming BKs, split into chunked IN lists."""
+        pairs = dim_df.select(["bk_correct", "key_correct"])
+        mock_read_database.side_effect = [pairs[:2], pairs[2:4], pairs[4:]]
+
+        km = KeyManager("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]), lookup_mode="pushdown")
+        result = km._load_existing_keys()
+
+        assert mock_read_database.call_count == 3
+        sent = [c.kwargs["execute_options"]["parameters"]["bk_values"] for c in mock_read_database.call_args_list]
+        assert sorted(bk for chunk in sent for bk in chunk) == dim_df["bk_correct"].to_list()
+        assert "WHERE bk_correct IN" in str(mock_read_database.call_args_list[0].args[0])
+        assert result.sort("bk_correct").equals(pairs)
+
+    @patch("polars.read_database")
+    def test_load_existing_keys_pushdown_no_matches(self, mock_read_database, dim_df, mock_conn):
+        """No matching pairs gives an empty, typed frame that can still be merged."""
+        mock_read_database.return_value = pl.DataFrame()
+
+        km = KeyManager("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]), lookup_mode="pushdown")
+        result = km._load_existing_keys()
+        km._merge_keys(result)
+
+        assert result.schema == {"bk_correct": pl.String, "key_correct": pl.Int64}
+        assert km.df_incoming_modified["key_correct"].null_count() == len(dim_df)
+
+    def test_init_invalid_lookup_mode(self, dim_df, mock_conn):
+        with pytest.raises(ValueError, match="lookup_mode must be one of"):
+            KeyManager("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]), lookup_mode="nope")
+
+    @patch("polars.read_database")
+    def test_load_existing_keys_cache_refresh(self, mock_read_database, dim_df, mock_conn):
+        """A cache hit only fetches rows above the cached max PK."""
+        cache = KeyCache()
+        pairs = dim_df.select(["bk_correct", "key_correct"])
+        mock_read_database.side_effect = [pairs[:3], pairs[3:]]
+
+        km = KeyManager("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]), key_cache=cache)
+        first = km._load_existing_keys()
+        second = km._load_existing_keys()
+
+        refresh_call = mock_read_database.call_args_list[1]
+        assert "WHERE key_correct > :min_pk" in str(refresh_call.args[0])
+        assert refresh_call.kwargs["execute_options"]["parameters"] == {"min_pk": 3}
+        assert first.equals(pairs[:3])
+        assert second.equals(pairs)
+        assert cache.get(km._lookup_key("correct", "key_correct", "bk_correct"))[1] == 5
+
+    def test_on_duplicate_invalid(self, dim_df, mock_conn):
+        with pytest.raises(ValueError, match="on_duplicate must be one of"):
+            KeyManager("correct", mock_conn, dim_df.select(["bk_correct"]), on_duplicate="ignore")
+
+    def test_on_duplicate_warn_keeps_rows(self, mock_conn):
+        df = pl.DataFrame({"bk_correct": ["a", "a", "b"], "val_col": ["x", "y", "z"]})
+        with pytest.warns(DuplicateBusinessKeyWarning, match="1 duplicate business keys"):
+            km = KeyManager("correct", mock_conn, df, on_duplicate="warn")
+
+        assert km.df_incoming_modified.equals(df)
+
+    def test_on_duplicate_keep_last(self, mock_conn):
+        df = pl.DataFrame({"bk_correct": ["a", None, "a", "b", None], "val_col": ["x", "n1", "y", "z", "n2"]})
+        km = KeyManager("correct", mock_conn, df, on_duplicate="keep_last")
+
+        assert km.df_incoming_modified["val_col"].to_list() == ["n1", "y", "z", "n2"]
+        assert km.df_incoming["val_col"].to_list() == df["val_col"].to_list()
+
+    def test_on_duplicate_keep_last_merge_with_duplicate_pairs(self, mock_conn):
+        df = pl.DataFrame({"bk_correct": ["a", "a", "b"], "val_col": ["x", "y", "z"]})
+        km = KeyManager("correct", mock_conn, df, on_duplicate="keep_last")
+        df_pairs = pl.DataFrame({"bk_correct": ["b", "b"], "key_correct": [1, 2]})
+
+        with pytest.raises(MergeError, match="Row count changed after merge"):
+            km._merge_keys(df_pairs)
+
+    def test_on_duplicate_keep_last_lazy(self, mock_conn):
+        lf = pl.LazyFrame({"bk_correct": ["a", "b", "a"], "val_col": ["x", "y", "z"]})
+        km = KeyManager("correct", mock_conn, lf, on_duplicate="keep_last")
+
+        assert km.lf_incoming.collect()["val_col"].to_list() == ["y", "z"]
+
+    def test_defer_validation(self, mock_conn):
+        df = pl.DataFrame({"bk_correct": ["a", "a"], "val_col": ["x", "y"]})
+        km = KeyManager("correct", mock_conn, df, defer_validation=True)
+
+        with pytest.raises(BusinessKeyError, match="Duplicate business keys found"):
+            km._validate()
+
+    @patch("polars.read_database_uri")
+    @patch("keys.key_manager.find_spec", return_value=object())
+    def test_load_existing_keys_connectorx_partitioned(self, mock_find_spec, mock_read_database_uri, dim_df, mock_conn):
+        mock_read_database_uri.return_value = dim_df.select(["bk_correct", "key_correct"])
+        mock_conn.in_transaction.return_value = False
+        km = KeyManager("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]), read_uri="postgresql://u@h/db", read_partitions=8)
+
+        result = km._load_existing_keys()
+
+        mock_read_database_uri.assert_called_once_with(
+            "SELECT bk_correct, key_correct FROM correct", "postgresql://u@h/db",
+            engine="connectorx", partition_on="key_correct", partition_num=8,
+        )
+        assert result.equals(dim_df.select(["bk_correct", "key_correct"]))
+
+    @patch("polars.read_database_uri")
+    @patch("polars.read_database")
+    @patch("keys.key_manager.find_spec", return_value=None)
+    def test_read_uri_falls_back_without_engine(self, mock_find_spec, mock_read_database, mock_read_database_uri, dim_df, mock_conn):
+        mock_read_database.return_value = pl.DataFrame({"max_key": [5]})
+        km = KeyManager("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]), read_uri="postgresql://u@h/db")
+
+        assert km._get_max_existing_key() == 5
+        mock_find_spec.assert_called_once_with("connectorx")
+        mock_read_database_uri.assert_not_called()
+
+    @patch("polars.read_database_uri")
+    @patch("keys.key_manager.find_spec", return_value=object())
+    def test_read_uri_not_used_in_open_transaction(self, mock_find_spec, mock_read_database_uri, dim_df, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'keys.db'}")
+        with engine.connect() as conn:
+            conn.execute(text("CREATE TABLE correct (bk_correct TEXT, key_correct INTEGER)"))
+            conn.execute(text("INSERT INTO correct VALUES ('a', 7)"))
+            km = KeyManager("correct", conn, dim_df.select(["bk_correct", "val_col"]), read_uri=f"sqlite:///{tmp_path / 'keys.db'}")
+
+            assert km._get_max_existing_key() == 7
+            assert km._load_existing_keys(conn=conn)["key_correct"].to_list() == [7]
+        mock_read_database_uri.assert_not_called()
+
+    @patch("keys.key_manager.find_spec", side_effect=lambda name: None if name == "adbc_driver_postgresql" else object())
+    def test_read_uri_adbc_requires_dialect_driver(self, mock_find_spec, dim_df, mock_conn):
+        km = KeyManager("correct", mock_conn, dim_df.select(["bk_correct"]), read_uri="postgres://u@h/db", read_engine="adbc")
+
+        assert not km._fast_read
+        assert [c.args[0] for c in mock_find_spec.call_args_list] == ["adbc_driver_manager", "adbc_driver_postgresql"]
+
+    def test_read_engine_invalid(self, dim_df, mock_conn):
+        with pytest.raises(ValueError, match="read_engine must be one of"):
+            KeyManager("correct", mock_conn, dim_df.select(["bk_correct"]), read_uri="sqlite://", read_engine="odbc")
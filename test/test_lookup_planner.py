@@ -0,0 +1,123 @@
+from unittest.mock import patch
+
+import pytest
+import polars as pl
+from sqlalchemy import create_engine, text
+
+from keys.key_cache import KeyCache
+from keys.key_dimension import KeyDimension
+from keys.key_fact import KeyFact
+from keys.lookup_planner import LookupPlanner
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'planner.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE dim_customer (bk_dim_customer TEXT, key_dim_customer INTEGER)"))
+        conn.execute(
+            text("INSERT INTO dim_customer VALUES (:bk, :key)"),
+            [{"bk": f"c{i}", "key": i} for i in range(1, 101)],
+        )
+        conn.execute(text("CREATE TABLE fact_sales (bk_fact_sales TEXT, key_fact_sales INTEGER)"))
+    return engine
+
+
+def _dim(conn, bks: list[str], planner: LookupPlanner, **kwargs) -> KeyDimension:
+    return KeyDimension("dim_customer", conn, pl.DataFrame({"bk_dim_customer": bks}), lookup_mode="auto", lookup_planner=planner, **kwargs)
+
+
+class TestLookupPlanner:
+
+    def test_auto_picks_pushdown_for_small_batches(self, engine):
+        planner = LookupPlanner(pushdown_ratio=0.1)
+        with engine.connect() as conn:
+            plan = _dim(conn, ["c1", "c2", "new"], planner).explain()[0]
+
+        assert plan.strategy == "pushdown"
+        assert (plan.dimension_rows, plan.incoming_bks, plan.estimated_rows) == (100, 3, 3)
+        assert plan.estimated_bytes > 0
+        assert "pushdown" in str(plan)
+
+    def test_auto_picks_full_scan_for_large_batches(self, engine):
+        planner = LookupPlanner(pushdown_ratio=0.1)
+        with engine.connect() as conn:
+            dim = _dim(conn, [f"c{i}" for i in range(1, 51)], planner)
+            plan = dim.explain()[0]
+            df_result = dim.process()
+
+        assert plan.strategy == "full"
+        assert plan.estimated_rows == 100
+        assert df_result["key_dim_customer"].to_list() == list(range(1, 51))
+
+    def test_row_count_is_cached(self, engine):
+        planner = LookupPlanner()
+        with engine.connect() as conn, patch("polars.read_database", wraps=pl.read_database) as mock_read_database:
+            df_result = _dim(conn, ["c5", "new"], planner).process()
+            _dim(conn, ["c6"], planner).explain()
+
+            count_queries = [c for c in mock_read_database.call_args_list if "COUNT(*)" in str(c.args[0])]
+            pushdown_queries = [c for c in mock_read_database.call_args_list if "IN" in str(c.args[0])]
+        assert len(count_queries) == 1
+        assert len(pushdown_queries) == 1
+        assert df_result["key_dim_customer"].to_list() == [5, 101]
+
+    def test_cached_pairs_are_preferred(self, engine):
+        cache = KeyCache()
+        with engine.connect() as conn:
+            _dim(conn, [f"c{i}" for i in range(1, 51)], LookupPlanner(), key_cache=cache).process()
+            plan = _dim(conn, ["c1"], LookupPlanner(), key_cache=cache).explain()[0]
+
+        assert plan.strategy == "cache"
+
+    def test_fact_explain_includes_dimensions(self, engine):
+        with engine.connect() as conn:
+            fact = KeyFact("fact_sales", conn, pl.DataFrame({"bk_fact_sales": ["s1"], "bk_dim_customer": ["c1"]}), lookup_mode="auto")
+            fact.related_dimensions("dim_customer")
+            plans = fact.explain()
+
+        assert [(p.table_name, p.strategy) for p in plans] == [("fact_sales", "full"), ("dim_customer", "pushdown")]
+
+    def test_row_count_is_cached_per_database(self, engine, tmp_path):
+        other = create_engine(f"sqlite:///{tmp_path / 'other.db'}")
+        with other.begin() as conn:
+            conn.execute(text("CREATE TABLE dim_customer (bk_dim_customer TEXT, key_dim_customer INTEGER)"))
+            conn.execute(text("INSERT INTO dim_customer VALUES ('c1', 1)"))
+        planner = LookupPlanner()
+
+        with engine.connect() as conn, other.connect() as other_conn:
+            plans = [_dim(c, ["c1"], planner).explain()[0] for c in (conn, other_conn)]
+
+        assert [p.dimension_rows for p in plans] == [100, 1]
+
+    def test_write_invalidates_row_count(self, engine):
+        planner = LookupPlanner()
+        with engine.begin() as conn:
+            dim = _dim(conn, ["new1", "new2"], planner)
+            assert dim.explain()[0].dimension_rows == 100
+            dim.process()
+            dim.write_to_db()
+
+            assert _dim(conn, ["c1"], planner).explain()[0].dimension_rows == 102
+
+    def test_process_batches_loads_full_pairs_once(self, engine):
+        df = pl.DataFrame({"bk_dim_customer": [f"c{i}" for i in range(1, 61)]})
+        with engine.connect() as conn, patch("polars.read_database", wraps=pl.read_database) as mock_read_database:
+            dim = KeyDimension("dim_customer", conn, df.iter_slices(20), lookup_mode="auto", lookup_planner=LookupPlanner(pushdown_ratio=0.1))
+            df_result = pl.concat(dim.process_batches())
+
+        pair_loads = [c for c in mock_read_database.call_args_list if "SELECT bk_dim_customer, key_dim_customer" in str(c.args[0])]
+        assert len(pair_loads) == 1
+        assert df_result["key_dim_customer"].to_list() == list(range(1, 61))
+
+    def test_row_count_uses_partition_predicates(self, engine):
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE fact_orders (bk_fact_orders TEXT, key_fact_orders INTEGER, day INTEGER)"))
+            conn.execute(text("INSERT INTO fact_orders VALUES ('o1', 1, 1), ('o2', 2, 2), ('o3', 3, 3)"))
+            fact = KeyFact(
+                "fact_orders", conn, pl.DataFrame({"bk_fact_orders": ["o2"], "day": [2], "bk_dim_customer": ["c1"]}),
+                lookup_mode="auto", lookup_planner=LookupPlanner(), partition_column="day",
+            )
+            fact.related_dimensions("dim_customer")
+
+            assert fact.explain()[0].dimension_rows == 1
@@ -0,0 +1,66 @@
+import logging
+from unittest.mock import patch
+
+import pytest
+import polars as pl
+
+from keys.key_dimension import KeyDimension
+from keys.key_fact import KeyFact
+from keys.observers import InMemoryCollector, LoggingObserver, KeyEvent
+from keys.Errors import BusinessKeyError
+
+
+class TestObservers:
+
+    @patch.object(KeyDimension, "_get_max_existing_key")
+    @patch("polars.read_database")
+    def test_collector_receives_dimension_phases(self, mock_read_database, mock_get_max, dim_df, mock_conn):
+        mock_read_database.return_value = dim_df[:3].select(["bk_correct", "key_correct"])
+        mock_get_max.return_value = 3
+        collector = InMemoryCollector()
+
+        km = KeyDimension("correct", mock_conn, dim_df.select(["bk_correct", "val_col"]), observers=[collector])
+        km.process()
+
+        phases = [e.phase for e in collector.events]
+        assert phases == ["validation", "key_load", "merge", "key_assignment"]
+        key_load = collector.events[1]
+        assert key_load.table_name == "correct"
+        assert key_load.rows == 3
+        assert key_load.bytes > 0
+        assert collector.events[3].rows == 2
+        assert set(collector.seconds_by_phase()) == set(phases)
+
+    @patch.object(KeyFact, "_get_max_existing_key")
+    @patch("polars.read_database")
+    def test_collector_receives_dimension_mapping(self, mock_read_database, mock_get_max, mock_conn):
+        df = pl.DataFrame({"bk_fact": ["f1", "f2"], "bk_users": ["u1", "u9"]})
+        mock_read_database.side_effect = [
+            pl.DataFrame(schema={"bk_fact": pl.String, "key_fact": pl.Int64}),
+            pl.DataFrame({"bk_users": ["u1"], "key_users": [7]}),
+        ]
+        mock_get_max.return_value = 0
+        collector = InMemoryCollector()
+
+        KeyFact("fact", mock_conn, df, observers=[collector]).related_dimension("users").process()
+
+        mapping = [e for e in collector.events if e.phase == "dimension_mapping"]
+        assert len(mapping) == 1
+        assert mapping[0].detail == {"target_table": "users", "pair_rows": 1, "missing_rows": 1}
+        assert any(e.phase == "key_load" and e.detail == {"target_table": "users"} for e in collector.events)
+
+    def test_error_is_recorded(self, mock_conn):
+        collector = InMemoryCollector()
+        df = pl.DataFrame({"bk_correct": ["a", "a"]})
+        with pytest.raises(BusinessKeyError):
+            KeyDimension("correct", mock_conn, df, observers=[collector])
+
+        assert collector.events[0].detail == {"error": "BusinessKeyError"}
+
+    def test_logging_observer(self, caplog):
+        observer = LoggingObserver()
+        with caplog.at_level(logging.INFO, logger="keys"):
+            observer.on_event(KeyEvent("dim_sales", "key_load", 0.5, rows=10, bytes=80))
+
+        assert "dim_sales key_load took 0.500s (rows=10, bytes=80)" in caplog.text
+        assert caplog.records[0].key_event["phase"] == "key_load"
@@ -0,0 +1,74 @@
+from unittest.mock import patch
+
+import pytest
+import polars as pl
+from sqlalchemy import create_engine, text
+
+from keys.pipeline import KeyPipeline
+from keys.Errors import KeysError
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pipeline.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE dim_customer (bk_dim_customer TEXT, key_dim_customer INTEGER, name TEXT)"))
+        conn.execute(text("INSERT INTO dim_customer VALUES ('c1', 1, 'Ann')"))
+        conn.execute(text("CREATE TABLE dim_product (bk_dim_product TEXT, key_dim_product INTEGER)"))
+        conn.execute(text("CREATE TABLE fact_sales (bk_fact_sales TEXT, key_fact_sales INTEGER, key_dim_customer INTEGER, key_dim_product INTEGER)"))
+    return engine
+
+
+def _fill(pipeline: KeyPipeline) -> None:
+    pipeline.add_dimension("dim_customer", pl.DataFrame({"bk_dim_customer": ["c2"], "name": ["Bo"]}))
+    pipeline.add_dimension("dim_product", pl.DataFrame({"bk_dim_product": ["p1", "p2"]}))
+    pipeline.add_fact("fact_sales", pl.DataFrame({
+        "bk_fact_sales": ["s1", "s2", "s3"],
+        "bk_dim_customer": ["c1", "c2", "c3"],
+        "bk_dim_product": ["p2", "p1", "p2"],
+    }), "dim_customer", "dim_product")
+
+
+class TestKeyPipeline:
+
+    def test_dependencies(self, engine):
+        with engine.connect() as conn:
+            pipeline = KeyPipeline(conn)
+            _fill(pipeline)
+            pipeline.add_fact("fact_returns", pl.DataFrame({"bk_fact_returns": ["r1"], "bk_dim_date": ["d1"]}), "dim_date")
+
+            assert pipeline.dependencies() == {
+                "dim_customer": set(),
+                "dim_product": set(),
+                "fact_sales": {"dim_customer", "dim_product"},
+                "fact_returns": set(),
+            }
+
+    @pytest.mark.parametrize("max_workers", [1, 3])
+    def test_run_hands_dimension_pairs_to_facts(self, engine, max_workers):
+        with engine.connect() as conn, patch("polars.read_database", wraps=pl.read_database) as mock_read_database:
+            pipeline = KeyPipeline(conn, connection_factory=engine if max_workers > 1 else None, max_workers=max_workers)
+            _fill(pipeline)
+            results = pipeline.run()
+            conn.commit()
+
+            dimension_reads = [c for c in mock_read_database.call_args_list if "FROM dim_" in str(c.args[0])]
+        # one pair load and one max key query per dimension, none for the fact
+        assert len(dimension_reads) == 4
+        assert results["fact_sales"]["key_dim_customer"].to_list() == [1, 2, -1]
+        assert results["fact_sales"]["key_dim_product"].to_list() == [2, 1, 2]
+        assert pipeline.write_stats["fact_sales"].rows == 3
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM dim_customer")).scalar_one() == 2
+            assert conn.execute(text("SELECT COUNT(*) FROM fact_sales")).scalar_one() == 3
+
+    def test_duplicate_table(self, engine):
+        with engine.connect() as conn:
+            pipeline = KeyPipeline(conn)
+            pipeline.add_dimension("dim_product", pl.DataFrame({"bk_dim_product": ["p1"]}))
+            with pytest.raises(KeysError, match="already part of the pipeline"):
+                pipeline.add_dimension("dim_product", pl.DataFrame({"bk_dim_product": ["p1"]}))
+
+    def test_parallel_requires_connection_factory(self, engine):
+        with pytest.raises(KeysError, match="require a connection_factory"):
+            KeyPipeline(engine.connect(), max_workers=2)
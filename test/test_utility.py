@@ -1,6 +1,10 @@
+import subprocess
+import sys
+
+import pytest
 import polars as pl
 
-from keys.utility import add_bk_for_table
+from keys.utility import add_bk_for_table, add_hashed_bk_for_table, hash_bk_values, row_hash_expr
 
 
 class TestBusinessKey:
@@ -18,3 +22,62 @@ class TestBusinessKey:
 
         expected = (df["str_col"].cast(pl.String) + "||" + df["int_col"].cast(pl.String)).alias("bk_correct")
         assert result["bk_correct"].equals(df.select(expected).to_series())
+
+    def test_add_hashed_bk_for_table_64(self):
+        """64-bit hashed BKs are stable Int64 hashes of the string BK."""
+        df = pl.DataFrame({"str_col": ["a", "b", "c"], "int_col": [1, 2, 3]})
+        result = df.with_columns(add_hashed_bk_for_table("correct", df, "str_col", "int_col"))
+        string_bk = df.with_columns(add_bk_for_table("correct", df, "str_col", "int_col"))["bk_correct"]
+
+        assert result["bk_correct"].dtype == pl.Int64
+        assert result["bk_correct"].equals(hash_bk_values(string_bk))
+        assert result["bk_correct"][0] == 8042276479232558190
+
+    def test_add_hashed_bk_for_table_128(self):
+        df = pl.DataFrame({"str_col": ["a", "b", "c"], "int_col": [1, 2, 3]})
+        result = df.with_columns(add_hashed_bk_for_table("correct", df, "str_col", "int_col", bits=128))
+
+        assert result["bk_correct"].dtype == pl.Binary
+        assert result["bk_correct"].bin.size().to_list() == [16, 16, 16]
+        assert result["bk_correct"].n_unique() == 3
+
+    def test_hash_bk_values_repeated_and_null(self):
+        bk_values = pl.Series("bk", ["a||1", None, "b||2", "a||1"])
+        result = hash_bk_values(bk_values, 128)
+
+        assert result.name == "bk"
+        assert result[0] == result[3] == hash_bk_values(pl.Series("bk", ["a||1"]), 128)[0]
+        assert result[1] is None
+        assert result[2] != result[0]
+
+    def test_hash_bk_values_deterministic_across_processes(self):
+        bk_values = pl.Series("bk", ["a||1", "b||2", ""])
+        script = (
+            "import polars as pl; from keys.utility import hash_bk_values; "
+            "s = pl.Series('bk', ['a||1', 'b||2', '']); "
+            "print(hash_bk_values(s).to_list()); print([v.hex() for v in hash_bk_values(s, 128)])"
+        )
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+
+        assert hash_bk_values(bk_values).equals(hash_bk_values(bk_values))
+        assert output.splitlines() == [
+            str(hash_bk_values(bk_values).to_list()),
+            str([v.hex() for v in hash_bk_values(bk_values, 128)]),
+        ]
+
+    def test_add_hashed_bk_for_table_invalid_bits(self):
+        df = pl.DataFrame({"str_col": ["a"]})
+        with pytest.raises(ValueError, match="bits must be one of"):
+            add_hashed_bk_for_table("correct", df, "str_col", bits=32)
+
+    def test_row_hash_expr_null_differs_from_empty(self):
+        df = pl.DataFrame({"name": ["x", "x", "x"], "city": [None, "", None]})
+        hashes = df.select(row_hash_expr("name", "city"))["row_hash"]
+
+        assert hashes.dtype == pl.Int64
+        assert hashes[0] == hashes[2]
+        assert hashes[0] != hashes[1]
+
+    def test_row_hash_expr_is_stable(self):
+        df = pl.DataFrame({"name": ["a"], "city": [None]})
+        assert df.select(row_hash_expr("name", "city"))["row_hash"].to_list() == [-6074369765046012517]
@@ -0,0 +1,64 @@
+import pytest
+import polars as pl
+from sqlalchemy import create_engine, text
+
+from keys.writer import write_rows
+from keys.Errors import DatabaseError
+
+
+@pytest.fixture
+def sqlite_conn():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE dim_x (bk_dim_x TEXT, key_dim_x INTEGER, val_col TEXT)"))
+        conn.commit()
+        yield conn
+
+
+def _rows(conn) -> list[tuple]:
+    return conn.execute(text("SELECT bk_dim_x, key_dim_x, val_col FROM dim_x ORDER BY key_dim_x")).all()
+
+
+class TestWriteRows:
+
+    @pytest.mark.parametrize("method", ["auto", "executemany", "values"])
+    def test_write_rows_methods(self, sqlite_conn, method):
+        df = pl.DataFrame({"bk_dim_x": ["a", "b", "c"], "key_dim_x": [1, 2, 3], "val_col": ["x", None, "z"]})
+
+        stats = write_rows(sqlite_conn, "dim_x", df, chunk_size=2, method=method)
+
+        assert stats.rows == 3
+        assert stats.method == ("executemany" if method == "auto" else method)
+        assert stats.rows_per_second > 0
+        assert _rows(sqlite_conn) == [("a", 1, "x"), ("b", 2, None), ("c", 3, "z")]
+
+    def test_write_rows_empty(self, sqlite_conn):
+        df = pl.DataFrame(schema={"bk_dim_x": pl.String, "key_dim_x": pl.Int64})
+
+        stats = write_rows(sqlite_conn, "dim_x", df)
+
+        assert stats.rows == 0
+        assert _rows(sqlite_conn) == []
+
+    def test_write_rows_failure_rolls_back(self, sqlite_conn):
+        df = pl.DataFrame({"bk_dim_x": ["a", "b"], "missing_col": [1, 2]})
+
+        with pytest.raises(DatabaseError, match="Failed writing 2 rows to dim_x"):
+            write_rows(sqlite_conn, "dim_x", df, chunk_size=1)
+        assert _rows(sqlite_conn) == []
+
+    def test_write_rows_failure_in_open_transaction_rolls_back_savepoint(self, sqlite_conn):
+        sqlite_conn.execute(text("CREATE TABLE dim_y (bk_dim_y TEXT, key_dim_y INTEGER NOT NULL)"))
+        sqlite_conn.commit()
+        _rows(sqlite_conn)  # a read autobegins the caller's transaction
+        df = pl.DataFrame({"bk_dim_y": ["a", "b"], "key_dim_y": [1, None]})
+
+        with pytest.raises(DatabaseError, match="Failed writing 2 rows to dim_y"):
+            write_rows(sqlite_conn, "dim_y", df, chunk_size=1)
+        assert sqlite_conn.in_transaction()
+        sqlite_conn.commit()
+        assert sqlite_conn.execute(text("SELECT COUNT(*) FROM dim_y")).scalar() == 0
+
+    def test_write_rows_invalid_method(self, sqlite_conn):
+        with pytest.raises(ValueError, match="method must be one of"):
+            write_rows(sqlite_conn, "dim_x", pl.DataFrame({"bk_dim_x": ["a"]}), method="bcp")